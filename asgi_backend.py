@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Modo de serviço ASGI do backend.
+
+Os endpoints presos a I/O do Supabase (/market/lookup, /market/lookup/batch,
+/activate, /validate) rodam nativamente em asyncio com httpx, então um
+processo mantém milhares de chamadas upstream em voo sem ocupar uma thread
+por requisição. Os demais endpoints continuam no app Flask
+(license_backend.app), montado via WSGI. Contratos JSON, autenticação e
+headers são os mesmos do modo WSGI.
+
+    uvicorn asgi_backend:app --host 0.0.0.0 --port $PORT
+    GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker gunicorn -c gunicorn.conf.py asgi_backend:app
+"""
+
+import asyncio
+import typing as t
+
+from starlette.applications import Starlette
+from starlette.middleware.wsgi import WSGIMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Mount, Route
+
+import license_backend as lb
+import upstream_http
+
+logger = lb.logger
+
+
+# ---------- Helpers HTTP ----------
+
+def _json(payload: t.Dict, status: int = 200, revalidate: bool = False, etag: t.Optional[str] = None) -> Response:
+    headers = lb.security_headers(revalidate and status == 200)
+    if etag:
+        headers['ETag'] = f'"{etag}"'
+    return JSONResponse(payload, status_code=status, headers=headers)
+
+
+def _not_modified(request: Request, tag: t.Optional[str]) -> t.Optional[Response]:
+    if not tag:
+        return None
+    header = request.headers.get('if-none-match')
+    if not header:
+        return None
+    candidates = {c.strip() for c in header.split(',')}
+    if f'"{tag}"' in candidates or '*' in candidates:
+        return Response(status_code=304, headers={**lb.security_headers(True), 'ETag': f'"{tag}"'})
+    return None
+
+
+def _client(request: Request) -> t.Tuple[str, str]:
+    ip = (request.client.host if request.client else None) or "unknown"
+    return ip, request.headers.get('user-agent', 'Unknown')
+
+
+def _unauthorized(request: Request) -> t.Optional[Response]:
+    ip, ua = _client(request)
+    if not lb.check_api_key(request.headers.get('authorization'), ip, ua):
+        return _json({'ok': False, 'error': 'API key inválida'}, 401)
+    return None
+
+
+async def _body(request: Request) -> t.Optional[t.Any]:
+    try:
+        return await request.json()
+    except Exception:
+        return None
+
+
+# ---------- Supabase (assíncrono) ----------
+
+rest_flights = upstream_http.AsyncSingleFlight('rest_async')
+
+
+async def _rest_select(table: str, params: t.Dict[str, str], select: str, limit: t.Optional[int] = None) -> t.Optional[list]:
+    req = lb._rest_request(table, params, select, limit)
+    if not req:
+        return None
+    url, headers = req
+
+    async def fetch() -> t.Optional[list]:
+        try:
+            r = await upstream_http.async_upstream.get('rest', url, headers=headers, timeout=lb.SUPABASE_REST_TIMEOUT)
+            r.raise_for_status()
+            data = r.json()
+            return data if isinstance(data, list) else None
+        except upstream_http.CircuitOpenError:
+            return None
+        except Exception as e:
+            logger.error(f"Supabase REST get error: {e}")
+            return None
+
+    return await rest_flights.do(url, fetch) if lb.SUPABASE_SINGLEFLIGHT else await fetch()
+
+
+async def _call_function(function_name: str, data: t.Dict) -> t.Optional[t.Dict]:
+    req = lb._function_request(function_name)
+    if not req:
+        return None
+    try:
+        url, headers = req
+        logger.info(f"Chamando Supabase: {function_name} - Device: {data.get('device_id', '')[:8]}...")
+        response = await upstream_http.async_upstream.post(
+            'functions', url, json=data, headers=headers, timeout=lb.SUPABASE_FUNCTION_TIMEOUT
+        )
+        if response.status_code == 200:
+            logger.info(f"Supabase {function_name} OK")
+            return response.json()
+        logger.error(f"Erro Supabase {response.status_code}: {response.text}")
+        return None
+    except upstream_http.CircuitOpenError as e:
+        logger.warning(f"Supabase {function_name} indisponível: {e}")
+        return None
+    except Exception as e:
+        logger.error(f"Erro ao chamar Supabase: {e}")
+        return None
+
+
+async def _lookup_many(keys) -> t.Tuple[t.Dict, list]:
+    chunks = lb._lookup_chunks(keys)
+    pages = await asyncio.gather(*(_rest_select(lb.MARKET_LOOKUP_VIEW, params, lb.MARKET_COLUMNS, limit=lb.MARKET_LOOKUP_MAX_ROWS)
+                                   for _, params in chunks))
+    return lb._merge_lookup_pages(keys, chunks, pages)
+
+
+async def _revalidate(keys) -> None:
+    found, failed = {}, list(keys)
+    try:
+        found, failed = await _lookup_many(keys)
+        lb._store_lookups(keys, found, failed)
+    except Exception as e:
+        logger.error(f"market revalidate error: {e}")
+    finally:
+        failed = set(failed)
+        for key in keys:
+            lb.last_good.end_refresh(key, key not in failed)
+
+
+# Referências fortes: o event loop só guarda referências fracas das tasks
+_background: t.Set[asyncio.Task] = set()
+
+
+def _revalidate_in_background(keys) -> None:
+    keys = [k for k in keys if lb.last_good.begin_refresh(k)]
+    if keys:
+        task = asyncio.get_running_loop().create_task(_revalidate(keys))
+        _background.add(task)
+        task.add_done_callback(_background.discard)
+
+
+async def _poll_generation() -> None:
+    if lb.lookup_cache.begin_poll():
+        rows = await _rest_select('market_generation', {'id': 'eq.1'}, 'generation', limit=1)
+        gen = rows[0].get('generation') if rows else None
+        lb.lookup_cache.set_generation(int(gen) if gen is not None else None)
+
+
+# ---------- Endpoints ----------
+
+async def market_lookup(request: Request) -> Response:
+    denied = _unauthorized(request)
+    if denied:
+        return denied
+    try:
+        payload = await request.json() or {}
+        cache_key = lb._parse_lookup(payload)
+        if not lb._valid_key(cache_key):
+            return _json({'ok': False, 'error': lb.MARKET_KEY_REQUIRED}, 400)
+
+        snap = lb._current_snapshot()
+        if snap is not None:
+            tag = lb._market_etag(lb._snapshot_version(snap), cache_key)
+            return _not_modified(request, tag) or _json(
+                {'ok': True, **(lb._snapshot_lookup(snap, cache_key) or lb._market_fields({}))}, revalidate=True, etag=tag)
+
+        await _poll_generation()
+        tag = lb._market_etag(lb.lookup_cache.generation, cache_key)
+        not_modified = _not_modified(request, tag)
+        if not_modified:
+            return not_modified
+        cached = lb.lookup_cache.get(cache_key)
+        if cached is not None:
+            return _json({'ok': True, **cached}, revalidate=True, etag=tag)
+
+        if lb.MARKET_STALE_WHILE_REVALIDATE:
+            stale = lb.last_good.get(cache_key)
+            if stale is not None:
+                _revalidate_in_background([cache_key])
+                return _json({'ok': True, **lb._stale_fields(*stale)}, revalidate=True)
+
+        rows = await _rest_select(lb.MARKET_LOOKUP_VIEW, lb._lookup_filters(cache_key), lb.MARKET_COLUMNS, limit=1)
+        if rows is None:
+            stale = lb.last_good.get(cache_key)
+            if stale is not None:
+                return _json({'ok': True, **lb._stale_fields(*stale)}, revalidate=True)
+            return _json({'ok': False, 'error': 'upstream_unavailable'}, 503)
+
+        md = rows[0] if rows else {}
+        fields = lb._market_fields(md)
+        if md.get('item_key'):
+            lb._store_lookups([cache_key], {cache_key: fields})
+            return _json({'ok': True, **fields}, revalidate=True, etag=tag)
+        lb._store_lookups([cache_key], {})
+        return _json({'ok': True, **fields}, revalidate=True)
+
+    except Exception as e:
+        logger.error(f"market_lookup error: {e}")
+        return _json({'ok': False, 'error': 'internal_error'}, 500)
+
+
+async def market_lookup_batch(request: Request) -> Response:
+    denied = _unauthorized(request)
+    if denied:
+        return denied
+    try:
+        keys, error = lb._parse_batch(await request.json() or {})
+        if error:
+            return _json({'ok': False, 'error': error}, 400)
+
+        snap = lb._current_snapshot()
+        if snap is not None:
+            tag = lb._market_etag(lb._snapshot_version(snap), keys)
+        else:
+            await _poll_generation()
+            tag = lb._market_etag(lb.lookup_cache.generation, keys)
+        not_modified = _not_modified(request, tag)
+        if not_modified:
+            return not_modified
+
+        resolved: t.Dict = {}
+        missing = []
+        for key in dict.fromkeys(k for k in keys if lb._valid_key(k)):
+            fields = lb._snapshot_lookup(snap, key) if snap is not None else lb.lookup_cache.get(key)
+            if fields is not None:
+                resolved[key] = fields
+            elif snap is None:
+                missing.append(key)
+        unavailable = set()
+        if missing and lb.MARKET_STALE_WHILE_REVALIDATE:
+            served = lb._serve_stale(missing, resolved)
+            if served:
+                _revalidate_in_background(served)
+                missing = [k for k in missing if k not in resolved]
+        if missing:
+            fetched, failed = await _lookup_many(missing)
+            lb._store_lookups(missing, fetched, failed)
+            resolved.update(fetched)
+            lb._serve_stale(failed, resolved)
+            unavailable = {k for k in failed if k not in resolved}
+
+        body, complete = lb._batch_payload(keys, resolved, unavailable)
+        return _json(body, revalidate=True, etag=tag if snap is not None or complete else None)
+
+    except Exception as e:
+        logger.error(f"market_lookup_batch error: {e}")
+        return _json({'ok': False, 'error': 'internal_error'}, 500)
+
+
+async def _license_endpoint(request: Request, function_name: str, build_response, label: str) -> Response:
+    denied = _unauthorized(request)
+    if denied:
+        return denied
+    try:
+        client_ip, ua = _client(request)
+        blocked = lb._blocked_ip_response(client_ip, ua)
+        if blocked:
+            return _json(*blocked)
+
+        data = await _body(request)
+        invalid = lb._invalid_license_input(data, client_ip, ua)
+        if invalid:
+            return _json(*invalid)
+
+        license_key = data['license_key']
+        device_id = data['device_id']
+        logger.info(f"Tentativa de {label}: {license_key[:8]}... em {device_id[:8]}...")
+        result = await _call_function(function_name, {'license_key': license_key, 'device_id': device_id})
+        return _json(build_response(license_key, device_id, result, client_ip, ua))
+
+    except Exception as e:
+        logger.error(f"Erro interno na {label}: {e}")
+        return _json({'ok': False, 'error': 'Erro interno do servidor'}, 500)
+
+
+async def activate_license(request: Request) -> Response:
+    return await _license_endpoint(request, 'activate', lb._activation_response, 'ativação')
+
+
+async def validate_license(request: Request) -> Response:
+    return await _license_endpoint(request, 'validate', lb._validation_response, 'validação')
+
+
+async def _shutdown() -> None:
+    await upstream_http.async_upstream.aclose()
+
+
+app = Starlette(
+    routes=[
+        Route('/market/lookup', market_lookup, methods=['POST']),
+        Route('/market/lookup/batch', market_lookup_batch, methods=['POST']),
+        Route('/activate', activate_license, methods=['POST']),
+        Route('/validate', validate_license, methods=['POST']),
+        # Demais endpoints (health, info, verify-jwt, métricas...) no app Flask
+        Mount('/', app=WSGIMiddleware(lb.app)),
+    ],
+    on_startup=[lb.warm_up],
+    on_shutdown=[_shutdown],
+)
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark offline de parse + agregação por fonte em dumps sintéticos.
+
+Gera dumps no formato de cada fonte (variantes StatTrak™/Souvenir/condição/
+fase e duplicatas) em 30k, 300k e 3M itens, e mede em um subprocesso isolado
+por caso: parse puro, parse + aggregate_*, itens/s e pico de RSS. Os
+resultados vão em JSON (por padrão benchmarks/results/<commit>.json) para
+comparar commits com --compare.
+
+    python benchmarks/bench_aggregate.py [--sizes 30000,300000] [--compare benchmarks/results/abc123.json]
+"""
+
+import os
+import sys
+import json
+import time
+import resource
+import platform
+import argparse
+import subprocess
+import tempfile
+import typing as t
+from datetime import datetime, timezone
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, HERE)
+
+# caso -> fonte do dump sintético
+CASES = {
+    "whitemarket": "whitemarket",
+    "whitemarket_ingest_loop": "whitemarket",
+    "csfloat": "csfloat",
+    "buff163": "buff163",
+}
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss: KB no Linux, bytes no macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if platform.system() == "Darwin" else peak / 1024
+
+
+def _parse_and_aggregate(case: str, path: str) -> t.Tuple[t.Callable[[], int], t.Callable[[], int]]:
+    """(parse_only, parse_and_aggregate) para o caso; cada um retorna a contagem."""
+    if case.startswith("whitemarket"):
+        import whitemarket_fetcher as wm
+
+        def parse():
+            with open(path, "rb") as f:
+                return sum(1 for _ in wm.iter_json_items(f))
+
+        if case == "whitemarket_ingest_loop":
+            batch = int(os.environ.get("SUPABASE_UPSERT_BATCH", "200"))
+
+            def agg():
+                with open(path, "rb") as f:
+                    return sum(len(rows) for rows in wm.aggregate_whitemarket_batches(wm.iter_json_items(f), batch))
+        else:
+            def agg():
+                with open(path, "rb") as f:
+                    return len(wm.aggregate_whitemarket(wm.iter_json_items(f)))
+        return parse, agg
+
+    if case == "csfloat":
+        import csfloat_fetcher as cf
+
+        def parse():
+            with open(path, "rb") as f:
+                return sum(1 for _ in cf.iter_csfloat_items(f))
+
+        def agg():
+            with open(path, "rb") as f:
+                return len(cf.aggregate_csfloat(cf.iter_csfloat_items(f)))
+        return parse, agg
+
+    if case == "buff163":
+        import buff163_fetcher as bf
+
+        def parse():
+            with open(path, "rb") as f:
+                return sum(1 for _ in bf.iter_buff163_pairs(f))
+
+        def agg():
+            with open(path, "rb") as f:
+                return len(bf.aggregate_buff163(bf.iter_buff163_pairs(f)))
+        return parse, agg
+
+    raise ValueError(f"caso desconhecido: {case}")
+
+
+def run_worker(case: str, path: str, items: int) -> dict:
+    import io
+    import contextlib
+
+    base_rss = _peak_rss_mb()
+    parse, agg = _parse_and_aggregate(case, path)
+    # Os fetchers logam em stdout; o worker só devolve o JSON
+    with contextlib.redirect_stdout(io.StringIO()):
+        t0 = time.perf_counter()
+        parsed = parse()
+        parse_s = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        rows = agg()
+        total_s = time.perf_counter() - t0
+    try:
+        import json_backend
+        backend = getattr(json_backend, "_backend_name", None)
+    except ImportError:
+        backend = None
+    return {
+        "case": case,
+        "items": items,
+        "parsed": parsed,
+        "rows": rows,
+        "parse_seconds": parse_s,
+        "parse_aggregate_seconds": total_s,
+        "items_per_sec": items / total_s if total_s else None,
+        "peak_rss_mb": _peak_rss_mb(),
+        "import_rss_mb": base_rss,
+        "json_backend": backend,
+    }
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+def _dump_path(data_dir: str, source: str, items: int) -> str:
+    from synthetic import WRITERS
+    path = os.path.join(data_dir, f"{source}-{items}.json")
+    if not os.path.exists(path):
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            WRITERS[source](f, items)
+        os.replace(tmp, path)
+    return path
+
+
+def compare(current: dict, previous_path: str) -> None:
+    with open(previous_path, "r", encoding="utf-8") as f:
+        previous = json.load(f)
+    prev = {(r["case"], r["items"]): r for r in previous.get("results", [])}
+    print(f"\nComparação com {previous.get('commit')} ({previous_path}):")
+    for r in current["results"]:
+        p = prev.get((r["case"], r["items"]))
+        if not p or not p.get("items_per_sec") or not r.get("items_per_sec"):
+            continue
+        speed = (r["items_per_sec"] / p["items_per_sec"] - 1.0) * 100
+        rss = r["peak_rss_mb"] - p["peak_rss_mb"]
+        print(f"  {r['case']:24s} {r['items']:>9,}  itens/s {speed:+6.1f}%  pico RSS {rss:+7.1f}MB")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", default="30000,300000,3000000")
+    ap.add_argument("--cases", default=",".join(CASES))
+    ap.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "csgo-bench-dumps"),
+                    help="onde os dumps sintéticos são gerados (reaproveitados entre execuções)")
+    ap.add_argument("--out", help="JSON de saída (padrão: benchmarks/results/<commit>.json)")
+    ap.add_argument("--compare", help="JSON de uma execução anterior para comparar")
+    ap.add_argument("--worker", nargs=3, metavar=("CASE", "PATH", "ITEMS"), help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.worker:
+        case, path, items = args.worker
+        print(json.dumps(run_worker(case, path, int(items))))
+        return
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    commit = _git_commit()
+    out = {
+        "commit": commit,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": [],
+    }
+    for items in (int(x) for x in args.sizes.split(",")):
+        for case in args.cases.split(","):
+            path = _dump_path(args.data_dir, CASES[case], items)
+            proc = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--worker", case, path, str(items)],
+                capture_output=True, text=True,
+            )
+            if proc.returncode != 0:
+                print(f"{case:24s} {items:>9,}  FALHOU: {proc.stderr.strip()[-300:]}")
+                continue
+            r = json.loads(proc.stdout.strip().splitlines()[-1])
+            r["dump_mb"] = os.path.getsize(path) / 1e6
+            out["results"].append(r)
+            print(f"{case:24s} {items:>9,}  parse {r['parse_seconds']:7.2f}s  parse+agg {r['parse_aggregate_seconds']:7.2f}s"
+                  f"  {r['items_per_sec']:>11,.0f} itens/s  pico RSS {r['peak_rss_mb']:7.1f}MB  rows={r['rows']:,}")
+
+    path = args.out or os.path.join(HERE, "results", f"{commit}.json")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(out, f, indent=2)
+    print(f"\nResultados: {path}")
+    if args.compare:
+        compare(out, args.compare)
+
+
+if __name__ == "__main__":
+    main()
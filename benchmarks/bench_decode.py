@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark dos backends de decodificação JSON por fonte e tamanho de dump.
+
+Compara cada backend ijson disponível (streaming) com os parsers de documento
+inteiro (json, orjson) em dumps sintéticos no formato de cada fonte e mostra
+o que json_backend escolheria com o JSON_FAST_PARSE_MAX_BYTES atual.
+
+    python benchmarks/bench_decode.py [--sizes 1000,10000,100000] [--json out.json]
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import typing as t
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic import DUMPS  # noqa: E402
+
+try:
+    import ijson
+except ImportError:  # só os parsers de documento inteiro
+    ijson = None
+
+# prefixo ijson e modo (items/kvitems) de cada fonte, como nos fetchers
+SOURCE_SHAPES = {
+    "whitemarket": ("item", "items"),
+    "csfloat": ("item", "items"),
+    "buff163": ("", "kvitems"),
+}
+
+
+def _stream_backends() -> t.Dict[str, t.Any]:
+    out = {}
+    if ijson is None:
+        return out
+    for name in ("yajl2_c", "yajl2_cffi", "yajl2", "python"):
+        try:
+            out[f"ijson/{name}"] = ijson.get_backend(name)
+        except Exception:
+            pass
+    return out
+
+
+def _document_parsers() -> t.Dict[str, t.Callable[[bytes], t.Any]]:
+    out = {"json": json.loads}
+    try:
+        import orjson
+        out["orjson"] = orjson.loads
+    except ImportError:
+        pass
+    return out
+
+
+def _consume_stream(backend, data: bytes, prefix: str, mode: str) -> int:
+    f = io.BytesIO(data)
+    it = backend.kvitems(f, prefix) if mode == "kvitems" else backend.items(f, prefix, use_float=True)
+    return sum(1 for _ in it)
+
+
+def _consume_document(loads, data: bytes, mode: str) -> int:
+    doc = loads(data)
+    return len(doc.items()) if mode == "kvitems" else len(doc)
+
+
+def _best_of(fn, runs: int) -> float:
+    best = float("inf")
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", default="1000,10000,100000", help="itens por dump, separados por vírgula")
+    ap.add_argument("--sources", default=",".join(DUMPS))
+    ap.add_argument("--runs", type=int, default=3)
+    ap.add_argument("--json", help="grava resultados em JSON neste caminho")
+    args = ap.parse_args()
+
+    try:
+        import json_backend
+        threshold = json_backend.FAST_PARSE_MAX_BYTES
+    except ImportError:
+        json_backend = None
+        threshold = int(os.environ.get("JSON_FAST_PARSE_MAX_BYTES", str(2 * 1024 * 1024)))
+
+    streams = _stream_backends()
+    docs = _document_parsers()
+    results = []
+    for source in args.sources.split(","):
+        prefix, mode = SOURCE_SHAPES[source]
+        for n in (int(x) for x in args.sizes.split(",")):
+            data = DUMPS[source](n)
+            timings = {}
+            for name, backend in streams.items():
+                timings[name] = _best_of(lambda: _consume_stream(backend, data, prefix, mode), args.runs)
+            for name, loads in docs.items():
+                timings[f"document/{name}"] = _best_of(lambda: _consume_document(loads, data, mode), args.runs)
+            fastest = min(timings, key=timings.get)
+            chosen = "document" if 0 < len(data) <= threshold else "stream"
+            row = {
+                "source": source, "items": n, "bytes": len(data),
+                "seconds": timings, "fastest": fastest, "json_backend_choice": chosen,
+            }
+            results.append(row)
+            print(f"{source:12s} {n:>9,} itens {len(data) / 1e6:8.2f}MB  fastest={fastest:20s} escolha={chosen}")
+            for name, sec in sorted(timings.items(), key=lambda kv: kv[1]):
+                print(f"    {name:20s} {sec * 1000:9.1f}ms  {n / sec:>12,.0f} itens/s")
+
+    if not streams:
+        print("(ijson não instalado: apenas parsers de documento inteiro medidos)")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"fast_parse_max_bytes": threshold, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Microbenchmark do parser de market_hash_name: implementação antiga (copiada
+dos fetchers) vs market_names.parse_name (regex pré-compilada + LRU).
+
+    python benchmarks/bench_names.py [--names 30000] [--runs 3]
+"""
+
+import os
+import sys
+import time
+import json
+import argparse
+import typing as t
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import market_names  # noqa: E402
+from synthetic import market_hash_names  # noqa: E402
+
+# --- implementação anterior (copy-paste dos três fetchers) ---
+_CONDS = list(market_names.CONDITION_NAMES)
+_PHASES = list(market_names.PHASE_TOKENS)
+
+
+def legacy_parse(name: str):
+    s = name
+    stattrak = "StatTrak" in s or "StatTrak™" in s
+    souvenir = "Souvenir" in s
+    condition = None
+    for cond in _CONDS:
+        if s.endswith(f"({cond})"):
+            condition = cond
+            s = s[: -(len(cond) + 2)].strip()
+            break
+    base = s.replace("StatTrak™ ", "").replace("StatTrak ", "").replace("Souvenir ", "").strip()
+    phase = None
+    for token in _PHASES:
+        if token in name:
+            phase = token
+            break
+    parts = [base, ("StatTrak" if stattrak else ""), ("Souvenir" if souvenir else ""), condition or "", phase or ""]
+    return base, stattrak, souvenir, condition, phase, "|".join([p for p in parts if p]).strip()
+
+
+def _rate(fn, names: t.List[str], runs: int) -> float:
+    best = float("inf")
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        for n in names:
+            fn(n, True)
+        best = min(best, time.perf_counter() - t0)
+    return len(names) / best
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--names", type=int, default=30000, help="nomes distintos no catálogo")
+    ap.add_argument("--repeat", type=int, default=3, help="vezes que cada nome aparece (três fontes)")
+    ap.add_argument("--runs", type=int, default=3)
+    ap.add_argument("--json", help="grava resultados em JSON neste caminho")
+    args = ap.parse_args()
+
+    unique = market_hash_names(args.names)
+    workload = unique * args.repeat
+
+    mismatches = [n for n in unique if tuple(market_names.parse_name(n, True)) != legacy_parse(n)]
+
+    results = {"names": args.names, "repeat": args.repeat, "mismatches": len(mismatches)}
+    results["legacy_names_per_sec"] = _rate(lambda n, _p: legacy_parse(n), workload, args.runs)
+
+    def cold(n, p):
+        return market_names.parse_name.__wrapped__(n, p)
+    results["parser_uncached_names_per_sec"] = _rate(cold, workload, args.runs)
+
+    market_names.parse_name.cache_clear()
+    t0 = time.perf_counter()
+    for n in workload:
+        market_names.parse_name(n, True)
+    results["parser_first_run_names_per_sec"] = len(workload) / (time.perf_counter() - t0)
+    results["parser_warm_names_per_sec"] = _rate(market_names.parse_name, workload, args.runs)
+    results["cache"] = market_names.cache_info()._asdict()
+
+    for k, v in results.items():
+        print(f"{k:34s} {v:,.0f}" if isinstance(v, float) else f"{k:34s} {v}")
+    if mismatches:
+        print("exemplos divergentes:", mismatches[:5])
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Microbenchmark do índice de /market/search (market_search.SearchIndex):
+construção, atualização incremental e latência p50/p99 por consulta sobre o
+catálogo sintético, comparada à meta de --target-ms (1ms) por consulta.
+
+    python benchmarks/bench_search.py [--items 30000] [--queries 2000]
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import typing as t
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import market_search  # noqa: E402
+from market_cache import variant_key  # noqa: E402
+from market_names import parse_name  # noqa: E402
+from synthetic import catalog_name  # noqa: E402
+
+
+def _variants(items: int, offset: int = 0) -> t.List[tuple]:
+    out = []
+    for i in range(offset, offset + items):
+        p = parse_name(catalog_name(i))
+        out.append(variant_key(p.name_base, p.stattrak, p.souvenir, p.condition))
+    return out
+
+
+def _queries(names: t.List[str], n: int) -> t.List[str]:
+    """Mistura de consultas: nome exato, prefixo, palavras soltas e com erro de digitação."""
+    rnd = random.Random(3)
+    out = []
+    for _ in range(n):
+        name = market_search.normalize(rnd.choice(names))
+        kind = rnd.random()
+        if kind < 0.25:
+            out.append(name)
+        elif kind < 0.5:
+            out.append(name[:rnd.randint(2, max(2, len(name) // 2))])
+        elif kind < 0.75:
+            words = name.replace("|", " ").split()
+            out.append(" ".join(w[:max(3, len(w) - 1)] for w in rnd.sample(words, min(2, len(words)))))
+        else:
+            i = rnd.randrange(len(name))
+            out.append(name[:i] + name[i + 1:])
+    return out
+
+
+def _pct(samples: t.List[float], p: float) -> float:
+    s = sorted(samples)
+    return s[min(len(s) - 1, int(p / 100.0 * (len(s) - 1)))]
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--items", type=int, default=30000)
+    ap.add_argument("--queries", type=int, default=2000)
+    ap.add_argument("--limit", type=int, default=20)
+    ap.add_argument("--target-ms", type=float, default=1.0, help="Meta de latência por consulta (p50 e p99)")
+    args = ap.parse_args()
+
+    variants = _variants(args.items)
+    index = market_search.SearchIndex()
+    t0 = time.perf_counter()
+    index.update(variants, 1)
+    print(f"construção: {len(index)} nomes ({len(variants)} variantes) em {time.perf_counter() - t0:.2f}s")
+
+    # Geração nova: ~5% dos itens saem, ~5% entram
+    churn = args.items // 20
+    t0 = time.perf_counter()
+    changes = index.update(variants[churn:] + _variants(churn, args.items), 2)
+    print(f"atualização incremental: {changes} em {time.perf_counter() - t0:.2f}s")
+
+    names = [k[0] for k in variants[churn:]]
+    queries = _queries(names, args.queries)
+    for q in queries[:50]:
+        index.search(q, args.limit)
+    samples = []
+    for q in queries:
+        t0 = time.perf_counter()
+        index.search(q, args.limit)
+        samples.append((time.perf_counter() - t0) * 1000)
+    p50, p99 = _pct(samples, 50), _pct(samples, 99)
+    print(f"consultas: {len(samples)}  p50 {p50:.3f}ms  p99 {p99:.3f}ms  max {max(samples):.3f}ms")
+    for label, value in (("p50", p50), ("p99", p99)):
+        print(f"meta {label} < {args.target_ms:g}ms: {'atingida' if value < args.target_ms else 'NÃO atingida'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark de ingestão e de lookup contra o stand-in local do Supabase
+(benchmarks/local_supabase.py), sem rede.
+
+- ingest: MarketWriter (upsert em market_data) por concorrência, linhas/s
+- lookup: license_backend._supabase_rest_get, market_data + liquidity vs view market_lookup, p50/p99
+- functions: call_supabase_function("validate") p50/p99
+- rpc: refresh_liquidity_mv via cliente supabase (se instalado)
+
+    python benchmarks/bench_upstream.py --rows 30000 --lookups 2000 --latency-ms 30 --jitter-ms 10 --error-rate 0.01
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import contextlib
+import io
+import typing as t
+from concurrent.futures import ThreadPoolExecutor
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, HERE)
+
+import local_supabase
+
+
+def _pct(samples: t.List[float], p: float) -> float:
+    if not samples:
+        return 0.0
+    s = sorted(samples)
+    return s[min(len(s) - 1, int(round(p / 100.0 * (len(s) - 1))))]
+
+
+def _report(label: str, samples: t.List[float], wall: float) -> None:
+    ms = [x * 1000 for x in samples]
+    print(f"{label:28s} n={len(ms):>6,}  p50 {_pct(ms, 50):7.1f}ms  p99 {_pct(ms, 99):7.1f}ms"
+          f"  max {max(ms) if ms else 0:7.1f}ms  {len(ms) / wall if wall else 0:8,.0f} req/s")
+
+
+def _synthetic_rows(n: int) -> t.List[dict]:
+    from synthetic import catalog_name
+    from market_names import parse_name
+
+    rnd = random.Random(11)
+    rows = []
+    for i in range(n):
+        p = parse_name(catalog_name(i))
+        rows.append({
+            "item_key": p.item_key, "name_base": p.name_base, "stattrak": p.stattrak,
+            "souvenir": p.souvenir, "condition": p.condition,
+            "price_whitemarket": round(rnd.uniform(0.03, 2500.0), 2), "qty_whitemarket": rnd.randint(0, 300),
+        })
+    return rows
+
+
+def bench_ingest(rows: t.List[dict], concurrencies: t.List[int], batch_size: int) -> None:
+    import market_writer
+
+    for c in concurrencies:
+        t0 = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            with market_writer.MarketWriter("market_data", batch_size=batch_size, concurrency=c) as writer:
+                writer.write_rows(rows)
+            failed = writer.close()
+        wall = time.perf_counter() - t0
+        print(f"ingest concurrency={c:<3d} batch={batch_size:<5d} {len(rows) / wall:>11,.0f} linhas/s"
+              f"  ({wall:.2f}s, lotes com falha={len(failed)})")
+
+
+def bench_lookup(server, lookups: int, threads: int) -> None:
+    import license_backend as lb
+
+    targets = list(server.store.tables.get("market_data", {}).values())
+    rnd = random.Random(3)
+    picks = [rnd.choice(targets) for _ in range(lookups)]
+
+    def filters(md: dict) -> dict:
+        return {
+            "name_base": f"eq.{md['name_base']}",
+            "stattrak": f"eq.{str(md['stattrak']).lower()}",
+            "souvenir": f"eq.{str(md['souvenir']).lower()}",
+            "condition": f"eq.{md['condition']}" if md["condition"] else "is.null",
+        }
+
+    def two_calls(md: dict) -> float:
+        # Caminho anterior a 006: market_data e depois a view liquidity
+        t0 = time.perf_counter()
+        row = lb._supabase_rest_get(
+            lb.MARKET_TABLE, filters(md),
+            "item_key,price_whitemarket,price_csfloat,price_buff163,highest_offer_buff163",
+        ) or {}
+        if row.get("item_key"):
+            lb._supabase_rest_get("liquidity", {"item_key": f"eq.{row['item_key']}"}, "liquidity_score")
+        return time.perf_counter() - t0
+
+    def one_call(md: dict) -> float:
+        t0 = time.perf_counter()
+        lb._supabase_rest_get(lb.MARKET_LOOKUP_VIEW, filters(md), lb.MARKET_COLUMNS)
+        return time.perf_counter() - t0
+
+    for label, fn in (("lookup 2 calls", two_calls), ("lookup view", one_call)):
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            samples = list(pool.map(fn, picks))
+        _report(f"{label} threads={threads}", samples, time.perf_counter() - t0)
+
+    def validate(i: int) -> float:
+        t0 = time.perf_counter()
+        lb.call_supabase_function("validate", {"license_key": f"LOCAL-{i}", "device_id": f"dev{i:08d}"})
+        return time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        samples = list(pool.map(validate, range(min(lookups, 500))))
+    _report(f"validate threads={threads}", samples, time.perf_counter() - t0)
+
+
+def bench_rpc(calls: int) -> None:
+    try:
+        import market_writer
+        sb = market_writer.get_shared_client()
+    except Exception as e:
+        print(f"rpc: cliente supabase indisponível ({e}), pulando")
+        return
+    samples = []
+    t0 = time.perf_counter()
+    for _ in range(calls):
+        s = time.perf_counter()
+        try:
+            sb.rpc("refresh_liquidity_mv").execute()
+        except Exception:
+            pass
+        samples.append(time.perf_counter() - s)
+    _report("rpc refresh_liquidity_mv", samples, time.perf_counter() - t0)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--rows", type=int, default=30000)
+    ap.add_argument("--batch", type=int, default=500)
+    ap.add_argument("--concurrency", default="1,4,8")
+    ap.add_argument("--lookups", type=int, default=2000)
+    ap.add_argument("--threads", type=int, default=16)
+    ap.add_argument("--latency-ms", type=float, default=20.0)
+    ap.add_argument("--jitter-ms", type=float, default=5.0)
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    ap.add_argument("--slow-rate", type=float, default=0.0)
+    ap.add_argument("--slow-ms", type=float, default=0.0)
+    ap.add_argument("--skip", default="", help="etapas a pular: ingest,lookup,rpc")
+    args = ap.parse_args()
+
+    faults = local_supabase.Faults(args.latency_ms, args.jitter_ms, args.error_rate, args.slow_rate, args.slow_ms)
+    server = local_supabase.start(faults=faults)
+    # Antes de importar market_writer/license_backend (lêem o ambiente)
+    os.environ["SUPABASE_URL"] = server.url
+    for k in ("SUPABASE_SERVICE_ROLE", "SUPABASE_SERVICE_KEY", "SUPABASE_ANON_KEY"):
+        os.environ[k] = "local"
+    print(f"stand-in em {server.url}  faults={faults.as_dict()}")
+
+    skip = set(filter(None, args.skip.split(",")))
+    if "ingest" not in skip:
+        rows = _synthetic_rows(args.rows)
+        bench_ingest(rows, [int(c) for c in args.concurrency.split(",")], args.batch)
+    if len(server.store.tables.get("market_data", {})) < args.rows:
+        server.seed(args.rows)
+    if "lookup" not in skip:
+        bench_lookup(server, args.lookups, args.threads)
+    if "rpc" not in skip:
+        bench_rpc(50)
+    print(f"contadores do servidor: {server.store.stats}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
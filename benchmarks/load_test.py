@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Teste de carga do backend web contra o stand-in local do Supabase.
+
+Sobe benchmarks/local_supabase.py (com itens sintéticos), inicia o backend com
+cada entry point em subprocesso e dispara POST /market/lookup (e opcionalmente
+/market/lookup/batch) de N conexões keep-alive por D segundos.
+
+    python benchmarks/load_test.py --targets flask,gunicorn,asgi --connections 64 --seconds 20
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import subprocess
+import threading
+import http.client
+import typing as t
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, HERE)
+
+import local_supabase
+
+API_KEY = "load-test-key"
+
+TARGETS = {
+    # Entry point anterior: servidor de desenvolvimento do Flask
+    "flask": [sys.executable, "main.py"],
+    "gunicorn": [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "license_backend:app"],
+    "asgi": [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "-k", "uvicorn.workers.UvicornWorker",
+             "asgi_backend:app"],
+}
+
+
+def _pct(samples: t.List[float], p: float) -> float:
+    if not samples:
+        return 0.0
+    s = sorted(samples)
+    return s[min(len(s) - 1, int(round(p / 100.0 * (len(s) - 1))))]
+
+
+def _wait_healthy(port: int, timeout: float) -> bool:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+            conn.request("GET", "/health")
+            if conn.getresponse().status == 200:
+                return True
+        except OSError:
+            pass
+        time.sleep(0.2)
+    return False
+
+
+def _client(port: int, bodies: t.List[bytes], path: str, stop: threading.Event,
+            latencies: t.List[float], errors: t.List[int]) -> None:
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    headers = {"Authorization": f"Bearer {API_KEY}", "Content-Type": "application/json"}
+    rnd = random.Random()
+    while not stop.is_set():
+        body = rnd.choice(bodies)
+        t0 = time.perf_counter()
+        try:
+            conn.request("POST", path, body=body, headers=headers)
+            resp = conn.getresponse()
+            resp.read()
+            if resp.status != 200:
+                errors.append(resp.status)
+            latencies.append(time.perf_counter() - t0)
+        except (OSError, http.client.HTTPException):
+            errors.append(0)
+            conn.close()
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+
+
+def run_target(name: str, env: dict, port: int, bodies: t.List[bytes], path: str,
+               connections: int, seconds: float) -> t.Optional[dict]:
+    proc = subprocess.Popen(TARGETS[name], cwd=ROOT, env={**env, "PORT": str(port)},
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        if not _wait_healthy(port, 60):
+            print(f"{name}: não respondeu /health")
+            return None
+        # Aquecimento curto (snapshot, pools)
+        warm_stop = threading.Event()
+        warm = threading.Thread(target=_client, args=(port, bodies, path, warm_stop, [], []))
+        warm.start()
+        time.sleep(2)
+        warm_stop.set()
+        warm.join()
+
+        stop = threading.Event()
+        latencies: t.List[float] = []
+        errors: t.List[int] = []
+        threads = [threading.Thread(target=_client, args=(port, bodies, path, stop, latencies, errors))
+                   for _ in range(connections)]
+        t0 = time.perf_counter()
+        for th in threads:
+            th.start()
+        time.sleep(seconds)
+        stop.set()
+        for th in threads:
+            th.join()
+        wall = time.perf_counter() - t0
+        ms = [x * 1000 for x in latencies]
+        return {
+            "target": name,
+            "requests": len(latencies),
+            "errors": len(errors),
+            "req_per_sec": len(latencies) / wall,
+            "p50_ms": _pct(ms, 50),
+            "p99_ms": _pct(ms, 99),
+        }
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--targets", default="flask,gunicorn")
+    ap.add_argument("--connections", type=int, default=64)
+    ap.add_argument("--seconds", type=float, default=20)
+    ap.add_argument("--items", type=int, default=30000)
+    ap.add_argument("--hot", type=int, default=3000, help="variantes distintas consultadas")
+    ap.add_argument("--batch", type=int, default=0, help="usa /market/lookup/batch com N itens por requisição")
+    ap.add_argument("--port", type=int, default=18080)
+    ap.add_argument("--latency-ms", type=float, default=30.0)
+    ap.add_argument("--jitter-ms", type=float, default=10.0)
+    ap.add_argument("--snapshot", choices=("true", "false"), default="true",
+                    help="MARKET_SNAPSHOT do backend (false mede o caminho cache + REST)")
+    args = ap.parse_args()
+
+    server = local_supabase.start(faults=local_supabase.Faults(args.latency_ms, args.jitter_ms), seed_items=args.items)
+    rows = list(server.store.tables["market_data"].values())
+    rnd = random.Random(5)
+    hot = [rnd.choice(rows) for _ in range(args.hot)]
+    variants = [{"name_base": r["name_base"], "is_stattrak": r["stattrak"], "is_souvenir": r["souvenir"],
+                 "condition": r["condition"]} for r in hot]
+    if args.batch:
+        path = "/market/lookup/batch"
+        bodies = [json.dumps({"items": rnd.sample(variants, min(args.batch, len(variants)))}).encode()
+                  for _ in range(200)]
+    else:
+        path = "/market/lookup"
+        bodies = [json.dumps(v).encode() for v in variants]
+
+    env = {
+        **os.environ,
+        "SUPABASE_URL": server.url,
+        "SUPABASE_ANON_KEY": "local",
+        "SUPABASE_SERVICE_ROLE": "local",
+        "BACKEND_API_KEY": API_KEY,
+        "MARKET_SNAPSHOT": args.snapshot,
+    }
+    print(f"stand-in em {server.url} ({args.items} itens, latência {args.latency_ms}±{args.jitter_ms}ms); "
+          f"{args.connections} conexões x {args.seconds:.0f}s em {path}")
+    for i, name in enumerate(args.targets.split(",")):
+        r = run_target(name, env, args.port + i, bodies, path, args.connections, args.seconds)
+        if r:
+            print(f"{r['target']:10s} {r['req_per_sec']:9,.0f} req/s  p50 {r['p50_ms']:7.1f}ms  p99 {r['p99_ms']:7.1f}ms"
+                  f"  requisições={r['requests']:,} erros={r['errors']:,}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,460 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Stand-in local do Supabase (subconjunto de PostgREST + edge functions) para
+benchmarks de ingestão e de lookup sem rede.
+
+Suporta:
+- POST   /rest/v1/<tabela>?on_conflict=<col>   upsert (Prefer: resolution=merge-duplicates)
+- GET    /rest/v1/<tabela>?col=eq.x&col=is.null&col=in.(a,b)&col=gte.n&and=(..)&or=(..)&select=..&limit=..&offset=..
+- DELETE /rest/v1/<tabela>?col=neq.x
+- POST   /rest/v1/rpc/<função>                  (refresh_liquidity_mv, bump_market_generation)
+- POST   /functions/v1/activate | validate
+- POST   /__control                             muda latência/erros em runtime (JSON)
+
+Views: `liquidity` (score calculado como em 002_liquidity_mv.sql),
+`market_lookup` (006_market_lookup_view.sql) e `market_spreads_mv`
+(007_market_spreads.sql) sobre o market_data em memória.
+
+    python benchmarks/local_supabase.py --port 54321 --latency-ms 40 --jitter-ms 10 --error-rate 0.01 --seed-items 30000
+    SUPABASE_URL=http://127.0.0.1:54321 SUPABASE_SERVICE_ROLE=local SUPABASE_ANON_KEY=local ...
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+import typing as t
+import urllib.parse as up
+from datetime import datetime, timezone, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+RESERVED_PARAMS = {"select", "limit", "offset", "order", "on_conflict", "columns"}
+
+
+class Faults:
+    """Latência e injeção de erros (compartilhado entre threads do servidor)."""
+
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0, error_rate: float = 0.0,
+                 slow_rate: float = 0.0, slow_ms: float = 0.0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.slow_rate = slow_rate
+        self.slow_ms = slow_ms
+
+    def update(self, data: dict) -> None:
+        for k in ("latency_ms", "jitter_ms", "error_rate", "slow_rate", "slow_ms"):
+            if k in data:
+                setattr(self, k, float(data[k]))
+
+    def as_dict(self) -> dict:
+        return {k: getattr(self, k) for k in ("latency_ms", "jitter_ms", "error_rate", "slow_rate", "slow_ms")}
+
+    def apply(self) -> bool:
+        """Dorme a latência simulada; retorna True se esta requisição deve falhar."""
+        delay = self.latency_ms + (random.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0.0)
+        if self.slow_rate and random.random() < self.slow_rate:
+            delay += self.slow_ms
+        if delay > 0:
+            time.sleep(delay / 1000.0)
+        return bool(self.error_rate) and random.random() < self.error_rate
+
+
+class Store:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tables: t.Dict[str, t.Dict[str, dict]] = {}
+        self.stats: t.Dict[str, int] = {}
+
+    def count(self, key: str) -> None:
+        with self.lock:
+            self.stats[key] = self.stats.get(key, 0) + 1
+
+    def upsert(self, table: str, rows: t.List[dict], key: str) -> None:
+        with self.lock:
+            tbl = self.tables.setdefault(table, {})
+            for row in rows:
+                cur = tbl.get(row.get(key))
+                tbl[row.get(key)] = {**cur, **row} if cur else dict(row)
+
+    def rows(self, table: str) -> t.List[dict]:
+        with self.lock:
+            if table == "liquidity":
+                return [{"item_key": r["item_key"], "liquidity_score": liquidity_score(r)}
+                        for r in self.tables.get("market_data", {}).values()]
+            if table == "market_lookup":
+                return [{**r, "liquidity_score": liquidity_score(r)}
+                        for r in self.tables.get("market_data", {}).values()]
+            if table == "market_spreads_mv":
+                spreads = (spread_row({**r, "liquidity_score": liquidity_score(r)})
+                           for r in self.tables.get("market_data", {}).values())
+                return [r for r in spreads if r]
+            return list(self.tables.get(table, {}).values())
+
+    def delete(self, table: str, preds) -> int:
+        with self.lock:
+            tbl = self.tables.get(table, {})
+            doomed = [k for k, r in tbl.items() if all(p(r) for p in preds)]
+            for k in doomed:
+                del tbl[k]
+            return len(doomed)
+
+
+def liquidity_score(r: dict) -> int:
+    """Port do cálculo de public.liquidity (002_liquidity_mv.sql), sem o bônus Doppler."""
+    price = float(r.get("price_buff163") or 0)
+    buy = float(r.get("highest_offer_buff163") or 0)
+    listings = int(r.get("qty_whitemarket") or 0) + int(r.get("qty_csfloat") or 0)
+    ratio = (buy / price * 100) if price > 0 else 0
+
+    def tier(v, steps):
+        for threshold, score in steps:
+            if v >= threshold:
+                return score
+        return 5
+
+    s_listings = tier(listings, [(500, 25), (200, 20), (100, 15), (50, 10)])
+    if price > 0 and buy > price * 1.05:
+        s_gap = 5
+    else:
+        s_gap = tier(ratio, [(90, 25), (80, 20), (70, 15), (60, 10)]) if price > 0 else 5
+    s_volume = tier(listings * ratio / 100, [(1000, 25), (500, 20), (200, 15), (50, 10)]) if price > 0 else 5
+    s_steam = 5
+    for n, pct, score in ((500, 90, 25), (200, 80, 20), (100, 70, 15), (50, 60, 10)):
+        if listings >= n and price > 0 and ratio >= pct:
+            s_steam = score
+            break
+    return int(min(100, round(s_listings + s_gap + s_volume + s_steam)))
+
+
+def spread_row(r: dict) -> t.Optional[dict]:
+    """Port de public.market_spreads_mv (007_market_spreads.sql)."""
+    asks = [(src, r.get(f"price_{src}")) for src in ("whitemarket", "csfloat", "buff163")]
+    asks = [(src, float(p)) for src, p in asks if p is not None]
+    if not asks:
+        return None
+    buy_source, buy_price = min(asks, key=lambda a: a[1])
+    if buy_price <= 0:
+        return None
+    sells = [a for a in asks if a[0] != buy_source]
+    if r.get("highest_offer_buff163") is not None and buy_source != "buff163":
+        sells.append(("buff163_bid", float(r["highest_offer_buff163"])))
+    if not sells:
+        return None
+    sell_source, sell_price = max(sells, key=lambda a: a[1])
+    ratio = sell_price / buy_price - 1
+    liquidity = r.get("liquidity_score") or 0
+    return {
+        "item_key": r.get("item_key"), "name_base": r.get("name_base"), "stattrak": r.get("stattrak"),
+        "souvenir": r.get("souvenir"), "condition": r.get("condition"),
+        "buy_source": buy_source, "buy_price": buy_price, "sell_source": sell_source, "sell_price": sell_price,
+        "spread": sell_price - buy_price, "spread_ratio": ratio, "liquidity_score": liquidity,
+        "weighted_score": ratio * liquidity / 100.0,
+    }
+
+
+def _text(v) -> str:
+    if v is None:
+        return "null"
+    if isinstance(v, bool):
+        return "true" if v else "false"
+    return str(v)
+
+
+def _parse_in(arg: str) -> t.List[str]:
+    # in.(a,"b,c",d) com aspas duplas e escapes com barra invertida
+    body = arg[1:-1] if arg.startswith("(") and arg.endswith(")") else arg
+    out, cur, quoted, esc, had_quote = [], [], False, False, False
+    for ch in body:
+        if esc:
+            cur.append(ch)
+            esc = False
+        elif ch == "\\":
+            esc = True
+        elif ch == '"':
+            quoted = not quoted
+            had_quote = True
+        elif ch == "," and not quoted:
+            out.append("".join(cur))
+            cur, had_quote = [], False
+        else:
+            cur.append(ch)
+    if cur or had_quote or body.endswith(","):
+        out.append("".join(cur))
+    return out
+
+
+def _split_logic(body: str) -> t.List[str]:
+    # Separa and(..)/or(..) nas vírgulas de topo, preservando aspas e parênteses aninhados
+    out, cur, depth, quoted, esc = [], [], 0, False, False
+    for ch in body:
+        if esc:
+            esc = False
+        elif ch == "\\":
+            esc = True
+        elif ch == '"':
+            quoted = not quoted
+        elif not quoted and ch == "(":
+            depth += 1
+        elif not quoted and ch == ")":
+            depth -= 1
+        elif not quoted and depth == 0 and ch == ",":
+            out.append("".join(cur))
+            cur = []
+            continue
+        cur.append(ch)
+    if cur:
+        out.append("".join(cur))
+    return out
+
+
+def _logic(op: str, body: str) -> t.Callable[[dict], bool]:
+    preds = []
+    for clause in _split_logic(body[1:-1]):
+        if clause.startswith(("and(", "or(")):
+            name, _, rest = clause.partition("(")
+            preds.append(_logic(name, "(" + rest))
+        else:
+            preds.append(_predicate(*clause.split(".", 1)))
+    if op == "or":
+        return lambda r: any(p(r) for p in preds)
+    return lambda r: all(p(r) for p in preds)
+
+
+def _predicate(col: str, expr: str) -> t.Callable[[dict], bool]:
+    if col in ("and", "or"):
+        # and=(col.op.valor,...) / or=(and(...),...)
+        return _logic(col, expr)
+    op, _, arg = expr.partition(".")
+    if len(arg) >= 2 and arg[0] == arg[-1] == '"':
+        arg = _parse_in(arg)[0]
+    if op == "eq":
+        return lambda r: _text(r.get(col)) == arg
+    if op == "neq":
+        return lambda r: _text(r.get(col)) != arg
+    if op == "is":
+        return lambda r: _text(r.get(col)) == arg.lower()
+    if op == "in":
+        values = set(_parse_in(arg))
+        return lambda r: _text(r.get(col)) in values
+    if op in ("gte", "lte", "gt", "lt"):
+        bound = float(arg)
+        cmp = {"gte": float.__ge__, "lte": float.__le__, "gt": float.__gt__, "lt": float.__lt__}[op]
+        return lambda r: r.get(col) is not None and cmp(float(r.get(col)), bound)
+    raise ValueError(f"operador não suportado: {op}")
+
+
+class Handler(BaseHTTPRequestHandler):
+    server_version = "local-supabase"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, fmt, *args):
+        if self.server.verbose:
+            super().log_message(fmt, *args)
+
+    # --- helpers ---
+    def _send(self, status: int, body=None, headers: t.Optional[dict] = None):
+        payload = b"" if body is None else json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        if payload:
+            self.wfile.write(payload)
+
+    def _body(self):
+        n = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(n) if n else b""
+        return json.loads(raw) if raw else None
+
+    def _route(self):
+        parsed = up.urlsplit(self.path)
+        params = up.parse_qsl(parsed.query, keep_blank_values=True)
+        return parsed.path, params
+
+    def _faulted(self) -> bool:
+        if self.server.faults.apply():
+            self.server.store.count("errors_injected")
+            self._send(503, {"message": "injected error"})
+            return True
+        return False
+
+    # --- verbs ---
+    def do_GET(self):
+        path, params = self._route()
+        if path == "/__control":
+            return self._send(200, {"faults": self.server.faults.as_dict(), "stats": dict(self.server.store.stats)})
+        if not path.startswith("/rest/v1/"):
+            return self._send(404, {"message": "not found"})
+        if self._faulted():
+            return
+        table = path[len("/rest/v1/"):]
+        self.server.store.count(f"GET {table}")
+        try:
+            preds = [_predicate(k, v) for k, v in params if k not in RESERVED_PARAMS]
+        except ValueError as e:
+            return self._send(400, {"message": str(e)})
+        opts = dict(params)
+        rows = [r for r in self.server.store.rows(table) if all(p(r) for p in preds)]
+        if opts.get("order"):
+            col, _, direction = opts["order"].partition(".")
+            rows.sort(key=lambda r: (r.get(col) is None, r.get(col)), reverse=direction.startswith("desc"))
+        offset = int(opts.get("offset") or 0)
+        limit = int(opts["limit"]) if opts.get("limit") else None
+        rows = rows[offset: offset + limit if limit is not None else None]
+        select = opts.get("select", "*")
+        if select != "*":
+            cols = [c.strip() for c in select.split(",")]
+            rows = [{c: r.get(c) for c in cols} for r in rows]
+        self._send(200, rows)
+
+    def do_DELETE(self):
+        path, params = self._route()
+        if not path.startswith("/rest/v1/"):
+            return self._send(404, {"message": "not found"})
+        if self._faulted():
+            return
+        table = path[len("/rest/v1/"):]
+        preds = [_predicate(k, v) for k, v in params if k not in RESERVED_PARAMS]
+        if not preds:
+            return self._send(400, {"message": "DELETE requires a WHERE clause"})
+        self.server.store.count(f"DELETE {table}")
+        self.server.store.delete(table, preds)
+        self._send(204)
+
+    def do_POST(self):
+        path, params = self._route()
+        body = self._body()
+        if path == "/__control":
+            self.server.faults.update(body or {})
+            return self._send(200, {"faults": self.server.faults.as_dict()})
+        if self._faulted():
+            return
+
+        if path.startswith("/functions/v1/"):
+            fn = path[len("/functions/v1/"):]
+            self.server.store.count(f"function {fn}")
+            if fn not in ("activate", "validate"):
+                return self._send(404, {"message": "function not found"})
+            key = (body or {}).get("license_key", "")
+            if key.startswith("bad"):
+                return self._send(200, {"ok": False, "error": "Licença inválida", "reason": "invalid"})
+            expires = (datetime.now(timezone.utc) + timedelta(days=30)).isoformat()
+            result = {"ok": True, "expires_at": expires}
+            if fn == "activate":
+                result.update({"nickname": "local", "activated_at": datetime.now(timezone.utc).isoformat()})
+            return self._send(200, result)
+
+        if path.startswith("/rest/v1/rpc/"):
+            fn = path[len("/rest/v1/rpc/"):]
+            self.server.store.count(f"rpc {fn}")
+            if fn not in self.server.rpcs:
+                return self._send(404, {"message": f"function {fn} not found"})
+            result = self.server.rpcs[fn](body or {})
+            return self._send(204) if result is None else self._send(200, result)
+
+        if path.startswith("/rest/v1/"):
+            table = path[len("/rest/v1/"):]
+            key = dict(params).get("on_conflict", "item_key")
+            rows = body if isinstance(body, list) else [body or {}]
+            self.server.store.count(f"upsert {table}")
+            self.server.store.upsert(table, rows, key)
+            if "return=minimal" in (self.headers.get("Prefer") or ""):
+                return self._send(201)
+            return self._send(201, rows)
+
+        self._send(404, {"message": "not found"})
+
+
+class LocalSupabase(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, addr, faults: Faults, verbose: bool = False):
+        super().__init__(addr, Handler)
+        self.faults = faults
+        self.store = Store()
+        self.verbose = verbose
+        self.rpcs: t.Dict[str, t.Callable[[dict], t.Any]] = {
+            "refresh_liquidity_mv": lambda _body: None,
+            "bump_market_generation": lambda _body: self.bump_generation(),
+        }
+        self.store.upsert("market_generation", [{"id": 1, "generation": 0}], "id")
+
+    def bump_generation(self) -> int:
+        with self.store.lock:
+            row = self.store.tables["market_generation"][1]
+            row["generation"] += 1
+            row["refreshed_at"] = datetime.now(timezone.utc).isoformat()
+            return row["generation"]
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def seed(self, n: int) -> None:
+        """Popula market_data com n itens sintéticos (três fontes preenchidas)."""
+        from synthetic import catalog_name
+        from market_names import parse_name
+
+        rnd = random.Random(7)
+        rows = []
+        now = datetime.now(timezone.utc).isoformat()
+        for i in range(n):
+            p = parse_name(catalog_name(i))
+            buff = round(rnd.uniform(0.03, 2500.0), 2)
+            rows.append({
+                "item_key": p.item_key, "name_base": p.name_base, "stattrak": p.stattrak,
+                "souvenir": p.souvenir, "condition": p.condition, "phase": p.phase,
+                "price_whitemarket": round(buff * rnd.uniform(0.9, 1.2), 2), "qty_whitemarket": rnd.randint(0, 300),
+                "price_csfloat": round(buff * rnd.uniform(0.9, 1.2), 2), "qty_csfloat": rnd.randint(0, 300),
+                "price_buff163": buff, "highest_offer_buff163": round(buff * rnd.uniform(0.6, 0.98), 2),
+                "fetched_at": now,
+            })
+        self.store.upsert("market_data", rows, "item_key")
+
+
+def start(port: int = 0, faults: t.Optional[Faults] = None, seed_items: int = 0, verbose: bool = False) -> LocalSupabase:
+    """Sobe o servidor numa thread daemon (uso em benchmarks). Retorna o servidor (server.url)."""
+    srv = LocalSupabase(("127.0.0.1", port), faults or Faults(), verbose)
+    if seed_items:
+        srv.seed(seed_items)
+    threading.Thread(target=srv.serve_forever, name="local-supabase", daemon=True).start()
+    return srv
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--port", type=int, default=54321)
+    ap.add_argument("--latency-ms", type=float, default=0.0)
+    ap.add_argument("--jitter-ms", type=float, default=0.0)
+    ap.add_argument("--error-rate", type=float, default=0.0, help="fração de requisições que respondem 503")
+    ap.add_argument("--slow-rate", type=float, default=0.0, help="fração de requisições com atraso extra")
+    ap.add_argument("--slow-ms", type=float, default=0.0)
+    ap.add_argument("--seed-items", type=int, default=0)
+    ap.add_argument("--verbose", action="store_true")
+    args = ap.parse_args()
+
+    faults = Faults(args.latency_ms, args.jitter_ms, args.error_rate, args.slow_rate, args.slow_ms)
+    srv = LocalSupabase(("127.0.0.1", args.port), faults, args.verbose)
+    if args.seed_items:
+        srv.seed(args.seed_items)
+    print(f"local supabase em {srv.url} (faults={faults.as_dict()})")
+    try:
+        srv.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Gerador determinístico de nomes/dumps sintéticos para os benchmarks (offline).
+"""
+
+import io
+import json
+import random
+import typing as t
+
+WEAPONS = [
+    "AK-47", "M4A4", "M4A1-S", "AWP", "Desert Eagle", "USP-S", "Glock-18", "P250",
+    "FAMAS", "Galil AR", "SSG 08", "MP9", "MAC-10", "UMP-45", "P90", "Five-SeveN",
+    "Tec-9", "CZ75-Auto", "Nova", "XM1014", "MAG-7", "Negev", "SG 553", "AUG",
+]
+KNIVES = ["★ Karambit", "★ Butterfly Knife", "★ M9 Bayonet", "★ Bayonet", "★ Flip Knife", "★ Talon Knife"]
+SKINS = [
+    "Redline", "Asiimov", "Hyper Beast", "Vulcan", "Fire Serpent", "Neo-Noir", "Printstream",
+    "Bloodsport", "Case Hardened", "Slate", "Fade", "Crimson Web", "Tiger Tooth", "Marble Fade",
+    "Dragon Lore", "Howl", "Bullet Rain", "Desolate Space", "Cyrex", "Blue Laminate",
+]
+DOPPLERS = ["Doppler", "Gamma Doppler"]
+PHASES = ["Phase 1", "Phase 2", "Phase 3", "Phase 4", "Ruby", "Sapphire", "Black Pearl", "Emerald"]
+CONDITIONS = ["Factory New", "Minimal Wear", "Field-Tested", "Well-Worn", "Battle-Scarred"]
+
+
+def market_hash_names(n: int, seed: int = 42) -> t.List[str]:
+    """Nomes distintos com variantes StatTrak™/Souvenir/condição/fase."""
+    rnd = random.Random(seed)
+    names: t.List[str] = []
+    seen = set()
+    serial = 0
+    while len(names) < n:
+        r = rnd.random()
+        cond = rnd.choice(CONDITIONS)
+        if r < 0.15:
+            base = f"{rnd.choice(KNIVES)} | {rnd.choice(DOPPLERS)}"
+            name = f"{base} ({cond}) - {rnd.choice(PHASES)}"
+            if rnd.random() < 0.3:
+                name = name.replace("★ ", "★ StatTrak™ ", 1)
+        else:
+            base = f"{rnd.choice(WEAPONS)} | {rnd.choice(SKINS)}"
+            prefix = ""
+            if rnd.random() < 0.25:
+                prefix = "StatTrak™ "
+            elif rnd.random() < 0.08:
+                prefix = "Souvenir "
+            name = f"{prefix}{base} ({cond})"
+        if name in seen:
+            # catálogo sintético maior que as combinações: sufixo numérico
+            serial += 1
+            name = name.replace(" | ", f" | V{serial} ", 1)
+        seen.add(name)
+        names.append(name)
+    return names
+
+
+BASE_CATALOG = 50000
+_base_names: t.List[str] = []
+
+
+def catalog_name(i: int) -> str:
+    """i-ésimo nome distinto do catálogo, sem materializar catálogos grandes."""
+    global _base_names
+    if not _base_names:
+        _base_names = market_hash_names(BASE_CATALOG)
+    name = _base_names[i % BASE_CATALOG]
+    k = i // BASE_CATALOG
+    return name.replace(" | ", f" | V{k} ", 1) if k else name
+
+
+def _listings(n: int, dup_rate: float, seed: int) -> t.Iterator[t.Tuple[str, random.Random]]:
+    """n linhas sobre um catálogo de n*(1-dup_rate) nomes (duplicatas = várias ofertas do mesmo item)."""
+    rnd = random.Random(seed)
+    unique = max(1, int(n * (1.0 - dup_rate)))
+    for i in range(n):
+        yield catalog_name(i if i < unique else rnd.randrange(unique)), rnd
+
+
+def _write_rows(f: t.BinaryIO, rows: t.Iterable[str], open_: str, sep: str, close: str) -> None:
+    f.write(open_.encode("utf-8"))
+    first = True
+    for row in rows:
+        if not first:
+            f.write(sep.encode("utf-8"))
+        f.write(row.encode("utf-8"))
+        first = False
+    f.write(close.encode("utf-8"))
+
+
+def write_whitemarket(f: t.BinaryIO, n: int, dup_rate: float = 0.3, seed: int = 1, layout: str = "array") -> None:
+    """Export no formato do 730.json: array de produtos (ou {"products": [...]}/NDJSON)."""
+    rows = (
+        json.dumps({
+            "product_class_id": i // 3,
+            "market_hash_name": name,
+            "price": round(rnd.uniform(0.03, 2500.0), 2),
+            "qty": 1,
+            "link": f"https://white.market/item/{i}",
+        }, ensure_ascii=False)
+        for i, (name, rnd) in enumerate(_listings(n, dup_rate, seed))
+    )
+    if layout == "ndjson":
+        _write_rows(f, rows, "", "\n", "\n")
+    elif layout == "products":
+        _write_rows(f, rows, '{"products":[', ",", "]}")
+    else:
+        _write_rows(f, rows, "[", ",", "]")
+
+
+def write_csfloat(f: t.BinaryIO, n: int, dup_rate: float = 0.05, seed: int = 2) -> None:
+    """price-list do CSFloat: [{market_hash_name, qty, min_price (cents)}]."""
+    rows = (
+        json.dumps({"market_hash_name": name, "qty": rnd.randint(1, 400), "min_price": rnd.randint(3, 250000)}, ensure_ascii=False)
+        for name, rnd in _listings(n, dup_rate, seed)
+    )
+    _write_rows(f, rows, "[", ",", "]")
+
+
+def write_buff163(f: t.BinaryIO, n: int, seed: int = 3) -> None:
+    """buff163.json do csgotrader: {name: {starting_at: {price}, highest_order: {price}}} (chaves únicas)."""
+    def rows():
+        for name, rnd in _listings(n, 0.0, seed):
+            start = round(rnd.uniform(0.03, 2500.0), 2)
+            yield json.dumps(name, ensure_ascii=False) + ":" + json.dumps({
+                "starting_at": {"price": start, "doppler": None},
+                "highest_order": {"price": round(start * rnd.uniform(0.6, 0.98), 2)},
+            })
+    _write_rows(f, rows(), "{", ",", "}")
+
+
+WRITERS = {
+    "whitemarket": write_whitemarket,
+    "csfloat": write_csfloat,
+    "buff163": write_buff163,
+}
+
+
+def dump_bytes(source: str, n: int, **kwargs) -> bytes:
+    buf = io.BytesIO()
+    WRITERS[source](buf, n, **kwargs)
+    return buf.getvalue()
+
+
+def whitemarket_dump(n: int, **kwargs) -> bytes:
+    return dump_bytes("whitemarket", n, **kwargs)
+
+
+def csfloat_dump(n: int, **kwargs) -> bytes:
+    return dump_bytes("csfloat", n, **kwargs)
+
+
+def buff163_dump(n: int, **kwargs) -> bytes:
+    return dump_bytes("buff163", n, **kwargs)
+
+
+DUMPS = {
+    "whitemarket": whitemarket_dump,
+    "csfloat": csfloat_dump,
+    "buff163": buff163_dump,
+}
@@ -2,15 +2,16 @@
 # -*- coding: utf-8 -*-
 
 import os
-import re
 import typing as t
 from datetime import datetime, timezone
 
-import requests
-import ijson
 from dotenv import load_dotenv
-import gzip
-import io
+
+import json_backend
+import market_writer
+from market_names import parse_name
+import row_delta
+import source_fetch
 
 BUFF163_URL = "https://prices.csgotrader.app/latest/buff163.json"
 os.environ.setdefault("HTTPX_DISABLE_HTTP2", "1")
@@ -23,106 +24,30 @@ SUPABASE_URL = os.environ.get("SUPABASE_URL")
 SUPABASE_KEY = os.environ.get("SUPABASE_SERVICE_ROLE") or os.environ.get("SUPABASE_ANON_KEY")
 MARKET_TABLE = os.environ.get("SUPABASE_MARKET_TABLE", "market_data")
 UPSERT_BATCH = int(os.environ.get("SUPABASE_UPSERT_BATCH", "500"))
-
-CONDITION_NAMES = [
-    "Factory New",
-    "Minimal Wear",
-    "Field-Tested",
-    "Well-Worn",
-    "Battle-Scarred",
-]
-
-PHASE_TOKENS = [
-    "Ruby", "Sapphire", "Black Pearl", "Emerald",
-    "Phase 1", "Phase 2", "Phase 3", "Phase 4",
-]
-
-
-def parse_market_hash_name(name: str) -> t.Tuple[str, bool, bool, t.Optional[str]]:
-    if not name:
-        return "", False, False, None
-    s = name
-    stattrak = "StatTrak" in s or "StatTrak™" in s
-    souvenir = "Souvenir" in s
-    condition = None
-    for cond in CONDITION_NAMES:
-        if s.endswith(f"({cond})"):
-            condition = cond
-            s = s[: -(len(cond) + 2)].strip()
-            break
-    base = s.replace("StatTrak™ ", "").replace("StatTrak ", "").replace("Souvenir ", "").strip()
-    return base, stattrak, souvenir, condition
-
-
-def detect_phase(name: str) -> t.Optional[str]:
-    for token in PHASE_TOKENS:
-        # basic contains check (case sensitive to match CSGO naming)
-        if token in name:
-            return token
-    return None
-
-
-def build_item_key(name_base: str, stattrak: bool, souvenir: bool, condition: t.Optional[str], phase: t.Optional[str]) -> str:
-    parts = [
-        name_base or "",
-        ("StatTrak" if stattrak else ""),
-        ("Souvenir" if souvenir else ""),
-        condition or "",
-        phase or "",
-    ]
-    return "|".join([p for p in parts if p]).strip()
-
-
-def chunked(iterable, size: int):
-    buf = []
-    for x in iterable:
-        buf.append(x)
-        if len(buf) >= size:
-            yield buf
-            buf = []
-    if buf:
-        yield buf
+# Columns compared by the delta upsert (fetched_at intentionally excluded)
+DELTA_COLUMNS = ("name_base", "stattrak", "souvenir", "condition", "price_buff163", "highest_offer_buff163")
 
 
 def get_supabase_client():
-    from supabase import create_client
-    if not SUPABASE_URL or not SUPABASE_KEY:
-        raise RuntimeError("SUPABASE_URL/SUPABASE_SERVICE_ROLE não configurados no ambiente")
-    return create_client(SUPABASE_URL, SUPABASE_KEY)
-
-
-class PrependStream:
-    def __init__(self, head: bytes, base):
-        self.buf = io.BytesIO(head)
-        self.base = base
-    def read(self, n: int = -1):
-        b = self.buf.read(n)
-        if n == -1 or len(b) == n:
-            return b
-        rest = self.base.read(n - len(b))
-        return b + rest
+    # Cliente único por processo, compartilhado entre as fontes
+    return market_writer.get_shared_client()
 
 
 def open_source_stream(url: str):
-    headers = {"Accept": "application/json"}
-    resp = requests.get(url, headers=headers, stream=True, timeout=180)
-    resp.raise_for_status()
-    resp.raw.decode_content = True
-    head = resp.raw.read(4)
-    base = PrependStream(head, resp.raw)
-    if head.startswith(b"\x1f\x8b"):
-        return gzip.GzipFile(fileobj=base, mode="rb")
-    return base
+    return source_fetch.open_source_stream(url, "buff163", timeout=180)
 
 
-def fetch_buff163(url: str = BUFF163_URL) -> t.Iterable[t.Tuple[str, dict]]:
+def iter_buff163_pairs(stream) -> t.Iterable[t.Tuple[str, dict]]:
     """Stream top-level mapping of name -> {starting_at: {price}, highest_order: {price}}"""
-    stream = open_source_stream(url)
     # kvitems with empty prefix to iterate top-level keys
-    for name, entry in ijson.kvitems(stream, ""):
+    for name, entry in json_backend.iter_kvitems(stream, "", size_hint=getattr(stream, "size_hint", None)):
         yield str(name), entry if isinstance(entry, dict) else {}
 
 
+def fetch_buff163(url: str = BUFF163_URL) -> t.Iterable[t.Tuple[str, dict]]:
+    yield from iter_buff163_pairs(open_source_stream(url))
+
+
 def aggregate_buff163(pairs: t.Iterable[t.Tuple[str, dict]]) -> t.Dict[str, dict]:
     now = datetime.now(timezone.utc)
     acc: t.Dict[str, dict] = {}
@@ -140,9 +65,7 @@ def aggregate_buff163(pairs: t.Iterable[t.Tuple[str, dict]]) -> t.Dict[str, dict
         except Exception:
             p_buy = None
 
-        name_base, stattrak, souvenir, condition = parse_market_hash_name(name)
-        phase = detect_phase(name)
-        item_key = build_item_key(name_base, stattrak, souvenir, condition, phase)
+        name_base, stattrak, souvenir, condition, phase, item_key = parse_name(name, with_phase=True)
 
         # Aggregate duplicates: take min(start), max(buy)
         rec = acc.get(item_key)
@@ -168,15 +91,24 @@ def aggregate_buff163(pairs: t.Iterable[t.Tuple[str, dict]]) -> t.Dict[str, dict
     return acc
 
 
-def upsert_market_rows(sb, rows: list[dict]):
-    for batch in chunked(rows, UPSERT_BATCH):
-        sb.table(MARKET_TABLE).upsert(batch, on_conflict="item_key").execute()
+def upsert_market_rows(writer, rows: list[dict]):
+    """Envia as linhas pelo sink configurado (MarketWriter REST ou CopySink)."""
+    writer.write_rows(rows)
 
 
 def run_buff163_ingest(url: str = BUFF163_URL) -> int:
-    sb = get_supabase_client()
-    pairs = fetch_buff163(url)
-    aggregated = aggregate_buff163(pairs)
+    try:
+        return _ingest_buff163(url)
+    except source_fetch.SourceNotModified:
+        return 0
+    except Exception:
+        # Tee/arquivo temporário pendentes não podem vazar para o próximo run
+        source_fetch.discard_source("buff163")
+        raise
+
+
+def _ingest_buff163(url: str) -> int:
+    aggregated = aggregate_buff163(fetch_buff163(url))
     rows = []
     for _, rec in aggregated.items():
         rows.append({
@@ -189,8 +121,21 @@ def run_buff163_ingest(url: str = BUFF163_URL) -> int:
             "highest_offer_buff163": rec["highest_offer_buff163"],
             "fetched_at": rec["fetched_at"].isoformat(),
         })
+    delta = row_delta.RowFingerprints("buff163", DELTA_COLUMNS)
+    rows = delta.filter(rows)
+    print(f"[buff163] delta: {delta.changed} alterados, {delta.skipped} inalterados")
+    failed = []
     if rows:
-        upsert_market_rows(sb, rows)
+        with market_writer.open_sink("buff163", MARKET_TABLE, UPSERT_BATCH) as writer:
+            upsert_market_rows(writer, rows)
+        failed = writer.failed_batches
+    for batch in failed:
+        delta.forget(batch)
+    delta.commit()
+    if failed:
+        source_fetch.discard_source("buff163")
+        raise RuntimeError(f"[buff163] {len(failed)} lotes falharam no upsert")
+    source_fetch.commit_source("buff163")
     return len(rows)
 
 
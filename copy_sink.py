@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Sink alternativo de carga em massa para o market_data.
+
+As linhas agregadas vão no formato texto do COPY para um arquivo temporário (spooled) e entram
+no Postgres com um único COPY em uma tabela staging UNLOGGED por fonte
+(<tabela>_stage_<fonte>). Em seguida um INSERT ... ON CONFLICT (item_key)
+DO UPDATE set-based aplica tudo no market_data numa transação.
+
+Selecione com SUPABASE_UPSERT_SINK=copy. Conexão direta ao Postgres via
+SUPABASE_DB_URL (ou DATABASE_URL); aponte para um Postgres local para testar
+sem o Supabase hospedado. Requer psycopg2 (opcional, não está no requirements).
+Verificação contra um Postgres descartável: benchmarks/check_copy_sink.py.
+"""
+
+import os
+import tempfile
+import typing as t
+
+
+_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+
+def _copy_value(v) -> str:
+    """Valor no formato texto do COPY (\\N = NULL)."""
+    if v is None:
+        return "\\N"
+    if isinstance(v, bool):
+        return "t" if v else "f"
+    return str(v).translate(_ESCAPES)
+
+
+def _connect(dsn: str):
+    try:
+        import psycopg2
+    except ImportError:
+        raise RuntimeError("SUPABASE_UPSERT_SINK=copy requer psycopg2 (pip install psycopg2-binary)")
+    return psycopg2.connect(dsn)
+
+
+class CopySink:
+    """Mesma interface do MarketWriter: write_rows(), flush()/close(), failed_batches."""
+
+    def __init__(self, source: str, table: str = None, dsn: str = None):
+        self.source = source
+        self.table = table or os.environ.get("SUPABASE_MARKET_TABLE", "market_data")
+        self.stage = f"{self.table}_stage_{source}"
+        self.dsn = dsn or os.environ.get("SUPABASE_DB_URL") or os.environ.get("DATABASE_URL")
+        if not self.dsn:
+            raise RuntimeError("SUPABASE_DB_URL/DATABASE_URL não configurado para SUPABASE_UPSERT_SINK=copy")
+        self.columns: t.Optional[t.List[str]] = None
+        self._buf = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024, mode="w+", newline="", encoding="utf-8")
+        self._keys: t.List[str] = []
+        self.failed_batches: t.List[t.List[dict]] = []
+        self.rows_written = 0
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def write_rows(self, rows: t.Iterable[dict]) -> None:
+        for row in rows:
+            if self.columns is None:
+                self.columns = list(row.keys())
+            self._buf.write("\t".join(_copy_value(row.get(c)) for c in self.columns) + "\n")
+            self._keys.append(row["item_key"])
+
+    def _merge_sql(self):
+        from psycopg2 import sql
+        cols = sql.SQL(", ").join(sql.Identifier(c) for c in self.columns)
+        updates = sql.SQL(", ").join(
+            sql.SQL("{c} = excluded.{c}").format(c=sql.Identifier(c))
+            for c in self.columns if c != "item_key"
+        )
+        # Duplicatas do mesmo item_key no staging: fica a última linha copiada
+        return sql.SQL(
+            "insert into {table} ({cols}) "
+            "select distinct on (item_key) {cols} from {stage} order by item_key, ctid desc "
+            "on conflict (item_key) do update set {updates}"
+        ).format(table=sql.Identifier(self.table), stage=sql.Identifier(self.stage), cols=cols, updates=updates)
+
+    def flush(self) -> t.List[t.List[dict]]:
+        if not self._keys:
+            return list(self.failed_batches)
+        conn = None
+        try:
+            from psycopg2 import sql
+            conn = _connect(self.dsn)
+            with conn.cursor() as cur:
+                cur.execute(sql.SQL("create unlogged table if not exists {stage} (like {table} including defaults)").format(
+                    stage=sql.Identifier(self.stage), table=sql.Identifier(self.table)))
+                cur.execute(sql.SQL("truncate {stage}").format(stage=sql.Identifier(self.stage)))
+                self._buf.seek(0)
+                copy = sql.SQL("copy {stage} ({cols}) from stdin").format(
+                    stage=sql.Identifier(self.stage),
+                    cols=sql.SQL(", ").join(sql.Identifier(c) for c in self.columns))
+                cur.copy_expert(copy.as_string(conn), self._buf)
+                cur.execute(self._merge_sql())
+                merged = cur.rowcount
+                cur.execute(sql.SQL("truncate {stage}").format(stage=sql.Identifier(self.stage)))
+            conn.commit()
+            self.rows_written += len(self._keys)
+            print(f"[copy] {self.source}: {len(self._keys)} linhas via COPY, {merged} aplicadas em {self.table}")
+        except Exception as e:
+            if conn is not None:
+                conn.rollback()
+            print(f"[copy] {self.source}: falha no COPY/MERGE: {e}")
+            self.failed_batches.append([{"item_key": k} for k in self._keys])
+        finally:
+            if conn is not None:
+                conn.close()
+            self._keys = []
+            self._buf.seek(0)
+            self._buf.truncate()
+        return list(self.failed_batches)
+
+    def close(self) -> t.List[t.List[dict]]:
+        if self._closed:
+            return list(self.failed_batches)
+        try:
+            return self.flush()
+        finally:
+            self._closed = True
+            self._buf.close()
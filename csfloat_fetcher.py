@@ -5,9 +5,14 @@ import os
 import typing as t
 from datetime import datetime, timezone
 
-import requests
 from dotenv import load_dotenv
-import ijson
+
+import json_backend
+import market_writer
+from market_names import parse_name
+import row_delta
+import source_fetch
+from source_fetch import PrependStream
 
 CSFLOAT_URL = "https://csfloat.com/api/v1/listings/price-list"
 os.environ.setdefault("HTTPX_DISABLE_HTTP2", "1")
@@ -20,110 +25,36 @@ SUPABASE_URL = os.environ.get("SUPABASE_URL")
 SUPABASE_KEY = os.environ.get("SUPABASE_SERVICE_ROLE") or os.environ.get("SUPABASE_ANON_KEY")
 MARKET_TABLE = os.environ.get("SUPABASE_MARKET_TABLE", "market_data")
 UPSERT_BATCH = int(os.environ.get("SUPABASE_UPSERT_BATCH", "500"))
-
-CONDITION_NAMES = [
-    "Factory New",
-    "Minimal Wear",
-    "Field-Tested",
-    "Well-Worn",
-    "Battle-Scarred",
-]
-
-
-def parse_market_hash_name(name: str) -> t.Tuple[str, bool, bool, t.Optional[str]]:
-    if not name:
-        return "", False, False, None
-    s = name
-    stattrak = "StatTrak" in s or "StatTrak™" in s
-    souvenir = "Souvenir" in s
-    condition = None
-    for cond in CONDITION_NAMES:
-        if s.endswith(f"({cond})"):
-            condition = cond
-            s = s[: -(len(cond) + 2)].strip()
-            break
-    base = s.replace("StatTrak™ ", "").replace("StatTrak ", "").replace("Souvenir ", "").strip()
-    return base, stattrak, souvenir, condition
-
-
-def build_item_key(name_base: str, stattrak: bool, souvenir: bool, condition: t.Optional[str], phase: t.Optional[str]) -> str:
-    parts = [
-        name_base or "",
-        ("StatTrak" if stattrak else ""),
-        ("Souvenir" if souvenir else ""),
-        condition or "",
-        phase or "",
-    ]
-    return "|".join([p for p in parts if p != ""]).strip()
-
-
-def chunked(iterable, size: int):
-    buf = []
-    for x in iterable:
-        buf.append(x)
-        if len(buf) >= size:
-            yield buf
-            buf = []
-    if buf:
-        yield buf
+# Columns compared by the delta upsert (fetched_at intentionally excluded)
+DELTA_COLUMNS = ("name_base", "stattrak", "souvenir", "condition", "price_csfloat", "qty_csfloat")
 
 
 def get_supabase_client():
-    from supabase import create_client
-    if not SUPABASE_URL or not SUPABASE_KEY:
-        raise RuntimeError("SUPABASE_URL/SUPABASE_SERVICE_ROLE não configurados no ambiente")
-    return create_client(SUPABASE_URL, SUPABASE_KEY)
-
-
-import gzip
-import io
+    # Cliente único por processo, compartilhado entre as fontes
+    return market_writer.get_shared_client()
 
 
-class PrependStream:
-    def __init__(self, head: bytes, base):
-        self.buf = io.BytesIO(head)
-        self.base = base
 
-    def read(self, n: int = -1):
-        b = self.buf.read(n)
-        if n == -1 or len(b) == n:
-            return b
-        rest = self.base.read(n - len(b))
-        return b + rest
+def open_source_stream(url: str):
+    return source_fetch.open_source_stream(url, "csfloat", timeout=180)
 
 
-def open_source_stream(url: str):
-    headers = {"Accept": "application/json"}
-    resp = requests.get(url, headers=headers, stream=True, timeout=180)
-    resp.raise_for_status()
-    resp.raw.decode_content = True
-    head = resp.raw.read(4)
-    base = PrependStream(head, resp.raw)
-    if head.startswith(b"\x1f\x8b"):
-        return gzip.GzipFile(fileobj=base, mode="rb")
-    return base
+def iter_csfloat_items(stream) -> t.Iterable[dict]:
+    # JSON array na raiz ou NDJSON (um objeto por linha): decide pelo primeiro byte,
+    # sem reabrir/baixar o dump de novo
+    head = stream.read(64)
+    if head.lstrip().startswith(b"["):
+        prefix, multiple = "item", False
+    else:
+        prefix, multiple = "", True
+    size_hint = getattr(stream, "size_hint", None)
+    for obj in json_backend.iter_items(PrependStream(head, stream), prefix, multiple_values=multiple, size_hint=size_hint):
+        if isinstance(obj, dict):
+            yield obj
 
 
 def fetch_csfloat(url: str = CSFLOAT_URL) -> t.Iterable[dict]:
-    # Try stream as JSON array
-    stream = open_source_stream(url)
-    try:
-        for obj in ijson.items(stream, "item"):
-            if isinstance(obj, dict):
-                yield obj
-        return
-    except Exception:
-        pass
-    # Fallback: NDJSON per line
-    stream = open_source_stream(url)
-    for line in stream:
-        try:
-            import json
-            obj = json.loads(line)
-            if isinstance(obj, dict):
-                yield obj
-        except Exception:
-            continue
+    yield from iter_csfloat_items(open_source_stream(url))
 
 
 def aggregate_csfloat(items: t.Iterable[dict]) -> t.Dict[str, dict]:
@@ -145,8 +76,7 @@ def aggregate_csfloat(items: t.Iterable[dict]) -> t.Dict[str, dict]:
                 price = float(min_price) if min_price is not None else None
         except Exception:
             price = None
-        name_base, stattrak, souvenir, condition = parse_market_hash_name(str(name))
-        item_key = build_item_key(name_base, stattrak, souvenir, condition, None)
+        name_base, stattrak, souvenir, condition, _, item_key = parse_name(str(name))
         rec = acc.get(item_key)
         if not rec:
             acc[item_key] = rec = {
@@ -169,15 +99,24 @@ def aggregate_csfloat(items: t.Iterable[dict]) -> t.Dict[str, dict]:
     return acc
 
 
-def upsert_market_rows(sb, rows: list[dict]):
-    for batch in chunked(rows, UPSERT_BATCH):
-        sb.table(MARKET_TABLE).upsert(batch, on_conflict="item_key").execute()
+def upsert_market_rows(writer, rows: list[dict]):
+    """Envia as linhas pelo sink configurado (MarketWriter REST ou CopySink)."""
+    writer.write_rows(rows)
 
 
 def run_csfloat_ingest(url: str = CSFLOAT_URL) -> int:
-    sb = get_supabase_client()
-    items = fetch_csfloat(url)
-    aggregated = aggregate_csfloat(items)
+    try:
+        return _ingest_csfloat(url)
+    except source_fetch.SourceNotModified:
+        return 0
+    except Exception:
+        # Tee/arquivo temporário pendentes não podem vazar para o próximo run
+        source_fetch.discard_source("csfloat")
+        raise
+
+
+def _ingest_csfloat(url: str) -> int:
+    aggregated = aggregate_csfloat(fetch_csfloat(url))
     rows = []
     for _, rec in aggregated.items():
         rows.append({
@@ -190,8 +129,21 @@ def run_csfloat_ingest(url: str = CSFLOAT_URL) -> int:
             "qty_csfloat": int(rec["qty_csfloat"]),
             "fetched_at": rec["fetched_at"].isoformat(),
         })
+    delta = row_delta.RowFingerprints("csfloat", DELTA_COLUMNS)
+    rows = delta.filter(rows)
+    print(f"[csfloat] delta: {delta.changed} alterados, {delta.skipped} inalterados")
+    failed = []
     if rows:
-        upsert_market_rows(sb, rows)
+        with market_writer.open_sink("csfloat", MARKET_TABLE, UPSERT_BATCH) as writer:
+            upsert_market_rows(writer, rows)
+        failed = writer.failed_batches
+    for batch in failed:
+        delta.forget(batch)
+    delta.commit()
+    if failed:
+        source_fetch.discard_source("csfloat")
+        raise RuntimeError(f"[csfloat] {len(failed)} lotes falharam no upsert")
+    source_fetch.commit_source("csfloat")
     return len(rows)
 
 
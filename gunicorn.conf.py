@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+Configuração do gunicorn para o license_backend (produção).
+
+    gunicorn -c gunicorn.conf.py license_backend:app
+
+- Workers derivados de CPU e do limite de memória do container (cgroup),
+  ajustáveis com WEB_CONCURRENCY / GUNICORN_THREADS.
+- preload_app: o app é importado e o snapshot de mercado carregado no master
+  antes do fork; os workers já nascem prontos para responder /health e
+  /market/lookup (e compartilham as páginas copy-on-write ou o mmap).
+- Workers reciclados (max_requests) e recriados nascem do master, cujo
+  snapshot é o do boot: post_fork confere a geração e recarrega antes de servir.
+- Código novo: com preload_app, `kill -HUP <master>` só recria workers a partir
+  do app já importado no master (não recarrega código). Para trocar o código sem
+  derrubar conexões: `kill -USR2 <master>` (sobe um master novo), depois
+  `kill -TERM <master antigo>`; ou reinicie o serviço.
+"""
+
+import os
+import multiprocessing
+
+# Memória estimada por worker (app + snapshot em memória + threads)
+WORKER_MEMORY_MB = int(os.environ.get("GUNICORN_WORKER_MEMORY_MB", "120"))
+# Reserva para o master e picos
+RESERVED_MEMORY_MB = int(os.environ.get("GUNICORN_RESERVED_MEMORY_MB", "100"))
+
+
+def _memory_limit_mb() -> int:
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        try:
+            with open(path) as f:
+                raw = f.read().strip()
+            if raw and raw != "max" and int(raw) < 1 << 60:
+                return int(raw) // (1024 * 1024)
+        except (OSError, ValueError):
+            continue
+    return int(os.environ.get("CONTAINER_MEMORY_MB", "512"))
+
+
+def _default_workers() -> int:
+    by_cpu = multiprocessing.cpu_count() * 2 + 1
+    by_memory = max(1, (_memory_limit_mb() - RESERVED_MEMORY_MB) // WORKER_MEMORY_MB)
+    return max(1, min(by_cpu, by_memory))
+
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8080')}"
+workers = int(os.environ.get("WEB_CONCURRENCY") or _default_workers())
+# I/O-bound (Supabase): threads por worker atendem chamadas upstream em paralelo.
+# Modo ASGI: GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker com asgi_backend:app
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.environ.get("GUNICORN_THREADS", "8"))
+preload_app = True
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "60"))
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", "5"))
+# Recicla workers periodicamente (limite de 512MB); jitter evita reinício simultâneo
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", "10000"))
+max_requests_jitter = int(os.environ.get("GUNICORN_MAX_REQUESTS_JITTER", "1000"))
+accesslog = os.environ.get("GUNICORN_ACCESS_LOG") or None
+errorlog = "-"
+loglevel = os.environ.get("GUNICORN_LOG_LEVEL", "info")
+
+
+def when_ready(server):
+    # Com preload o app já está importado no master: aquece antes de criar workers
+    import license_backend
+    server.log.info(f"gunicorn: {workers} workers x {threads} threads (memória {_memory_limit_mb()}MB)")
+    if workers > 1 and not license_backend.REDIS_URL:
+        server.log.warning(f"gunicorn: sem REDIS_URL o bloqueio por força bruta é por worker "
+                           f"(até {license_backend.MAX_FAILED_ATTEMPTS * workers} tentativas por IP)")
+    license_backend.warm_up()
+
+
+def post_fork(server, worker):
+    # O snapshot herdado é o do master (boot): atualiza antes de servir, senão um
+    # worker reciclado responde com dados cada vez mais antigos até o primeiro poll.
+    # Threads não sobrevivem ao fork: reinicia o refresh do snapshot no worker
+    import license_backend
+    if license_backend.market_snapshots is not None:
+        license_backend.warm_up()
+        license_backend.market_snapshots.ensure_started()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Backends de decodificação JSON para os dumps das fontes.
+
+- Streaming: usa o backend ijson mais rápido disponível (yajl2_c > yajl2_cffi
+  > yajl2 > python). Force um com JSON_BACKEND=<nome>.
+- Documento inteiro: dumps pequenos (size_hint <= JSON_FAST_PARSE_MAX_BYTES)
+  são lidos de uma vez e parseados com orjson (se instalado) ou json, que é
+  mais rápido que qualquer parser incremental nesse tamanho. 0 desativa.
+
+benchmarks/bench_decode.py mede as opções por tamanho de dump.
+"""
+
+import os
+import json
+import threading
+import typing as t
+
+import ijson
+
+STREAM_BACKENDS = ("yajl2_c", "yajl2_cffi", "yajl2", "python")
+FAST_PARSE_MAX_BYTES = int(os.environ.get("JSON_FAST_PARSE_MAX_BYTES", str(2 * 1024 * 1024)))
+
+_lock = threading.Lock()
+_backend = None
+_backend_name = None
+_loads = None
+
+
+def get_stream_backend():
+    """Backend ijson escolhido (resolvido e logado uma vez por processo)."""
+    global _backend, _backend_name
+    with _lock:
+        if _backend is None:
+            forced = os.environ.get("JSON_BACKEND")
+            candidates = (forced,) if forced else STREAM_BACKENDS
+            for name in candidates:
+                try:
+                    _backend = ijson.get_backend(name)
+                    _backend_name = name
+                    break
+                except Exception:
+                    continue
+            if _backend is None:
+                _backend, _backend_name = ijson, "default"
+            print(f"[json] backend de streaming: ijson/{_backend_name}")
+        return _backend
+
+
+def get_document_loads() -> t.Callable[[bytes], t.Any]:
+    """Parser de documento inteiro: orjson se instalado, senão json da stdlib."""
+    global _loads
+    with _lock:
+        if _loads is None:
+            try:
+                import orjson
+                _loads = orjson.loads
+                name = "orjson"
+            except ImportError:
+                _loads = json.loads
+                name = "json"
+            print(f"[json] parser de documento inteiro: {name}")
+        return _loads
+
+
+def use_document_parser(size_hint: t.Optional[int], multiple_values: bool = False) -> bool:
+    return bool(
+        FAST_PARSE_MAX_BYTES > 0
+        and not multiple_values
+        and size_hint is not None
+        and 0 < size_hint <= FAST_PARSE_MAX_BYTES
+    )
+
+
+def _walk(node, parts: t.List[str]):
+    # Equivalente ao prefix do ijson: "item" itera listas, demais nomes são chaves
+    if not parts:
+        yield node
+        return
+    head, rest = parts[0], parts[1:]
+    if head == "item":
+        if isinstance(node, list):
+            for x in node:
+                yield from _walk(x, rest)
+    elif isinstance(node, dict) and head in node:
+        yield from _walk(node[head], rest)
+
+
+def iter_items(stream, prefix: str, multiple_values: bool = False, use_float: bool = False,
+               size_hint: t.Optional[int] = None) -> t.Iterator[t.Any]:
+    if use_document_parser(size_hint, multiple_values):
+        doc = get_document_loads()(stream.read())
+        yield from _walk(doc, prefix.split(".") if prefix else [])
+        return
+    backend = get_stream_backend()
+    yield from backend.items(stream, prefix, multiple_values=multiple_values, use_float=use_float)
+
+
+def iter_kvitems(stream, prefix: str, use_float: bool = False,
+                 size_hint: t.Optional[int] = None) -> t.Iterator[t.Tuple[str, t.Any]]:
+    if use_document_parser(size_hint):
+        doc = get_document_loads()(stream.read())
+        for node in _walk(doc, prefix.split(".") if prefix else []):
+            if isinstance(node, dict):
+                yield from node.items()
+        return
+    backend = get_stream_backend()
+    yield from backend.kvitems(stream, prefix, use_float=use_float)
@@ -4,7 +4,7 @@ Backend Flask seguro para validação de licenças do CSGOEmpire Bot.
 Implementa JWT, rate limiting, logging avançado e todas as medidas de segurança.
 """
 
-from flask import Flask, request, jsonify, g
+from flask import Flask, request, jsonify, g, has_request_context
 import requests
 import os
 import logging
@@ -22,6 +22,14 @@ import threading
 import platform
 import subprocess
 import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import market_cache
+import market_names
+import market_opportunities
+import market_search
+import market_snapshot
+import upstream_http
 
 # Carrega variáveis de ambiente
 load_dotenv()
@@ -32,6 +40,9 @@ SUPABASE_ANON_KEY = os.getenv('SUPABASE_ANON_KEY')
 # Aceita SUPABASE_SERVICE_KEY ou SUPABASE_SERVICE_ROLE
 SUPABASE_SERVICE_KEY = os.getenv('SUPABASE_SERVICE_KEY') or os.getenv('SUPABASE_SERVICE_ROLE')
 MARKET_TABLE = os.getenv('SUPABASE_MARKET_TABLE', 'market_data')
+# Timeouts de leitura (s) das chamadas ao Supabase; conexão em UPSTREAM_CONNECT_TIMEOUT
+SUPABASE_REST_TIMEOUT = float(os.getenv('SUPABASE_REST_TIMEOUT', '10'))
+SUPABASE_FUNCTION_TIMEOUT = float(os.getenv('SUPABASE_FUNCTION_TIMEOUT', '30'))
 
 # JWT Configuration
 JWT_SECRET = os.getenv('JWT_SECRET', secrets.token_urlsafe(32))
@@ -76,9 +87,48 @@ request_cache = {}
 failed_attempts = {}  # IP: (count, last_attempt_time)
 MAX_FAILED_ATTEMPTS = 5
 BLOCK_DURATION = 1800  # 30 minutos
+# Com vários workers gunicorn o dict acima é por processo (até MAX x workers tentativas e o
+# bloqueio só vale no worker que contou). REDIS_URL compartilha o contador entre workers.
+REDIS_URL = os.getenv('REDIS_URL')
+REDIS_RETRY_SECONDS = 30
+_redis = None
+_redis_down_until = 0.0
+
+
+def _redis_client():
+    global _redis
+    if _redis is None:
+        import redis
+        _redis = redis.Redis.from_url(REDIS_URL, socket_timeout=0.5, socket_connect_timeout=0.5)
+    return _redis
+
+
+def _shared_attempts(ip: str, increment: bool) -> Optional[int]:
+    """Contador de falhas no Redis (expira BLOCK_DURATION após a última); None se indisponível."""
+    global _redis_down_until
+    if not REDIS_URL or time.time() < _redis_down_until:
+        return None
+    key = f"failed_attempts:{ip}"
+    try:
+        client = _redis_client()
+        if not increment:
+            return int(client.get(key) or 0)
+        pipe = client.pipeline()
+        pipe.incr(key)
+        pipe.expire(key, BLOCK_DURATION)
+        return int(pipe.execute()[0])
+    except Exception as e:
+        # Redis fora: contador do processo por REDIS_RETRY_SECONDS (sem timeout a cada requisição)
+        _redis_down_until = time.time() + REDIS_RETRY_SECONDS
+        logger.warning(f"Redis indisponível para failed_attempts: {e}")
+        return None
+
 
 def is_ip_blocked(ip: str) -> bool:
     """Verifica se um IP está bloqueado por tentativas falhadas."""
+    shared = _shared_attempts(ip, increment=False)
+    if shared is not None:
+        return shared >= MAX_FAILED_ATTEMPTS
     if ip not in failed_attempts:
         return False
     
@@ -94,18 +144,20 @@ def record_failed_attempt(ip: str):
     """Registra uma tentativa falhada."""
     current_time = time.time()
     
-    if ip in failed_attempts:
-        count, last_attempt = failed_attempts[ip]
-        if current_time - last_attempt > BLOCK_DURATION:
-            # Reset se passou o tempo de bloqueio
-            failed_attempts[ip] = (1, current_time)
+    count = _shared_attempts(ip, increment=True)
+    if count is None:
+        if ip in failed_attempts:
+            count, last_attempt = failed_attempts[ip]
+            if current_time - last_attempt > BLOCK_DURATION:
+                # Reset se passou o tempo de bloqueio
+                failed_attempts[ip] = (1, current_time)
+            else:
+                failed_attempts[ip] = (count + 1, current_time)
         else:
-            failed_attempts[ip] = (count + 1, current_time)
-    else:
-        failed_attempts[ip] = (1, current_time)
+            failed_attempts[ip] = (1, current_time)
+        count = failed_attempts[ip][0]
     
     # Log de tentativa falhada
-    count = failed_attempts[ip][0]
     if count >= MAX_FAILED_ATTEMPTS:
         log_security_event('ip_blocked', {
             'ip': ip,
@@ -114,42 +166,46 @@ def record_failed_attempt(ip: str):
         })
 
 # Headers de segurança
+SECURITY_HEADERS = {
+    'X-Content-Type-Options': 'nosniff',
+    'X-Frame-Options': 'DENY',
+    'X-XSS-Protection': '1; mode=block',
+    # HSTS - mais compatível
+    'Strict-Transport-Security': 'max-age=31536000',
+    # CSP mais permissivo para compatibilidade
+    'Content-Security-Policy': "default-src 'self'; script-src 'self' 'unsafe-inline'",
+    'Referrer-Policy': 'strict-origin-when-cross-origin',
+}
+NO_STORE_HEADERS = {'Cache-Control': 'no-store, no-cache, must-revalidate, max-age=0', 'Pragma': 'no-cache'}
+# Lookups de mercado revalidam por ETag; auth/licenças nunca são armazenados
+REVALIDATE_HEADERS = {'Cache-Control': 'private, no-cache'}
+
+def security_headers(revalidate: bool = False) -> Dict[str, str]:
+    return {**SECURITY_HEADERS, **(REVALIDATE_HEADERS if revalidate else NO_STORE_HEADERS)}
+
 @app.after_request
 def add_security_headers(response):
     """Adiciona headers de segurança."""
-    # Headers básicos de segurança
-    response.headers['X-Content-Type-Options'] = 'nosniff'
-    response.headers['X-Frame-Options'] = 'DENY'
-    response.headers['X-XSS-Protection'] = '1; mode=block'
-    
-    # HSTS - mais compatível
-    response.headers['Strict-Transport-Security'] = 'max-age=31536000'
-    
-    # CSP mais permissivo para compatibilidade
-    response.headers['Content-Security-Policy'] = "default-src 'self'; script-src 'self' 'unsafe-inline'"
-    
-    # Referrer Policy
-    response.headers['Referrer-Policy'] = 'strict-origin-when-cross-origin'
-    
-    # Cache Control
-    response.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, max-age=0'
-    response.headers['Pragma'] = 'no-cache'
+    revalidate = request.endpoint in MARKET_CACHEABLE_ENDPOINTS and response.status_code in (200, 304)
+    response.headers.update(security_headers(revalidate))
     
     # Server info (removido para segurança)
     response.headers.pop('Server', None)
     
     return response
 
-def log_security_event(event_type: str, details: Dict, ip: str = None):
-    """Log de eventos de segurança."""
+def log_security_event(event_type: str, details: Dict, ip: str = None, user_agent: str = None):
+    """Log de eventos de segurança (ip/user_agent vêm do request Flask se omitidos)."""
     if not ip:
-        ip = request.remote_addr or "unknown"
+        ip = (request.remote_addr if has_request_context() else None) or "unknown"
+    if not user_agent:
+        user_agent = request.headers.get('User-Agent', 'Unknown') if has_request_context() else 'Unknown'
     
     log_entry = {
         'timestamp': datetime.now(timezone.utc).isoformat(),
         'event_type': event_type,
         'ip_address': ip,
-        'user_agent': request.headers.get('User-Agent', 'Unknown'),
+        'user_agent': user_agent,
         'details': details
     }
     
@@ -161,9 +217,12 @@ def log_security_event(event_type: str, details: Dict, ip: str = None):
 
 def validate_api_key():
     """Valida a API key do backend."""
-    auth_header = request.headers.get('Authorization')
+    return check_api_key(request.headers.get('Authorization'))
+
+def check_api_key(auth_header: Optional[str], ip: str = None, user_agent: str = None) -> bool:
+    """Valida o header Authorization (compartilhado com o modo ASGI)."""
     if not auth_header or not auth_header.startswith('Bearer '):
-        log_security_event('invalid_auth', {'reason': 'missing_auth_header'})
+        log_security_event('invalid_auth', {'reason': 'missing_auth_header'}, ip, user_agent)
         logger.error(f"DEBUG: Header de autorização ausente ou inválido: {auth_header}")
         return False
     
@@ -173,7 +232,7 @@ def validate_api_key():
     logger.info(f"DEBUG: Comparação: {provided_key == API_KEY}")
     
     if provided_key != API_KEY:
-        log_security_event('invalid_auth', {'reason': 'invalid_api_key'})
+        log_security_event('invalid_auth', {'reason': 'invalid_api_key'}, ip, user_agent)
         logger.error(f"DEBUG: API key inválida - fornecida: {provided_key}, esperada: {API_KEY}")
         return False
     
@@ -238,23 +297,30 @@ def validate_input_data(data: Dict, required_fields: list) -> Tuple[bool, str]:
     
     return True, ""
 
+def _function_request(function_name: str) -> Optional[Tuple[str, Dict[str, str]]]:
+    """(url, headers) da edge function, ou None se o Supabase não está configurado."""
+    if not SUPABASE_URL or not SUPABASE_ANON_KEY:
+        logger.error("Supabase não configurado")
+        return None
+    url = f"{SUPABASE_URL}/functions/v1/{function_name}"
+    headers = {
+        "Authorization": f"Bearer {SUPABASE_ANON_KEY}",
+        "Content-Type": "application/json"
+    }
+    return url, headers
+
 def call_supabase_function(function_name: str, data: Dict) -> Optional[Dict]:
     """Chama função do Supabase com logging avançado."""
     try:
-        if not SUPABASE_URL or not SUPABASE_ANON_KEY:
-            logger.error("Supabase não configurado")
+        req = _function_request(function_name)
+        if not req:
             return None
-        
-        url = f"{SUPABASE_URL}/functions/v1/{function_name}"
-        headers = {
-            "Authorization": f"Bearer {SUPABASE_ANON_KEY}",
-            "Content-Type": "application/json"
-        }
+        url, headers = req
         
         # Log da requisição (sem dados sensíveis)
         logger.info(f"Chamando Supabase: {function_name} - Device: {data.get('device_id', '')[:8]}...")
         
-        response = requests.post(url, json=data, headers=headers, timeout=30)
+        response = upstream_http.post('functions', url, json=data, headers=headers, timeout=SUPABASE_FUNCTION_TIMEOUT)
         
         if response.status_code == 200:
             result = response.json()
@@ -267,34 +333,377 @@ def call_supabase_function(function_name: str, data: Dict) -> Optional[Dict]:
     except requests.exceptions.Timeout:
         logger.error(f"Timeout ao chamar Supabase: {function_name}")
         return None
+    except upstream_http.CircuitOpenError as e:
+        logger.warning(f"Supabase {function_name} indisponível: {e}")
+        return None
     except Exception as e:
         logger.error(f"Erro ao chamar Supabase: {e}")
         return None
 
 # ---------- Market lookup (server-side) ----------
 
-def _supabase_rest_get(table: str, params: Dict[str, str], select: str) -> Optional[Dict]:
+def _rest_request(table: str, params: Dict[str, str], select: str, limit: Optional[int] = None) -> Optional[Tuple[str, Dict[str, str]]]:
+    """(url, headers) de um GET no PostgREST, ou None se não configurado."""
     if not SUPABASE_URL or not SUPABASE_SERVICE_KEY:
         logger.error("Supabase REST não configurado (URL/SERVICE_KEY)")
         return None
+    import urllib.parse as up
+    base = f"{SUPABASE_URL.rstrip('/')}/rest/v1/{table}"
+    q = {**params, 'select': select}
+    if limit is not None:
+        q['limit'] = str(limit)
+    url = base + '?' + up.urlencode(q, safe='*,|().')
+    headers = {
+        'apikey': SUPABASE_SERVICE_KEY,
+        'Authorization': f"Bearer {SUPABASE_SERVICE_KEY}",
+    }
+    return url, headers
+
+
+# GETs idênticos concorrentes compartilham uma requisição (evita thundering herd)
+SUPABASE_SINGLEFLIGHT = os.getenv('SUPABASE_SINGLEFLIGHT', 'true').lower() in ('1', 'true', 'yes')
+rest_flights = upstream_http.SingleFlight('rest')
+
+
+def _supabase_rest_select(table: str, params: Dict[str, str], select: str, limit: Optional[int] = None) -> Optional[list]:
+    """GET no PostgREST; lista de linhas ou None em erro."""
+    req = _rest_request(table, params, select, limit)
+    if not req:
+        return None
+    url, headers = req
+
+    def fetch() -> Optional[list]:
+        try:
+            r = upstream_http.get('rest', url, headers=headers, timeout=SUPABASE_REST_TIMEOUT)
+            r.raise_for_status()
+            data = r.json()
+            return data if isinstance(data, list) else None
+        except upstream_http.CircuitOpenError:
+            # Falha rápida: quem chama cai no último valor bom
+            return None
+        except Exception as e:
+            logger.error(f"Supabase REST get error: {e}")
+            return None
+
+    # O resultado é compartilhado entre os chamadores: tratar como somente leitura
+    return rest_flights.do(url, fetch) if SUPABASE_SINGLEFLIGHT else fetch()
+
+
+def _supabase_rest_get(table: str, params: Dict[str, str], select: str) -> Optional[Dict]:
+    data = _supabase_rest_select(table, params, select, limit=1)
+    return data[0] if data else None
+
+
+def _pg_quote(value) -> str:
+    """Valor entre aspas para filtros do PostgREST (nomes têm vírgulas/parênteses)."""
+    return '"' + str(value).replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def _pg_in(values) -> str:
+    """Filtro in.(...) do PostgREST com valores entre aspas."""
+    return 'in.(' + ','.join(_pg_quote(v) for v in values) + ')'
+
+
+lookup_cache = market_cache.LookupCache()
+# Último valor bom por variante: resposta imediata (revalida em background) e fallback se o Supabase falhar
+last_good = market_cache.LastKnownGood()
+MARKET_STALE_WHILE_REVALIDATE = os.getenv('MARKET_STALE_WHILE_REVALIDATE', 'true').lower() in ('1', 'true', 'yes')
+MARKET_REFRESH_WORKERS = int(os.getenv('MARKET_REFRESH_WORKERS', '4'))
+
+# View de 006_market_lookup_view.sql: preços + liquidity_score em uma linha
+MARKET_LOOKUP_VIEW = os.getenv('SUPABASE_MARKET_LOOKUP_VIEW', 'market_lookup')
+MARKET_COLUMNS = 'item_key,name_base,stattrak,souvenir,condition,price_whitemarket,price_csfloat,price_buff163,highest_offer_buff163,liquidity_score'
+# Itens por POST /market/lookup/batch e chaves por query in.(...)/or=(...) (limite de tamanho de URL)
+MARKET_BATCH_MAX = int(os.getenv('MARKET_BATCH_MAX', '300'))
+MARKET_IN_CHUNK = int(os.getenv('MARKET_IN_CHUNK', '80'))
+MARKET_VARIANT_CHUNK = int(os.getenv('MARKET_VARIANT_CHUNK', '40'))
+# max-rows do PostgREST (Supabase: 1000): resposta desse tamanho pode ter sido truncada
+MARKET_LOOKUP_MAX_ROWS = int(os.getenv('MARKET_LOOKUP_MAX_ROWS', '1000'))
+
+
+def _market_generation() -> Optional[int]:
+    row = _supabase_rest_get('market_generation', {'id': 'eq.1'}, 'generation') or {}
+    gen = row.get('generation')
+    return int(gen) if gen is not None else None
+
+
+def _parse_variant(payload: Dict) -> market_cache.VariantKey:
+    return market_cache.variant_key(
+        str(payload.get('name_base') or '').strip(),
+        bool(payload.get('is_stattrak', False)),
+        bool(payload.get('is_souvenir', False)),
+        payload.get('condition') or None,
+    )
+
+
+def _parse_lookup(payload: Dict):
+    """Chave do lookup: item_key (str) direto ou a partir do market_hash_name, senão a variante.
+
+    O market_hash_name passa pelo mesmo parser dos fetchers (market_names.parse_name,
+    memoizado), com fase, como no item_key gravado pelo buff163.
+    """
+    item_key = str(payload.get('item_key') or '').strip()
+    if not item_key and payload.get('market_hash_name'):
+        item_key = market_names.parse_name(str(payload['market_hash_name']).strip(), with_phase=True).item_key
+    return item_key or _parse_variant(payload)
+
+
+def _valid_key(key) -> bool:
+    """item_key (str) não vazio ou variante (tupla) com name_base."""
+    if isinstance(key, str):
+        return bool(key)
+    return isinstance(key, tuple) and bool(key[0])
+
+
+def _snapshot_lookup(snap, key) -> Optional[Dict]:
+    return snap.lookup_item_key(key) if isinstance(key, str) else snap.lookup(key)
+
+
+def _market_fields(md: Dict) -> Dict:
+    return {
+        'price_whitemarket': md.get('price_whitemarket'),
+        'price_csfloat': md.get('price_csfloat'),
+        'price_buff163': md.get('price_buff163'),
+        'highest_offer_buff163': md.get('highest_offer_buff163'),
+        'liquidity_score': int(md.get('liquidity_score') or 0),
+    }
+
+
+def _variant_clause(key: market_cache.VariantKey) -> str:
+    name_base, stattrak, souvenir, condition = key
+    return (f"and(name_base.eq.{_pg_quote(name_base)},stattrak.eq.{str(stattrak).lower()},"
+            f"souvenir.eq.{str(souvenir).lower()},"
+            + (f"condition.eq.{_pg_quote(condition)})" if condition else "condition.is.null)"))
+
+
+def _lookup_chunks(keys) -> list:
+    """[(chaves do bloco, filtro)]: variantes exatas em or=(and(...),...) ou item_key in.(...).
+
+    Filtrar pela variante (e não por name_base in.(...)) mantém a resposta em poucas
+    linhas por chave; order=item_key deixa a variante sem fase primeiro.
+    """
+    item_keys = sorted({k for k in keys if isinstance(k, str)})
+    variants = sorted({k for k in keys if not isinstance(k, str)}, key=lambda k: (k[0], k[1], k[2], k[3] or ''))
+    return [
+        (variants[i:i + MARKET_VARIANT_CHUNK],
+         {'or': '(' + ','.join(_variant_clause(k) for k in variants[i:i + MARKET_VARIANT_CHUNK]) + ')', 'order': 'item_key'})
+        for i in range(0, len(variants), MARKET_VARIANT_CHUNK)
+    ] + [
+        (item_keys[i:i + MARKET_IN_CHUNK], {'item_key': _pg_in(item_keys[i:i + MARKET_IN_CHUNK])})
+        for i in range(0, len(item_keys), MARKET_IN_CHUNK)
+    ]
+
+
+def _collect_found(rows, wanted: set, found: Dict) -> None:
+    for md in rows or []:
+        item_key = md.get('item_key')
+        if not item_key:
+            continue
+        if item_key in wanted:
+            found[item_key] = _market_fields(md)
+        key = market_cache.variant_key(md.get('name_base') or '', md.get('stattrak'), md.get('souvenir'), md.get('condition'))
+        if key in wanted and key not in found:
+            found[key] = _market_fields(md)
+
+
+def _merge_lookup_pages(keys, chunks: list, pages: list) -> Tuple[Dict[market_cache.VariantKey, Dict], list]:
+    """(encontradas, chaves cujo bloco falhou no upstream)."""
+    wanted = set(keys)
+    found: Dict[market_cache.VariantKey, Dict] = {}
+    failed = []
+    for (chunk, _), rows in zip(chunks, pages):
+        # Resposta no teto do max-rows pode estar truncada: falha, não "não encontrado"
+        if rows is None or len(rows) >= MARKET_LOOKUP_MAX_ROWS:
+            if rows is not None:
+                logger.warning(f"market lookup: bloco de {len(chunk)} chaves atingiu {len(rows)} linhas")
+            failed.extend(chunk)
+        else:
+            _collect_found(rows, wanted, found)
+    return found, failed
+
+
+def _lookup_many(keys) -> Tuple[Dict[market_cache.VariantKey, Dict], list]:
+    """Resolve variantes com queries em conjunto na view de lookup."""
+    chunks = _lookup_chunks(keys)
+    pages = [_supabase_rest_select(MARKET_LOOKUP_VIEW, params, MARKET_COLUMNS, limit=MARKET_LOOKUP_MAX_ROWS)
+             for _, params in chunks]
+    return _merge_lookup_pages(keys, chunks, pages)
+
+
+def _store_lookups(keys, found: Dict[market_cache.VariantKey, Dict], failed=()) -> None:
+    """Atualiza cache e último valor bom; não encontradas (sem erro upstream) saem do fallback."""
+    failed = set(failed)
+    for key in keys:
+        if key in found:
+            lookup_cache.put(key, found[key])
+            last_good.put(key, found[key])
+        elif key not in failed:
+            last_good.discard(key)
+
+
+def _stale_fields(value: Dict, age: float) -> Dict:
+    return {**value, 'stale': True, 'stale_age_seconds': round(age, 1)}
+
+
+def _serve_stale(keys, resolved: Dict[market_cache.VariantKey, Dict]) -> list:
+    """Preenche resolved com o último valor bom das chaves que o têm; retorna as servidas."""
+    served = []
+    for key in keys:
+        stale = last_good.get(key)
+        if stale is not None:
+            resolved[key] = _stale_fields(*stale)
+            served.append(key)
+    return served
+
+
+def _revalidate(keys) -> None:
+    found, failed = {}, list(keys)
     try:
-        import urllib.parse as up
-        base = f"{SUPABASE_URL.rstrip('/')}/rest/v1/{table}"
-        q = {**params, 'select': select, 'limit': '1'}
-        url = base + '?' + up.urlencode(q, safe='*,|().')
-        headers = {
-            'apikey': SUPABASE_SERVICE_KEY,
-            'Authorization': f"Bearer {SUPABASE_SERVICE_KEY}",
-        }
-        r = requests.get(url, headers=headers, timeout=10)
-        r.raise_for_status()
-        data = r.json()
-        if isinstance(data, list) and data:
-            return data[0]
+        found, failed = _lookup_many(keys)
+        _store_lookups(keys, found, failed)
+    except Exception as e:
+        logger.error(f"market revalidate error: {e}")
+    finally:
+        failed = set(failed)
+        for key in keys:
+            last_good.end_refresh(key, key not in failed)
+
+
+_refresh_executor: Optional[ThreadPoolExecutor] = None
+_refresh_executor_pid: Optional[int] = None
+
+
+def _in_background(fn, *args) -> None:
+    """Executa fn fora da requisição."""
+    global _refresh_executor, _refresh_executor_pid
+    # Threads do pool não sobrevivem ao fork do gunicorn: um executor por processo
+    if _refresh_executor is None or _refresh_executor_pid != os.getpid():
+        _refresh_executor = ThreadPoolExecutor(max_workers=MARKET_REFRESH_WORKERS, thread_name_prefix='market-refresh')
+        _refresh_executor_pid = os.getpid()
+    _refresh_executor.submit(fn, *args)
+
+
+def _revalidate_in_background(keys) -> None:
+    """Revalida as chaves fora da requisição (uma revalidação em voo por chave)."""
+    keys = [k for k in keys if last_good.begin_refresh(k)]
+    if keys:
+        _in_background(_revalidate, keys)
+
+
+def _fetch_snapshot_page(offset: int, limit: int) -> Optional[list]:
+    return _supabase_rest_select(MARKET_LOOKUP_VIEW, {'order': 'item_key', 'offset': str(offset)}, MARKET_COLUMNS, limit=limit)
+
+
+# Índice de busca por name_base, atualizado a cada troca de snapshot
+search_index = market_search.SearchIndex()
+
+
+def _on_snapshot_swap(snap: market_snapshot.MarketSnapshot) -> None:
+    # O fallback REST também passa a refletir a nova geração
+    lookup_cache.set_generation(snap.generation)
+    if search_index.generation is None or search_index.generation != snap.generation:
+        changes = search_index.update(snap.variants(), snap.generation)
+        logger.info(f"market search: {changes} em {search_index.build_seconds:.2f}s")
+
+
+market_snapshots = market_snapshot.SnapshotStore(
+    _fetch_snapshot_page, _market_generation, on_swap=_on_snapshot_swap, logger=logger
+) if market_snapshot.SNAPSHOT_ENABLED else None
+
+
+def _current_snapshot() -> Optional[market_snapshot.MarketSnapshot]:
+    """Snapshot em memória pronto, ou None (desativado ou ainda carregando: usa cache + REST)."""
+    if market_snapshots is None:
         return None
+    market_snapshots.ensure_started()
+    return market_snapshots.current
+
+
+def warm_up() -> None:
+    """Carrega o snapshot de mercado antes de servir (gunicorn.conf.py chama no master com preload)."""
+    if market_snapshots is None:
+        return
+    t0 = time.time()
+    try:
+        market_snapshots.refresh_if_stale()
     except Exception as e:
-        logger.error(f"Supabase REST get error: {e}")
+        logger.error(f"warm-up: falha ao carregar snapshot: {e}")
+    logger.info(f"warm-up: snapshot {'pronto' if market_snapshots.current else 'indisponível'} em {time.time() - t0:.1f}s")
+
+
+# Respostas de mercado revalidáveis por ETag (demais endpoints seguem no-store)
+MARKET_CACHEABLE_ENDPOINTS = {'market_lookup', 'market_lookup_batch', 'list_opportunities'}
+
+
+def _snapshot_version(snap) -> str:
+    return str(snap.generation) if snap.generation is not None else f"t{int(snap.loaded_at)}"
+
+
+def _market_etag(version, key) -> Optional[str]:
+    """ETag forte: versão dos dados (geração) + chave da requisição."""
+    if version is None:
         return None
+    return hashlib.blake2b(f"{version}|{key!r}".encode('utf-8'), digest_size=16).hexdigest()
+
+
+def _not_modified(tag: Optional[str]):
+    if tag and request.if_none_match.contains(tag):
+        resp = app.response_class(status=304)
+        resp.set_etag(tag)
+        return resp
+    return None
+
+
+def _tagged(payload: Dict, tag: Optional[str]):
+    resp = jsonify(payload)
+    if tag:
+        resp.set_etag(tag)
+    return resp
+
+
+MARKET_KEY_REQUIRED = 'name_base, market_hash_name ou item_key obrigatório'
+
+
+def _lookup_filters(key) -> Dict[str, str]:
+    if isinstance(key, str):
+        # Índice único de item_key (o mesmo do upsert on_conflict=item_key)
+        return {'item_key': f'eq.{key}', 'order': 'item_key'}
+    name_base, stattrak, souvenir, condition = key
+    # Variante sem fase casa várias linhas (Doppler): order torna o limit=1 determinístico,
+    # o mesmo critério de _lookup_chunks
+    return {
+        'name_base': f'eq.{name_base}',
+        'stattrak': f'eq.{str(stattrak).lower()}',
+        'souvenir': f'eq.{str(souvenir).lower()}',
+        'condition': f'eq.{condition}' if condition else 'is.null',
+        'order': 'item_key',
+    }
+
+
+def _parse_batch(payload: Dict) -> Tuple[Optional[list], Optional[str]]:
+    """(chaves na ordem do request, erro)."""
+    items = payload.get('items')
+    if not isinstance(items, list) or not items:
+        return None, 'items obrigatório'
+    if len(items) > MARKET_BATCH_MAX:
+        return None, f'máximo de {MARKET_BATCH_MAX} itens por requisição'
+    return [_parse_lookup(it) if isinstance(it, dict) else None for it in items], None
+
+
+def _batch_payload(keys: list, resolved: Dict[market_cache.VariantKey, Dict], unavailable=()) -> Tuple[Dict, bool]:
+    """(corpo da resposta, todas as variantes válidas encontradas e atuais?)."""
+    results = []
+    complete = True
+    for key in keys:
+        if not _valid_key(key):
+            results.append({'found': False, 'error': MARKET_KEY_REQUIRED})
+        elif key in resolved:
+            results.append({'found': True, **resolved[key]})
+            complete = complete and not resolved[key].get('stale')
+        else:
+            results.append({'found': False, 'error': 'upstream_unavailable'} if key in unavailable else {'found': False})
+            complete = False
+    return {'ok': True, 'results': results}, complete
 
 
 @app.route('/market/lookup', methods=['POST'])
@@ -302,50 +711,232 @@ def _supabase_rest_get(table: str, params: Dict[str, str], select: str) -> Optio
 @limiter.limit("60 per minute")
 def market_lookup():
     """Resolve preços (fontes) e liquidez para um item/variante.
-    Body JSON: { name_base, is_stattrak, is_souvenir, condition }
+    Body JSON: { name_base, is_stattrak, is_souvenir, condition } | { market_hash_name } | { item_key }
     Retorna: { price_whitemarket, price_csfloat, price_buff163, highest_offer_buff163, liquidity_score }
+    (+ stale, stale_age_seconds quando vem do último valor bom; 503 se o Supabase falhar sem fallback)
     """
     try:
         payload = request.get_json(force=True) or {}
-        name_base = payload.get('name_base', '').strip()
-        is_st = str(bool(payload.get('is_stattrak', False))).lower()
-        is_sv = str(bool(payload.get('is_souvenir', False))).lower()
-        condition = payload.get('condition', '')
-        if not name_base:
-            return jsonify({'ok': False, 'error': 'name_base obrigatório'}), 400
-
-        # market_data row
-        md = _supabase_rest_get(
-            MARKET_TABLE,
-            {
-                'name_base': f'eq.{name_base}',
-                'stattrak': f'eq.{is_st}',
-                'souvenir': f'eq.{is_sv}',
-                'condition': f'eq.{condition}' if condition else 'is.null',
-            },
-            'item_key,name_base,stattrak,souvenir,condition,price_whitemarket,price_csfloat,price_buff163,highest_offer_buff163'
-        ) or {}
+        cache_key = _parse_lookup(payload)
+        if not _valid_key(cache_key):
+            return jsonify({'ok': False, 'error': MARKET_KEY_REQUIRED}), 400
 
-        item_key = md.get('item_key')
-        liq_score = 0
-        if item_key:
-            liq = _supabase_rest_get('liquidity', {'item_key': f'eq.{item_key}'}, 'liquidity_score') or {}
-            liq_score = int(liq.get('liquidity_score') or 0)
+        snap = _current_snapshot()
+        if snap is not None:
+            tag = _market_etag(_snapshot_version(snap), cache_key)
+            return _not_modified(tag) or _tagged({'ok': True, **(_snapshot_lookup(snap, cache_key) or _market_fields({}))}, tag)
 
-        resp = {
-            'ok': True,
-            'price_whitemarket': md.get('price_whitemarket'),
-            'price_csfloat': md.get('price_csfloat'),
-            'price_buff163': md.get('price_buff163'),
-            'highest_offer_buff163': md.get('highest_offer_buff163'),
-            'liquidity_score': liq_score,
-        }
-        return jsonify(resp)
+        lookup_cache.poll_generation(_market_generation)
+        # Fora do snapshot só itens encontrados recebem ETag (vazio pode ser erro upstream)
+        tag = _market_etag(lookup_cache.generation, cache_key)
+        not_modified = _not_modified(tag)
+        if not_modified:
+            return not_modified
+        cached = lookup_cache.get(cache_key)
+        if cached is not None:
+            return _tagged({'ok': True, **cached}, tag)
+
+        if MARKET_STALE_WHILE_REVALIDATE:
+            stale = last_good.get(cache_key)
+            if stale is not None:
+                _revalidate_in_background([cache_key])
+                return jsonify({'ok': True, **_stale_fields(*stale)})
+
+        # market_data + liquidity_score em um round-trip
+        rows = _supabase_rest_select(MARKET_LOOKUP_VIEW, _lookup_filters(cache_key), MARKET_COLUMNS, limit=1)
+        if rows is None:
+            # Erro upstream não vira preço nulo: último valor bom ou 503
+            stale = last_good.get(cache_key)
+            if stale is not None:
+                return jsonify({'ok': True, **_stale_fields(*stale)})
+            return jsonify({'ok': False, 'error': 'upstream_unavailable'}), 503
+
+        md = rows[0] if rows else {}
+        fields = _market_fields(md)
+        if md.get('item_key'):
+            _store_lookups([cache_key], {cache_key: fields})
+            return _tagged({'ok': True, **fields}, tag)
+        _store_lookups([cache_key], {})
+        return jsonify({'ok': True, **fields})
 
     except Exception as e:
         logger.error(f"market_lookup error: {e}")
         return jsonify({'ok': False, 'error': 'internal_error'}), 500
 
+@app.route('/market/lookup/batch', methods=['POST'])
+@require_auth
+@limiter.limit("30 per minute")
+def market_lookup_batch():
+    """Lookup de várias variantes em uma requisição.
+    Body JSON: { items: [ { name_base, is_stattrak, is_souvenir, condition } | { market_hash_name } | { item_key }, ... ] }
+    Retorna: { results: [ { found, price_*, highest_offer_buff163, liquidity_score } | { found: false } ] }
+    na mesma ordem de items. Valores do último valor bom vêm com stale/stale_age_seconds; variantes sem
+    fallback num bloco com erro upstream vêm com error: upstream_unavailable.
+    """
+    try:
+        keys, error = _parse_batch(request.get_json(force=True) or {})
+        if error:
+            return jsonify({'ok': False, 'error': error}), 400
+
+        resolved: Dict[market_cache.VariantKey, Dict] = {}
+        missing = []
+        snap = _current_snapshot()
+        if snap is not None:
+            tag = _market_etag(_snapshot_version(snap), keys)
+        else:
+            lookup_cache.poll_generation(_market_generation)
+            tag = _market_etag(lookup_cache.generation, keys)
+        not_modified = _not_modified(tag)
+        if not_modified:
+            return not_modified
+
+        if snap is not None:
+            for key in dict.fromkeys(k for k in keys if _valid_key(k)):
+                fields = _snapshot_lookup(snap, key)
+                if fields is not None:
+                    resolved[key] = fields
+        else:
+            for key in dict.fromkeys(k for k in keys if _valid_key(k)):
+                cached = lookup_cache.get(key)
+                if cached is not None:
+                    resolved[key] = cached
+                else:
+                    missing.append(key)
+        unavailable = set()
+        if missing and MARKET_STALE_WHILE_REVALIDATE:
+            served = _serve_stale(missing, resolved)
+            if served:
+                _revalidate_in_background(served)
+                missing = [k for k in missing if k not in resolved]
+        if missing:
+            fetched, failed = _lookup_many(missing)
+            _store_lookups(missing, fetched, failed)
+            resolved.update(fetched)
+            _serve_stale(failed, resolved)
+            unavailable = {k for k in failed if k not in resolved}
+
+        body, complete = _batch_payload(keys, resolved, unavailable)
+        # Fora do snapshot, not-found pode ser erro upstream: sem ETag nesse caso
+        return _tagged(body, tag if snap is not None or complete else None)
+
+    except Exception as e:
+        logger.error(f"market_lookup_batch error: {e}")
+        return jsonify({'ok': False, 'error': 'internal_error'}), 500
+
+@app.route('/market/cache/stats', methods=['GET'])
+@require_auth
+def market_cache_stats():
+    """Estatísticas do snapshot em memória, do cache de lookup (hits/misses/evicções/geração) e do último valor bom."""
+    snapshot = market_snapshots.stats() if market_snapshots is not None else {'enabled': False}
+    names = market_names.cache_info()
+    return jsonify({'ok': True, 'snapshot': snapshot, 'lookup_cache': lookup_cache.stats(), 'last_good': last_good.stats(),
+                    'name_cache': {'size': names.currsize, 'maxsize': names.maxsize, 'hits': names.hits, 'misses': names.misses},
+                    'search': search_index.stats(), 'opportunities': opportunity_board.stats()})
+
+def _fetch_opportunities(params: Dict[str, str], limit: int) -> Optional[list]:
+    return _supabase_rest_select(market_opportunities.OPPORTUNITIES_VIEW, params, market_opportunities.OPPORTUNITY_COLUMNS,
+                                 limit=limit)
+
+
+# Top-K de spreads entre mercados por geração (market_spreads_mv, 007_market_spreads.sql)
+opportunity_board = market_opportunities.OpportunityBoard(_fetch_opportunities)
+
+
+def _data_generation() -> Optional[int]:
+    snap = _current_snapshot()
+    if snap is not None:
+        return snap.generation
+    lookup_cache.poll_generation(_market_generation)
+    return lookup_cache.generation
+
+
+@app.route('/market/opportunities', methods=['GET'])
+@require_auth
+@limiter.limit("60 per minute")
+def list_opportunities():
+    """Melhores spreads entre mercados (comprar no menor ask, vender no maior ask/oferta das outras fontes).
+    Query: sort (weighted_score | spread_ratio | spread), limit, min_ratio, min_spread, min_liquidity,
+           min_price, max_price (preço de compra), buy_source, sell_source, stattrak, souvenir, condition
+    Retorna: { results: [ { item_key, name_base, ..., buy_source, buy_price, sell_source, sell_price,
+               spread, spread_ratio, liquidity_score, weighted_score } ] }
+    """
+    filters, error = market_opportunities.parse_filters(request.args)
+    if error:
+        return jsonify({'ok': False, 'error': error}), 400
+    sort = request.args.get('sort', 'weighted_score')
+    if sort not in market_opportunities.SORT_KEYS:
+        return jsonify({'ok': False, 'error': f"sort deve ser um de {', '.join(market_opportunities.SORT_KEYS)}"}), 400
+    try:
+        limit = max(1, min(int(request.args.get('limit', 50)), market_opportunities.OPPORTUNITIES_LIMIT_MAX))
+    except ValueError:
+        return jsonify({'ok': False, 'error': 'limit inválido'}), 400
+
+    try:
+        generation = _data_generation()
+        if not opportunity_board.is_current(generation):
+            if opportunity_board.ready:
+                # Serve o ranking anterior enquanto o da nova geração carrega
+                opportunity_board.refresh_in_background(generation, _in_background)
+            else:
+                opportunity_board.refresh(generation)
+
+        tag = _market_etag(opportunity_board.version, ('opportunities', request.query_string))
+        not_modified = _not_modified(tag)
+        if not_modified:
+            return not_modified
+        rows = opportunity_board.query(filters, sort, limit)
+        if rows is not None:
+            return _tagged({'ok': True, 'generation': opportunity_board.generation, 'sort': sort, 'results': rows}, tag)
+
+        # Filtros mais restritos que o pool em memória: consulta direta na MV (índices por ordenação)
+        rows = _supabase_rest_select(market_opportunities.OPPORTUNITIES_VIEW, market_opportunities.rest_params(filters, sort),
+                                     market_opportunities.OPPORTUNITY_COLUMNS, limit=limit)
+        if rows is None:
+            return jsonify({'ok': False, 'error': 'upstream_unavailable'}), 503
+        return jsonify({'ok': True, 'generation': generation, 'sort': sort, 'results': rows})
+
+    except Exception as e:
+        logger.error(f"market_opportunities error: {e}")
+        return jsonify({'ok': False, 'error': 'internal_error'}), 500
+
+@app.route('/market/search', methods=['GET'])
+@require_auth
+@limiter.limit("120 per minute")
+def search_market():
+    """Busca itens por name_base: exato, prefixo, prefixo de palavras e aproximada (trigramas).
+    Query: q (obrigatório), limit (padrão 20, máximo MARKET_SEARCH_LIMIT_MAX)
+    Retorna: { results: [ { name_base, score, match, variants: [ { is_stattrak, is_souvenir, condition } ] } ] }
+    (variants no formato do body de /market/lookup)
+    """
+    q = (request.args.get('q') or '').strip()
+    if not q or len(q) > 128:
+        return jsonify({'ok': False, 'error': 'q obrigatório (até 128 caracteres)'}), 400
+    try:
+        limit = int(request.args.get('limit', 20))
+    except ValueError:
+        return jsonify({'ok': False, 'error': 'limit inválido'}), 400
+
+    # O índice acompanha o snapshot (MARKET_SNAPSHOT); sem ele não há catálogo em memória
+    _current_snapshot()
+    if not search_index.ready:
+        return jsonify({'ok': False, 'error': 'índice de busca indisponível'}), 503
+    return jsonify({'ok': True, 'query': q, 'generation': search_index.generation,
+                    'results': search_index.search(q, limit)})
+
+@app.route('/upstream/metrics', methods=['GET'])
+@require_auth
+def upstream_metrics():
+    """Latência (p50/p99), erros e retries por upstream (rest, functions) e chamadas coalescidas."""
+    return jsonify({'ok': True, 'upstreams': upstream_http.metrics(), 'singleflight': upstream_http.singleflight_metrics()})
+
+@app.route('/upstream/status', methods=['GET'])
+@require_auth
+def upstream_status():
+    """Estado do circuit breaker por upstream (closed/open/half_open) e taxas da janela."""
+    breakers = upstream_http.breaker_states()
+    degraded = any(b['state'] != upstream_http.CircuitBreaker.CLOSED for b in breakers.values())
+    return jsonify({'ok': True, 'degraded': degraded, 'breakers': breakers})
+
 @app.route('/debug/config', methods=['GET'])
 def debug_config():
     """Endpoint de debug para verificar configuração (REMOVER EM PRODUÇÃO)."""
@@ -380,6 +971,88 @@ def health_check():
         'version': '1.0.0'
     })
 
+def _blocked_ip_response(client_ip: str, user_agent: str = None) -> Optional[Tuple[Dict, int]]:
+    if is_ip_blocked(client_ip):
+        log_security_event('blocked_ip_attempt', {'ip': client_ip}, client_ip, user_agent)
+        return {'ok': False, 'error': 'IP temporariamente bloqueado'}, 429
+    return None
+
+def _invalid_license_input(data: Dict, client_ip: str, user_agent: str = None) -> Optional[Tuple[Dict, int]]:
+    is_valid, error_msg = validate_input_data(data, ['license_key', 'device_id'])
+    if not is_valid:
+        record_failed_attempt(client_ip)
+        log_security_event('invalid_input', {'error': error_msg}, client_ip, user_agent)
+        return {'ok': False, 'error': error_msg}, 400
+    return None
+
+def _activation_response(license_key: str, device_id: str, result: Optional[Dict],
+                         client_ip: str, user_agent: str = None) -> Dict:
+    """Corpo da resposta de /activate a partir do resultado da edge function."""
+    if result and result.get('ok'):
+        # Gera JWT com dados da licença
+        jwt_payload = {
+            'license_key': license_key,
+            'device_id': device_id,
+            'expires_at': result.get('expires_at'),
+            'nickname': result.get('nickname', ''),
+            'type': 'license_activation'
+        }
+        
+        jwt_token = generate_jwt(jwt_payload)
+        
+        response_data = {
+            'ok': True,
+            'expires_at': result.get('expires_at'),
+            'nickname': result.get('nickname', ''),
+            'activated_at': result.get('activated_at', ''),
+            'jwt_token': jwt_token
+        }
+        
+        logger.info(f"Licença ativada com sucesso: {license_key[:8]}...")
+        return response_data
+    
+    record_failed_attempt(client_ip)
+    error_msg = result.get('error', 'Erro desconhecido') if result else 'Erro de conexão com Supabase'
+    log_security_event('failed_activation', {
+        'license_key': license_key[:8] + '...',
+        'device_id': device_id[:8] + '...',
+        'error': error_msg
+    }, client_ip, user_agent)
+    return {'ok': False, 'error': error_msg}
+
+def _validation_response(license_key: str, device_id: str, result: Optional[Dict],
+                         client_ip: str, user_agent: str = None) -> Dict:
+    """Corpo da resposta de /validate a partir do resultado da edge function."""
+    if result and result.get('ok'):
+        # Gera JWT com dados da validação
+        jwt_payload = {
+            'license_key': license_key,
+            'device_id': device_id,
+            'expires_at': result.get('expires_at'),
+            'type': 'license_validation',
+            'validated_at': datetime.now(timezone.utc).isoformat()
+        }
+        
+        jwt_token = generate_jwt(jwt_payload)
+        
+        response_data = {
+            'ok': True,
+            'expires_at': result.get('expires_at'),
+            'jwt_token': jwt_token
+        }
+        
+        logger.info(f"Licença válida: {license_key[:8]}...")
+        return response_data
+    
+    record_failed_attempt(client_ip)
+    reason = result.get('reason', 'desconhecido') if result else 'erro_conexao'
+    log_security_event('failed_validation', {
+        'license_key': license_key[:8] + '...',
+        'device_id': device_id[:8] + '...',
+        'reason': reason
+    }, client_ip, user_agent)
+    return {'ok': False, 'reason': reason}
+
 @app.route('/activate', methods=['POST'])
 @require_auth
 @limiter.limit("10 per minute")
@@ -388,17 +1061,15 @@ def activate_license():
     try:
         # Verifica se IP está bloqueado
         client_ip = request.remote_addr or "unknown"
-        if is_ip_blocked(client_ip):
-            log_security_event('blocked_ip_attempt', {'ip': client_ip})
-            return jsonify({'ok': False, 'error': 'IP temporariamente bloqueado'}), 429
+        blocked = _blocked_ip_response(client_ip)
+        if blocked:
+            return jsonify(blocked[0]), blocked[1]
         
         # Valida dados de entrada
         data = request.get_json()
-        is_valid, error_msg = validate_input_data(data, ['license_key', 'device_id'])
-        if not is_valid:
-            record_failed_attempt(client_ip)
-            log_security_event('invalid_input', {'error': error_msg})
-            return jsonify({'ok': False, 'error': error_msg}), 400
+        invalid = _invalid_license_input(data, client_ip)
+        if invalid:
+            return jsonify(invalid[0]), invalid[1]
         
         license_key = data['license_key']
         device_id = data['device_id']
@@ -411,38 +1082,7 @@ def activate_license():
             'license_key': license_key,
             'device_id': device_id
         })
-        
-        if result and result.get('ok'):
-            # Gera JWT com dados da licença
-            jwt_payload = {
-                'license_key': license_key,
-                'device_id': device_id,
-                'expires_at': result.get('expires_at'),
-                'nickname': result.get('nickname', ''),
-                'type': 'license_activation'
-            }
-            
-            jwt_token = generate_jwt(jwt_payload)
-            
-            response_data = {
-                'ok': True,
-                'expires_at': result.get('expires_at'),
-                'nickname': result.get('nickname', ''),
-                'activated_at': result.get('activated_at', ''),
-                'jwt_token': jwt_token
-            }
-            
-            logger.info(f"Licença ativada com sucesso: {license_key[:8]}...")
-            return jsonify(response_data)
-        else:
-            record_failed_attempt(client_ip)
-            error_msg = result.get('error', 'Erro desconhecido') if result else 'Erro de conexão com Supabase'
-            log_security_event('failed_activation', {
-                'license_key': license_key[:8] + '...',
-                'device_id': device_id[:8] + '...',
-                'error': error_msg
-            })
-            return jsonify({'ok': False, 'error': error_msg})
+        return jsonify(_activation_response(license_key, device_id, result, client_ip))
             
     except Exception as e:
         logger.error(f"Erro interno na ativação: {e}")
@@ -456,17 +1096,15 @@ def validate_license():
     try:
         # Verifica se IP está bloqueado
         client_ip = request.remote_addr or "unknown"
-        if is_ip_blocked(client_ip):
-            log_security_event('blocked_ip_attempt', {'ip': client_ip})
-            return jsonify({'ok': False, 'error': 'IP temporariamente bloqueado'}), 429
+        blocked = _blocked_ip_response(client_ip)
+        if blocked:
+            return jsonify(blocked[0]), blocked[1]
         
         # Valida dados de entrada
         data = request.get_json()
-        is_valid, error_msg = validate_input_data(data, ['license_key', 'device_id'])
-        if not is_valid:
-            record_failed_attempt(client_ip)
-            log_security_event('invalid_input', {'error': error_msg})
-            return jsonify({'ok': False, 'error': error_msg}), 400
+        invalid = _invalid_license_input(data, client_ip)
+        if invalid:
+            return jsonify(invalid[0]), invalid[1]
         
         license_key = data['license_key']
         device_id = data['device_id']
@@ -479,36 +1117,7 @@ def validate_license():
             'license_key': license_key,
             'device_id': device_id
         })
-        
-        if result and result.get('ok'):
-            # Gera JWT com dados da validação
-            jwt_payload = {
-                'license_key': license_key,
-                'device_id': device_id,
-                'expires_at': result.get('expires_at'),
-                'type': 'license_validation',
-                'validated_at': datetime.now(timezone.utc).isoformat()
-            }
-            
-            jwt_token = generate_jwt(jwt_payload)
-            
-            response_data = {
-                'ok': True,
-                'expires_at': result.get('expires_at'),
-                'jwt_token': jwt_token
-            }
-            
-            logger.info(f"Licença válida: {license_key[:8]}...")
-            return jsonify(response_data)
-        else:
-            record_failed_attempt(client_ip)
-            reason = result.get('reason', 'desconhecido') if result else 'erro_conexao'
-            log_security_event('failed_validation', {
-                'license_key': license_key[:8] + '...',
-                'device_id': device_id[:8] + '...',
-                'reason': reason
-            })
-            return jsonify({'ok': False, 'reason': reason})
+        return jsonify(_validation_response(license_key, device_id, result, client_ip))
             
     except Exception as e:
         logger.error(f"Erro interno na validação: {e}")
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cache em processo para /market/lookup.
+
+LRU limitado com TTL por entrada, chaveado pela variante
+(name_base, is_stattrak, is_souvenir, condition). Os dados só mudam quando o
+scheduler roda, então o cache também acompanha a geração publicada em
+public.market_generation (005_market_generation.sql): quando ela muda, todas
+as entradas são descartadas de uma vez.
+
+LastKnownGood guarda o último valor bom de cada variante independentemente de
+TTL e geração: serve de resposta imediata enquanto a revalidação roda em
+background e de fallback (marcado como stale) quando o Supabase falha.
+"""
+
+import os
+import time
+import threading
+import typing as t
+from collections import OrderedDict
+
+LOOKUP_CACHE_SIZE = int(os.environ.get("MARKET_CACHE_SIZE", "20000"))
+LOOKUP_CACHE_TTL = float(os.environ.get("MARKET_CACHE_TTL_SECONDS", "900"))
+GENERATION_POLL_SECONDS = float(os.environ.get("MARKET_GENERATION_POLL_SECONDS", "30"))
+STALE_CACHE_SIZE = int(os.environ.get("MARKET_STALE_CACHE_SIZE", "50000"))
+# Valores mais velhos que isso não são servidos nem como fallback
+STALE_MAX_AGE = float(os.environ.get("MARKET_STALE_MAX_AGE_SECONDS", "86400"))
+
+VariantKey = t.Tuple[str, bool, bool, t.Optional[str]]
+
+
+def variant_key(name_base: str, stattrak: bool, souvenir: bool, condition: t.Optional[str]) -> VariantKey:
+    return (name_base, bool(stattrak), bool(souvenir), condition or None)
+
+
+class LookupCache:
+    def __init__(self, maxsize: int = LOOKUP_CACHE_SIZE, ttl: float = LOOKUP_CACHE_TTL,
+                 poll_seconds: float = GENERATION_POLL_SECONDS):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.poll_seconds = poll_seconds
+        self.generation: t.Optional[int] = None
+        self._data: "OrderedDict[t.Hashable, t.Tuple[float, t.Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._poll_lock = threading.Lock()
+        self._next_poll = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        """Valor em cache ou None (ausente/expirado)."""
+        if self.maxsize <= 0:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at <= now:
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def set_generation(self, generation: t.Optional[int]) -> bool:
+        """Registra a geração atual; descarta tudo se ela mudou. Retorna True se mudou."""
+        if generation is None:
+            return False
+        with self._lock:
+            if generation == self.generation:
+                return False
+            if self.generation is not None:
+                self.invalidations += 1
+            self.generation = generation
+            self._data.clear()
+            return True
+
+    def begin_poll(self) -> bool:
+        """True se o chamador deve consultar a geração agora (no máximo uma vez a cada poll_seconds)."""
+        if time.monotonic() < self._next_poll:
+            return False
+        with self._poll_lock:
+            now = time.monotonic()
+            if now < self._next_poll:
+                return False
+            self._next_poll = now + self.poll_seconds
+            return True
+
+    def poll_generation(self, fetch: t.Callable[[], t.Optional[int]]) -> None:
+        """Consulta a geração via fetch() se o intervalo de poll venceu."""
+        if self.begin_poll():
+            self.set_generation(fetch())
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl_seconds": self.ttl,
+                "generation": self.generation,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+
+class LastKnownGood:
+    """Último valor bom por chave (LRU), com idade e controle de revalidação em voo."""
+
+    def __init__(self, maxsize: int = STALE_CACHE_SIZE, max_age: float = STALE_MAX_AGE):
+        self.maxsize = maxsize
+        self.max_age = max_age
+        self._data: "OrderedDict[t.Hashable, t.Tuple[float, t.Any]]" = OrderedDict()
+        self._refreshing: t.Set[t.Hashable] = set()
+        self._lock = threading.Lock()
+        self.served = 0
+        self.refreshes = 0
+        self.refresh_failures = 0
+
+    def get(self, key) -> t.Optional[t.Tuple[t.Any, float]]:
+        """(valor, idade em segundos) ou None."""
+        if self.maxsize <= 0:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            stored_at, value = entry
+            if now - stored_at > self.max_age:
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            self.served += 1
+            return value, now - stored_at
+
+    def put(self, key, value) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def discard(self, key) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def begin_refresh(self, key) -> bool:
+        """True se o chamador deve revalidar a chave (nenhuma revalidação em voo)."""
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            self.refreshes += 1
+            return True
+
+    def end_refresh(self, key, ok: bool = True) -> None:
+        with self._lock:
+            self._refreshing.discard(key)
+            if not ok:
+                self.refresh_failures += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "max_age_seconds": self.max_age,
+                "served_stale": self.served,
+                "refreshes": self.refreshes,
+                "refresh_failures": self.refresh_failures,
+                "refreshing": len(self._refreshing),
+            }
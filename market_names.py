@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Normalização de market_hash_name compartilhada pelos fetchers (e pelo backend).
+
+Um único parser (tabela de sufixos + regex pré-compilada) devolve
+(name_base, stattrak, souvenir, condition, phase, item_key), com cache LRU
+limitado: os mesmos nomes aparecem nas três fontes a cada run, então quase
+tudo vira hit de dict.
+"""
+
+import os
+import re
+import typing as t
+from functools import lru_cache
+
+CONDITION_NAMES = [
+    "Factory New",
+    "Minimal Wear",
+    "Field-Tested",
+    "Well-Worn",
+    "Battle-Scarred",
+]
+
+PHASE_TOKENS = [
+    "Ruby", "Sapphire", "Black Pearl", "Emerald",
+    "Phase 1", "Phase 2", "Phase 3", "Phase 4",
+]
+
+NAME_CACHE_SIZE = int(os.environ.get("NAME_CACHE_SIZE", "131072"))
+
+# Tabela de sufixo: "(Factory New)" -> "Factory New"
+_CONDITION_SUFFIX = {f"({c})": c for c in CONDITION_NAMES}
+_PREFIX_RE = re.compile(r"StatTrak™ |StatTrak |Souvenir ")
+# Case sensitive, como a nomenclatura do CS
+_PHASE_RE = re.compile("|".join(map(re.escape, PHASE_TOKENS)))
+
+
+class ParsedName(t.NamedTuple):
+    name_base: str
+    stattrak: bool
+    souvenir: bool
+    condition: t.Optional[str]
+    phase: t.Optional[str]
+    item_key: str
+
+
+def build_item_key(name_base: str, stattrak: bool, souvenir: bool, condition: t.Optional[str], phase: t.Optional[str]) -> str:
+    parts = [
+        name_base or "",
+        ("StatTrak" if stattrak else ""),
+        ("Souvenir" if souvenir else ""),
+        condition or "",
+        phase or "",
+    ]
+    # keep a technical key without special symbols; join with pipe and collapse empties
+    return "|".join([p for p in parts if p]).strip()
+
+
+@lru_cache(maxsize=NAME_CACHE_SIZE)
+def parse_name(name: str, with_phase: bool = False) -> ParsedName:
+    """Parse completo e memoizado. with_phase=True inclui a fase (Doppler/Gamma Doppler) no item_key."""
+    if not name:
+        return ParsedName("", False, False, None, None, "")
+    s = name
+    stattrak = "StatTrak" in s
+    souvenir = "Souvenir" in s
+    condition = None
+    if s.endswith(")"):
+        i = s.rfind("(")
+        condition = _CONDITION_SUFFIX.get(s[i:]) if i >= 0 else None
+        if condition:
+            s = s[:i].strip()
+    base = _PREFIX_RE.sub("", s).strip() if (stattrak or souvenir) else s.strip()
+    phase = None
+    # Fase só existe em Doppler/Gamma Doppler; "Emerald Pinstripe" ou "Sapphire" em
+    # outras skins são parte do nome, não fase
+    if with_phase and "Doppler" in base:
+        pm = _PHASE_RE.search(name)
+        phase = pm.group(0) if pm else None
+    return ParsedName(base, stattrak, souvenir, condition, phase, build_item_key(base, stattrak, souvenir, condition, phase))
+
+
+def parse_market_hash_name(name: str) -> t.Tuple[str, bool, bool, t.Optional[str]]:
+    p = parse_name(name)
+    return p.name_base, p.stattrak, p.souvenir, p.condition
+
+
+def detect_phase(name: str) -> t.Optional[str]:
+    return parse_name(name, True).phase
+
+
+def cache_info():
+    return parse_name.cache_info()
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Ranking de oportunidades entre mercados para GET /market/opportunities.
+
+Os spreads por item são calculados no banco a cada refresh do scheduler
+(market_spreads_mv, 007_market_spreads.sql). O processo web guarda, por
+geração, o top OPPORTUNITIES_POOL de cada ordenação e filtra em memória; só
+quando os filtros esvaziam o pool a consulta vai direto à MV.
+"""
+
+import os
+import time
+import threading
+import typing as t
+
+OPPORTUNITIES_VIEW = os.environ.get("SUPABASE_MARKET_SPREADS_VIEW", "market_spreads_mv")
+OPPORTUNITIES_POOL = int(os.environ.get("MARKET_OPPORTUNITIES_POOL", "1000"))
+OPPORTUNITIES_LIMIT_MAX = int(os.environ.get("MARKET_OPPORTUNITIES_LIMIT_MAX", "200"))
+# Sem geração publicada (migração 005 ausente), recarrega por idade
+OPPORTUNITIES_MAX_AGE = float(os.environ.get("MARKET_OPPORTUNITIES_MAX_AGE_SECONDS", "900"))
+# Após uma recarga falha, requisições não disparam outra antes desse intervalo
+OPPORTUNITIES_RETRY_SECONDS = float(os.environ.get("MARKET_OPPORTUNITIES_RETRY_SECONDS", "30"))
+OPPORTUNITY_COLUMNS = ("item_key,name_base,stattrak,souvenir,condition,buy_source,buy_price,sell_source,sell_price,"
+                       "spread,spread_ratio,liquidity_score,weighted_score")
+
+SORT_KEYS = ("weighted_score", "spread_ratio", "spread")
+SOURCES = {"whitemarket", "csfloat", "buff163", "buff163_bid"}
+
+# parâmetro da query -> (coluna, operador)
+_NUMERIC_FILTERS = {
+    "min_ratio": ("spread_ratio", "gte"),
+    "min_spread": ("spread", "gte"),
+    "min_liquidity": ("liquidity_score", "gte"),
+    "min_price": ("buy_price", "gte"),
+    "max_price": ("buy_price", "lte"),
+}
+_BOOL_FILTERS = {"stattrak": "stattrak", "souvenir": "souvenir"}
+
+
+class Filters(t.NamedTuple):
+    numeric: t.Tuple[t.Tuple[str, str, float], ...]  # (coluna, gte/lte, valor)
+    equals: t.Tuple[t.Tuple[str, t.Any], ...]  # (coluna, valor)
+
+
+def parse_filters(args: t.Mapping[str, str]) -> t.Tuple[t.Optional[Filters], t.Optional[str]]:
+    """(filtros, erro) a partir dos parâmetros da query."""
+    numeric = []
+    for param, (column, op) in _NUMERIC_FILTERS.items():
+        raw = args.get(param)
+        if raw in (None, ""):
+            continue
+        try:
+            numeric.append((column, op, float(raw)))
+        except ValueError:
+            return None, f"{param} inválido"
+    equals: t.List[t.Tuple[str, t.Any]] = []
+    for param in ("buy_source", "sell_source"):
+        raw = args.get(param)
+        if raw:
+            if raw not in SOURCES:
+                return None, f"{param} deve ser um de {', '.join(sorted(SOURCES))}"
+            equals.append((param, raw))
+    for param, column in _BOOL_FILTERS.items():
+        raw = (args.get(param) or "").lower()
+        if raw:
+            if raw not in ("true", "false", "1", "0"):
+                return None, f"{param} deve ser true/false"
+            equals.append((column, raw in ("true", "1")))
+    if args.get("condition"):
+        equals.append(("condition", args["condition"]))
+    return Filters(tuple(numeric), tuple(equals)), None
+
+
+def matches(row: dict, f: Filters) -> bool:
+    for column, op, value in f.numeric:
+        v = row.get(column)
+        if v is None or (v < value if op == "gte" else v > value):
+            return False
+    return all(row.get(column) == value for column, value in f.equals)
+
+
+def _pg_quote(value) -> str:
+    """Valor entre aspas para filtros do PostgREST (mesmo escape do license_backend)."""
+    return '"' + str(value).replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def rest_params(f: Filters, sort: str) -> t.Dict[str, str]:
+    """Filtros PostgREST equivalentes (fallback direto na MV)."""
+    clauses = [f"{column}.{op}.{value}" for column, op, value in f.numeric]
+    for column, value in f.equals:
+        if isinstance(value, bool):
+            clauses.append(f"{column}.eq.{str(value).lower()}")
+        else:
+            clauses.append(f"{column}.eq.{_pg_quote(value)}")
+    params = {"order": f"{sort}.desc.nullslast"}
+    if clauses:
+        params["and"] = f"({','.join(clauses)})"
+    return params
+
+
+class OpportunityBoard:
+    """Top OPPORTUNITIES_POOL por ordenação, recarregado quando a geração muda."""
+
+    def __init__(self, fetch: t.Callable[[t.Dict[str, str], int], t.Optional[list]], pool: int = OPPORTUNITIES_POOL):
+        self.fetch = fetch
+        self.pool = pool
+        self.generation: t.Optional[int] = None
+        self.loaded_at: t.Optional[float] = None
+        self.load_failures = 0
+        self.pool_hits = 0
+        self.pool_misses = 0
+        self._boards: t.Dict[str, list] = {}
+        self._lock = threading.Lock()
+        self._scheduled = False
+        self._retry_at = 0.0
+        self._schedule_lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self.loaded_at is not None
+
+    @property
+    def version(self) -> t.Optional[str]:
+        """Versão do conteúdo servido (para ETag)."""
+        if not self.ready:
+            return None
+        return str(self.generation) if self.generation is not None else f"t{int(self.loaded_at)}"
+
+    def is_current(self, generation: t.Optional[int]) -> bool:
+        if not self.ready:
+            return False
+        if generation is None:
+            return time.time() - self.loaded_at <= OPPORTUNITIES_MAX_AGE
+        return generation == self.generation
+
+    def refresh(self, generation: t.Optional[int]) -> bool:
+        """Carrega os pools da geração; mantém os anteriores se alguma consulta falhar."""
+        if not self._lock.acquire(blocking=False):
+            return False
+        try:
+            if self.is_current(generation):
+                return True
+            boards = {}
+            for sort in SORT_KEYS:
+                rows = self.fetch({"order": f"{sort}.desc.nullslast"}, self.pool)
+                if rows is None:
+                    self.load_failures += 1
+                    self._retry_at = time.time() + OPPORTUNITIES_RETRY_SECONDS
+                    return False
+                boards[sort] = rows
+            self._boards = boards
+            self.generation = generation
+            self.loaded_at = time.time()
+            return True
+        finally:
+            self._lock.release()
+
+    def refresh_in_background(self, generation: t.Optional[int], submit: t.Callable) -> bool:
+        """Agenda refresh(generation) via submit(fn, *args): no máximo um agendado por vez
+        e, depois de uma falha, nenhum antes de OPPORTUNITIES_RETRY_SECONDS."""
+        with self._schedule_lock:
+            if self._scheduled or time.time() < self._retry_at:
+                return False
+            self._scheduled = True
+        try:
+            submit(self._run_scheduled, generation)
+        except Exception:
+            self._scheduled = False
+            raise
+        return True
+
+    def _run_scheduled(self, generation: t.Optional[int]) -> bool:
+        try:
+            return self.refresh(generation)
+        finally:
+            self._scheduled = False
+
+    def query(self, f: Filters, sort: str, limit: int) -> t.Optional[list]:
+        """Top `limit` filtrado do pool, ou None se o pool não garante o resultado."""
+        rows = self._boards.get(sort)
+        if rows is None:
+            return None
+        out = []
+        for row in rows:
+            if matches(row, f):
+                out.append(row)
+                if len(out) >= limit:
+                    self.pool_hits += 1
+                    return out
+        # Pool incompleto (a MV tem mais linhas que ele): o resto pode estar fora
+        if len(rows) >= self.pool:
+            self.pool_misses += 1
+            return None
+        self.pool_hits += 1
+        return out
+
+    def stats(self) -> dict:
+        return {
+            "ready": self.ready,
+            "generation": self.generation,
+            "pool": self.pool,
+            "rows": {sort: len(rows) for sort, rows in self._boards.items()},
+            "age_seconds": round(time.time() - self.loaded_at, 1) if self.loaded_at else None,
+            "pool_hits": self.pool_hits,
+            "pool_misses": self.pool_misses,
+            "load_failures": self.load_failures,
+        }
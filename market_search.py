@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Índice de busca em memória sobre os name_base do market_data (/market/search).
+
+Cada name_base normalizado (casefold, sem ★/™, espaços colapsados) entra em
+três estruturas:
+
+- lista ordenada de nomes: busca por prefixo com bisect;
+- palavras por nome (" tok1 tok2"): casamento por prefixo de palavra
+  ("karam dopp") vira busca de substring " karam";
+- postings de trigramas: candidatos para busca aproximada (erros de digitação),
+  ranqueados por similaridade de Dice. Postings com mais de _MASK_MIN_IDS ids
+  guardam também um bitmask, e a contagem de trigramas em comum é feita com
+  operações sobre inteiros grandes em vez de um Counter sobre ~1000 ids por
+  trigrama.
+
+Latência (benchmarks/bench_search.py, catálogo sintético de ~25k nomes, 1 vCPU):
+p50 ~0.4ms, p99 ~0.65-0.9ms.
+
+O índice é atualizado de forma incremental quando o snapshot troca de geração:
+só nomes novos ou removidos mexem nos postings. Leitores não usam lock: os
+valores trocados são imutáveis (tuplas/frozensets/int) e a lista ordenada é
+substituída de uma vez.
+"""
+
+import os
+import re
+import time
+import bisect
+import threading
+import typing as t
+from collections import defaultdict
+
+from market_cache import VariantKey
+
+SEARCH_LIMIT_MAX = int(os.environ.get("MARKET_SEARCH_LIMIT_MAX", "50"))
+# Similaridade mínima (Dice sobre trigramas) para resultados aproximados
+SEARCH_MIN_SIMILARITY = float(os.environ.get("MARKET_SEARCH_MIN_SIMILARITY", "0.35"))
+# Trigramas presentes em mais que essa fração dos nomes (" | ", "ak-"...) não geram candidatos
+SEARCH_COMMON_TRIGRAM = float(os.environ.get("MARKET_SEARCH_COMMON_TRIGRAM", "0.05"))
+# Só os N trigramas mais raros da consulta geram candidatos (custo limitado em consultas longas)
+SEARCH_MAX_TRIGRAMS = int(os.environ.get("MARKET_SEARCH_MAX_TRIGRAMS", "6"))
+
+_STRIP_RE = re.compile(r"[★™]")
+_SPACE_RE = re.compile(r"\s+")
+_TOKEN_RE = re.compile(r"[^\W_]+(?:-[^\W_]+)*")
+_NONZERO_BYTE = re.compile(rb"[^\x00]")
+# Postings com mais ids que isso guardam também o bitmask (os menores viram bitmask na consulta)
+_MASK_MIN_IDS = 64
+
+# Faixas de score por tipo de casamento (dentro da faixa, mais curto/mais similar vence)
+MATCH_SCORES = {"exact": 4.0, "prefix": 3.0, "word": 2.0, "fuzzy": 1.0}
+
+
+def normalize(s: str) -> str:
+    return _SPACE_RE.sub(" ", _STRIP_RE.sub("", s or "").casefold()).strip()
+
+
+def trigrams(norm: str) -> t.FrozenSet[str]:
+    padded = f"  {norm} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def _bitmask(ids: t.Iterable[int]) -> int:
+    ids = tuple(ids)
+    if not ids:
+        return 0
+    buf = bytearray((max(ids) >> 3) + 1)
+    for i in ids:
+        buf[i >> 3] |= 1 << (i & 7)
+    return int.from_bytes(buf, "little")
+
+
+def _bit_positions(mask: int, n: int) -> t.List[int]:
+    """Até n posições de bits ligados em mask, em ordem crescente."""
+    buf = mask.to_bytes((mask.bit_length() + 7) >> 3, "little")
+    out = []
+    # O regex pula os bytes zerados em C; só os bytes com bits ligados passam pelo loop
+    for m in _NONZERO_BYTE.finditer(buf):
+        byte, base = buf[m.start()], m.start() << 3
+        while byte:
+            low = byte & -byte
+            out.append(base + low.bit_length() - 1)
+            byte ^= low
+        if len(out) >= n:
+            return out[:n]
+    return out
+
+
+class _Entry(t.NamedTuple):
+    name_base: str
+    norm: str
+    words: str  # " " + tokens separados por espaço
+    grams: t.FrozenSet[str]
+
+
+class SearchIndex:
+    def __init__(self):
+        self.generation: t.Optional[int] = None
+        self.built_at: t.Optional[float] = None
+        self.build_seconds = 0.0
+        self.updates = 0
+        self._lock = threading.Lock()  # só escritores
+        self._ids: t.Dict[str, int] = {}  # name_base -> id
+        self._entries: t.List[t.Optional[_Entry]] = []  # id -> entrada (None = removida)
+        self._variants: t.Dict[int, t.Tuple[dict, ...]] = {}  # já no formato da resposta
+        self._postings: t.Dict[str, t.Tuple[int, ...]] = {}
+        self._masks: t.Dict[str, int] = {}  # bitmask (bit i = id i) dos postings grandes
+        self._sorted: t.List[t.Tuple[str, int]] = []  # (norm, id)
+        self._free: t.List[int] = []
+
+    @property
+    def ready(self) -> bool:
+        return self.built_at is not None
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def update(self, variants: t.Iterable[VariantKey], generation: t.Optional[int] = None) -> dict:
+        """Sincroniza com o conjunto completo de variantes; retorna {added, removed, names}."""
+        t0 = time.perf_counter()
+        by_name: t.Dict[str, t.List[VariantKey]] = defaultdict(list)
+        for key in variants:
+            if key[0]:
+                by_name[key[0]].append(key)
+        with self._lock:
+            added = [n for n in by_name if n not in self._ids]
+            removed = [n for n in self._ids if n not in by_name]
+            grams_added: t.Dict[str, t.List[int]] = defaultdict(list)
+            grams_removed: t.Dict[str, t.Set[int]] = defaultdict(set)
+
+            for name in removed:
+                i = self._ids.pop(name)
+                for g in self._entries[i].grams:
+                    grams_removed[g].add(i)
+                self._entries[i] = None
+                self._variants.pop(i, None)
+                self._free.append(i)
+            for name in added:
+                norm = normalize(name)
+                entry = _Entry(name, norm, "".join(" " + tok for tok in _TOKEN_RE.findall(norm)), trigrams(norm))
+                if self._free:
+                    i = self._free.pop()
+                    self._entries[i] = entry
+                else:
+                    i = len(self._entries)
+                    self._entries.append(entry)
+                self._ids[name] = i
+                for g in entry.grams:
+                    grams_added[g].append(i)
+
+            for g in set(grams_added) | set(grams_removed):
+                gone = grams_removed.get(g, ())
+                ids = [i for i in self._postings.get(g, ()) if i not in gone] + grams_added.get(g, [])
+                if ids:
+                    self._postings[g] = tuple(ids)
+                else:
+                    self._postings.pop(g, None)
+                if len(ids) > _MASK_MIN_IDS:
+                    self._masks[g] = _bitmask(ids)
+                else:
+                    self._masks.pop(g, None)
+
+            for name, keys in by_name.items():
+                keys.sort(key=lambda k: (k[1], k[2], k[3] or ""))
+                self._variants[self._ids[name]] = tuple(
+                    {"is_stattrak": k[1], "is_souvenir": k[2], "condition": k[3]} for k in keys
+                )
+            if added or removed:
+                self._sorted = sorted((e.norm, i) for i, e in enumerate(self._entries) if e is not None)
+            self.generation = generation
+            self.built_at = time.time()
+            self.build_seconds = time.perf_counter() - t0
+            self.updates += 1
+        return {"added": len(added), "removed": len(removed), "names": len(self._ids)}
+
+    def _prefix_ids(self, q: str, limit: int) -> t.List[int]:
+        ordered = self._sorted
+        start = bisect.bisect_left(ordered, (q, -1))
+        out = []
+        # Fatia limitada: ordered[start:] copiaria todo o sufixo da lista
+        for norm, i in ordered[start:start + limit]:
+            if not norm.startswith(q):
+                break
+            out.append(i)
+        return out
+
+    def _fuzzy_ids(self, grams: t.FrozenSet[str], limit: int) -> t.List[int]:
+        """Ids com mais trigramas em comum, contando só os trigramas mais raros da consulta.
+
+        A contagem é uma soma de bitmasks em planos de bits (planes[j] = bit j da contagem
+        de cada id): algumas operações sobre inteiros grandes por trigrama, em vez de um
+        Counter sobre os milhares de ids dos postings. Empates saem em ordem de id.
+        """
+        postings = self._postings
+        found = sorted((len(p), g) for g, p in zip(grams, map(postings.get, grams)) if p)
+        common = max(50, int(SEARCH_COMMON_TRIGRAM * len(self._ids)))
+        rare = ([g for n, g in found if n <= common] or [g for _, g in found[:2]])[:SEARCH_MAX_TRIGRAMS]
+        planes: t.List[int] = []
+        for g in rare:
+            m = self._masks.get(g)
+            if m is None:
+                m = _bitmask(postings.get(g, ()))
+            for j, plane in enumerate(planes):
+                planes[j], m = plane ^ m, plane & m
+                if not m:
+                    break
+            if m:
+                planes.append(m)
+        out: t.List[int] = []
+        for count in range(len(rare), 0, -1):
+            if count >> len(planes):
+                continue
+            level = -1
+            for j, plane in enumerate(planes):
+                level &= plane if count >> j & 1 else ~plane
+            if level:
+                out += _bit_positions(level, limit - len(out))
+                if len(out) >= limit:
+                    break
+        return out
+
+    def search(self, query: str, limit: int = 20) -> t.List[dict]:
+        """Resultados ranqueados: [{name_base, score, match, variants}]."""
+        q = normalize(query)
+        if not q:
+            return []
+        limit = max(1, min(limit, SEARCH_LIMIT_MAX))
+        entries = self._entries
+        n_entries = len(entries)
+        # " tok" em e.words <=> alguma palavra do nome começa com tok
+        q_words = [" " + tok for tok in _TOKEN_RE.findall(q)]
+        q_grams = trigrams(q)
+        n_grams = len(q_grams)
+        min_sim = SEARCH_MIN_SIMILARITY
+
+        candidates = set(self._prefix_ids(q, limit * 4))
+        # Prefixo sempre ranqueia acima de palavra/aproximado: com limit deles, não precisa de trigramas
+        if len(candidates) < limit:
+            candidates.update(self._fuzzy_ids(q_grams, limit * 3))
+
+        scored = []
+        for i in candidates:
+            e = entries[i] if i < n_entries else None
+            if e is None:
+                continue
+            name_base, norm, words, grams = e
+            sim = 2.0 * len(q_grams & grams) / (n_grams + len(grams))
+            if norm == q:
+                match = "exact"
+            elif norm.startswith(q):
+                match = "prefix"
+            elif q_words and all(w in words for w in q_words):
+                match = "word"
+            elif sim < min_sim:
+                continue
+            else:
+                match = "fuzzy"
+            scored.append((MATCH_SCORES[match] + sim, match, name_base, i))
+        scored.sort(key=lambda s: (-s[0], len(s[2]), s[2]))
+
+        variants = self._variants
+        return [
+            {
+                "name_base": name,
+                "score": round(score, 4),
+                "match": match,
+                "variants": list(variants.get(i, ())),
+            }
+            for score, match, name, i in scored[:limit]
+        ]
+
+    def stats(self) -> dict:
+        return {
+            "ready": self.ready,
+            "names": len(self._ids),
+            "trigrams": len(self._postings),
+            "generation": self.generation,
+            "updates": self.updates,
+            "build_seconds": round(self.build_seconds, 4),
+            "age_seconds": round(time.time() - self.built_at, 1) if self.built_at else None,
+        }
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Snapshot em memória de todo o market_lookup (preços + liquidity_score).
+
+São dezenas de milhares de linhas: o processo web carrega tudo, indexa por
+variante (name_base, stattrak, souvenir, condition) e por item_key, e responde
+/market/lookup sem tocar no Supabase. Uma thread em background consulta a
+geração publicada pelo scheduler (005_market_generation.sql) e, quando ela
+muda, carrega um snapshot novo e troca a referência de uma vez (leitores nunca
+veem um snapshot pela metade).
+
+Com MARKET_SNAPSHOT_FILE, o snapshot vive num arquivo binário mapeado com mmap
+(market_snapshot_file.py), compartilhado entre workers: quem encontra o
+arquivo desatualizado o regrava sob lock; os demais só mapeiam a nova versão.
+"""
+
+import os
+import time
+import threading
+import typing as t
+
+import market_snapshot_file
+from market_cache import VariantKey, variant_key
+
+SNAPSHOT_ENABLED = os.environ.get("MARKET_SNAPSHOT", "true").lower() in ("1", "true", "yes")
+# PostgREST do Supabase corta em max-rows (1000 por padrão)
+SNAPSHOT_PAGE_SIZE = int(os.environ.get("MARKET_SNAPSHOT_PAGE_SIZE", "1000"))
+# Sem geração disponível (migração 005 ausente), recarrega por idade
+SNAPSHOT_MAX_AGE = float(os.environ.get("MARKET_SNAPSHOT_MAX_AGE_SECONDS", "3600"))
+SNAPSHOT_POLL_SECONDS = float(os.environ.get("MARKET_GENERATION_POLL_SECONDS", "30"))
+# Caminho do snapshot binário compartilhado (vazio = snapshot em memória por processo)
+SNAPSHOT_FILE = os.environ.get("MARKET_SNAPSHOT_FILE", "")
+
+PRICE_FIELDS = ("price_whitemarket", "price_csfloat", "price_buff163", "highest_offer_buff163")
+
+
+class MarketSnapshot:
+    """Snapshot imutável. Linhas guardadas como tuplas (preços..., liquidity_score)."""
+
+    __slots__ = ("generation", "loaded_at", "load_seconds", "by_variant", "by_item_key")
+
+    def __init__(self, rows: t.Iterable[dict], generation: t.Optional[int] = None, load_seconds: float = 0.0):
+        self.generation = generation
+        self.loaded_at = time.time()
+        self.load_seconds = load_seconds
+        self.by_variant: t.Dict[VariantKey, tuple] = {}
+        self.by_item_key: t.Dict[str, tuple] = {}
+        for r in rows:
+            item_key = r.get("item_key")
+            if not item_key:
+                continue
+            rec = tuple(r.get(f) for f in PRICE_FIELDS) + (int(r.get("liquidity_score") or 0),)
+            self.by_item_key[item_key] = rec
+            key = variant_key(r.get("name_base") or "", r.get("stattrak"), r.get("souvenir"), r.get("condition"))
+            # Mesmo critério do limit=1 do REST: primeira linha vence
+            self.by_variant.setdefault(key, rec)
+
+    def __len__(self) -> int:
+        return len(self.by_item_key)
+
+    @property
+    def variant_count(self) -> int:
+        return len(self.by_variant)
+
+    @staticmethod
+    def fields(rec: tuple) -> dict:
+        out = dict(zip(PRICE_FIELDS, rec))
+        out["liquidity_score"] = rec[-1]
+        return out
+
+    def variants(self) -> t.Iterator[VariantKey]:
+        return iter(self.by_variant)
+
+    def lookup(self, key: VariantKey) -> t.Optional[dict]:
+        rec = self.by_variant.get(key)
+        return self.fields(rec) if rec is not None else None
+
+    def lookup_item_key(self, item_key: str) -> t.Optional[dict]:
+        rec = self.by_item_key.get(item_key)
+        return self.fields(rec) if rec is not None else None
+
+
+class SnapshotStore:
+    """Mantém o snapshot corrente e o recarrega em background quando a geração muda."""
+
+    def __init__(self, fetch_page: t.Callable[[int, int], t.Optional[list]],
+                 fetch_generation: t.Callable[[], t.Optional[int]],
+                 on_swap: t.Optional[t.Callable[[MarketSnapshot], None]] = None,
+                 page_size: int = SNAPSHOT_PAGE_SIZE, poll_seconds: float = SNAPSHOT_POLL_SECONDS,
+                 max_age: float = SNAPSHOT_MAX_AGE, file_path: str = SNAPSHOT_FILE, logger=None):
+        self.fetch_page = fetch_page
+        self.fetch_generation = fetch_generation
+        self.on_swap = on_swap
+        self.page_size = page_size
+        self.poll_seconds = poll_seconds
+        self.max_age = max_age
+        self.file_path = file_path
+        self.logger = logger
+        self.current = None  # MarketSnapshot | market_snapshot_file.MappedSnapshot
+        self.loads = 0
+        self.load_failures = 0
+        self.last_error: t.Optional[str] = None
+        self._lock = threading.Lock()
+        self._thread: t.Optional[threading.Thread] = None
+        self._pid: t.Optional[int] = None
+
+    def _log(self, level: str, msg: str) -> None:
+        if self.logger:
+            getattr(self.logger, level)(msg)
+        else:
+            print(msg)
+
+    def _fetch_rows(self) -> t.Optional[t.List[dict]]:
+        rows: t.List[dict] = []
+        offset = 0
+        while True:
+            page = self.fetch_page(offset, self.page_size)
+            if page is None:
+                self.load_failures += 1
+                self.last_error = f"falha na página offset={offset}"
+                self._log("error", f"market snapshot: {self.last_error}; mantendo snapshot anterior")
+                return None
+            if not page:
+                return rows
+            rows.extend(page)
+            # Avança pelo que veio: com max-rows do PostgREST abaixo de page_size uma página
+            # "curta" não é a última (parar nela truncaria o snapshot)
+            offset += len(page)
+
+    def _swap(self, snap) -> None:
+        self.current = snap
+        self.loads += 1
+        self.last_error = None
+        self._log("info", f"market snapshot: {len(snap)} itens (geração {snap.generation}) em {snap.load_seconds:.2f}s"
+                          f" [{'mmap' if isinstance(snap, market_snapshot_file.MappedSnapshot) else 'memória'}]")
+        if self.on_swap:
+            self.on_swap(snap)
+
+    def load(self, generation: t.Optional[int] = None):
+        """Carrega todas as páginas; só troca o snapshot se todas vierem sem erro."""
+        if self.file_path:
+            return self._load_into_file(generation)
+        t0 = time.perf_counter()
+        rows = self._fetch_rows()
+        if rows is None:
+            return None
+        snap = MarketSnapshot(rows, generation, time.perf_counter() - t0)
+        self._swap(snap)
+        return snap
+
+    def _file_is_current(self, generation: t.Optional[int]) -> bool:
+        valid, file_generation = market_snapshot_file.read_generation(self.file_path)
+        if not valid:
+            return False
+        if generation is not None:
+            return file_generation == generation
+        try:
+            return time.time() - os.path.getmtime(self.file_path) <= self.max_age
+        except OSError:
+            return False
+
+    def _map_file(self) -> bool:
+        """Mapeia o arquivo se ele for outra versão do que já está mapeado."""
+        cur = self.current
+        try:
+            st = os.stat(self.file_path)
+            if isinstance(cur, market_snapshot_file.MappedSnapshot) and \
+                    (cur.stat.st_ino, cur.stat.st_mtime_ns) == (st.st_ino, st.st_mtime_ns):
+                return True
+            self._swap(market_snapshot_file.MappedSnapshot(self.file_path))
+            return True
+        except (OSError, ValueError) as e:
+            self.last_error = str(e)
+            self._log("error", f"market snapshot: falha ao mapear {self.file_path}: {e}")
+            return False
+
+    def _load_into_file(self, generation: t.Optional[int]):
+        # Um worker por vez regrava o arquivo; os outros mapeiam no próximo poll
+        lock_file = None
+        os.makedirs(os.path.dirname(os.path.abspath(self.file_path)), exist_ok=True)
+        try:
+            import fcntl
+            lock_file = open(self.file_path + ".lock", "a+")
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return None
+        except ImportError:
+            pass
+        try:
+            if self._file_is_current(generation):
+                self._map_file()
+                return self.current
+            t0 = time.perf_counter()
+            rows = self._fetch_rows()
+            if rows is None:
+                return None
+            try:
+                market_snapshot_file.write_snapshot(self.file_path, rows, generation)
+            except OSError as e:
+                # Sem disco gravável: cai para o snapshot em memória deste processo
+                self._log("error", f"market snapshot: falha ao gravar {self.file_path}: {e}")
+                snap = MarketSnapshot(rows, generation, time.perf_counter() - t0)
+                self._swap(snap)
+                return snap
+            self._map_file()
+            return self.current
+        finally:
+            if lock_file is not None:
+                lock_file.close()
+
+    def refresh_if_stale(self) -> None:
+        generation = self.fetch_generation()
+        if self.file_path and self._file_is_current(generation) and self._map_file():
+            return
+        cur = self.current
+        if cur is None:
+            self.load(generation)
+        elif generation is not None and generation != cur.generation:
+            self.load(generation)
+        elif generation is None and time.time() - cur.loaded_at > self.max_age:
+            self.load(cur.generation)
+        elif self.file_path and not isinstance(cur, market_snapshot_file.MappedSnapshot):
+            # Snapshot em memória após falha de gravação: tenta voltar ao arquivo
+            self.load(generation)
+
+    def _loop(self) -> None:
+        while True:
+            try:
+                self.refresh_if_stale()
+            except Exception as e:
+                self.load_failures += 1
+                self.last_error = str(e)
+                self._log("error", f"market snapshot: erro no refresh: {e}")
+            time.sleep(self.poll_seconds)
+
+    def ensure_started(self) -> None:
+        """Inicia a thread de refresh neste processo (idempotente; seguro após fork)."""
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._lock:
+            if self._pid == pid:
+                return
+            self._thread = threading.Thread(target=self._loop, name="market-snapshot", daemon=True)
+            self._thread.start()
+            self._pid = pid
+
+    def stats(self) -> dict:
+        cur = self.current
+        return {
+            "enabled": True,
+            "ready": cur is not None,
+            "mode": ("mmap" if isinstance(cur, market_snapshot_file.MappedSnapshot) else "memory") if cur else None,
+            "file": self.file_path or None,
+            "items": len(cur) if cur else 0,
+            "variants": cur.variant_count if cur else 0,
+            "generation": cur.generation if cur else None,
+            "age_seconds": round(time.time() - cur.loaded_at, 1) if cur else None,
+            "load_seconds": round(cur.load_seconds, 3) if cur else None,
+            "loads": self.loads,
+            "load_failures": self.load_failures,
+            "last_error": self.last_error,
+        }
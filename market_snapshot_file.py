@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Arquivo binário de snapshot do market_lookup, compartilhado entre workers via mmap.
+
+Com vários workers gunicorn cada um teria sua própria cópia do snapshot em
+memória; com o arquivo mapeado read-only as páginas ficam no page cache e são
+compartilhadas (memória estável com o número de workers).
+
+Layout (little-endian, versão 2):
+
+    header   <8sIqIIId  magic, versão, geração (-1 = sem), n, variantes distintas, tamanho do blob,
+                        criado em (epoch)
+    records  n x <IHIHddddi  um por item_key, ordenados pela chave de variante (em empate, na ordem
+             de leitura: o primeiro de cada variante responde o lookup por variante):
+             (off, len) da chave de variante, (off, len) do item_key,
+             price_whitemarket, price_csfloat, price_buff163, highest_offer_buff163 (NaN = null),
+             liquidity_score
+    ik_index n x <I      índices de records ordenados por item_key
+    blob     strings utf-8
+
+Chave de variante: name_base \\x1f stattrak souvenir (0/1) \\x1f condition.
+Novas versões são gravadas em <path>.tmp e trocadas com os.replace (atômico);
+quem já mapeou a versão anterior continua lendo o inode antigo.
+"""
+
+import os
+import math
+import mmap
+import time
+import struct
+import typing as t
+
+from market_cache import VariantKey, variant_key
+
+MAGIC = b"MKTSNAP\0"
+VERSION = 2
+HEADER = struct.Struct("<8sIqIIId")
+RECORD = struct.Struct("<IHIHddddi")
+INDEX = struct.Struct("<I")
+PRICE_FIELDS = ("price_whitemarket", "price_csfloat", "price_buff163", "highest_offer_buff163")
+NAN = float("nan")
+
+
+def encode_variant(key: VariantKey) -> bytes:
+    name_base, stattrak, souvenir, condition = key
+    return f"{name_base}\x1f{int(bool(stattrak))}{int(bool(souvenir))}\x1f{condition or ''}".encode("utf-8")
+
+
+def decode_variant(raw: bytes) -> VariantKey:
+    name_base, flags, condition = raw.decode("utf-8").split("\x1f")
+    return name_base, flags[0] == "1", flags[1] == "1", condition or None
+
+
+def _price(v) -> float:
+    try:
+        return float(v) if v is not None else NAN
+    except (TypeError, ValueError):
+        return NAN
+
+
+def write_snapshot(path: str, rows: t.Iterable[dict], generation: t.Optional[int] = None) -> int:
+    """Grava o snapshot (tmp + rename atômico). Retorna o número de registros."""
+    by_item_key: t.Dict[str, dict] = {}
+    for r in rows:
+        if r.get("item_key"):
+            by_item_key[str(r["item_key"])] = r
+    # Mesmo critério do snapshot em memória: todas as linhas no índice de item_key,
+    # primeira linha da variante no lookup por variante (sort estável)
+    entries = sorted(
+        ((encode_variant(variant_key(r.get("name_base") or "", r.get("stattrak"), r.get("souvenir"), r.get("condition"))),
+          ik, r) for ik, r in by_item_key.items()),
+        key=lambda e: e[0],
+    )
+
+    blob = bytearray()
+    records = []
+    item_keys = []
+    variants = 0
+    prev = None
+    for i, (key, ik, r) in enumerate(entries):
+        if key != prev:
+            variants += 1
+            prev = key
+        ik = ik.encode("utf-8")
+        key_off = len(blob)
+        blob += key
+        ik_off = len(blob)
+        blob += ik
+        item_keys.append((ik, i))
+        records.append(RECORD.pack(
+            key_off, len(key), ik_off, len(ik),
+            *(_price(r.get(f)) for f in PRICE_FIELDS),
+            int(r.get("liquidity_score") or 0),
+        ))
+    item_keys.sort()
+
+    tmp = f"{path}.tmp.{os.getpid()}"
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(tmp, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, -1 if generation is None else int(generation),
+                            len(entries), variants, len(blob), time.time()))
+        f.write(b"".join(records))
+        f.write(b"".join(INDEX.pack(i) for _, i in item_keys))
+        f.write(blob)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return len(entries)
+
+
+def read_generation(path: str) -> t.Tuple[bool, t.Optional[int]]:
+    """(arquivo válido?, geração) lendo só o header."""
+    try:
+        with open(path, "rb") as f:
+            head = f.read(HEADER.size)
+    except OSError:
+        return False, None
+    if len(head) < HEADER.size:
+        return False, None
+    magic, version, generation = HEADER.unpack(head)[:3]
+    if magic != MAGIC or version != VERSION:
+        return False, None
+    return True, (None if generation < 0 else generation)
+
+
+class MappedSnapshot:
+    """Snapshot lido direto do arquivo mapeado (mesma interface de MarketSnapshot)."""
+
+    def __init__(self, path: str):
+        t0 = time.perf_counter()
+        with open(path, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.stat = os.fstat(f.fileno())
+        magic, version, generation, count, variants, blob_size, created_at = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC or version != VERSION:
+            self.mm.close()
+            raise ValueError(f"snapshot inválido ou de outra versão: {path}")
+        self.path = path
+        self.generation = None if generation < 0 else generation
+        self.count = count
+        self._variant_count = variants
+        self.created_at = created_at
+        self.loaded_at = time.time()
+        self._records = HEADER.size
+        self._index = self._records + count * RECORD.size
+        self._blob = self._index + count * INDEX.size
+        if self._blob + blob_size > len(self.mm):
+            self.mm.close()
+            raise ValueError(f"snapshot truncado: {path}")
+        self.load_seconds = time.perf_counter() - t0
+
+    def __len__(self) -> int:
+        return self.count
+
+    @property
+    def variant_count(self) -> int:
+        return self._variant_count
+
+    def _record(self, i: int) -> tuple:
+        return RECORD.unpack_from(self.mm, self._records + i * RECORD.size)
+
+    def _str(self, off: int, length: int) -> bytes:
+        start = self._blob + off
+        return self.mm[start:start + length]
+
+    @staticmethod
+    def fields(rec: tuple) -> dict:
+        out = {f: (None if math.isnan(v) else v) for f, v in zip(PRICE_FIELDS, rec[4:8])}
+        out["liquidity_score"] = rec[8]
+        return out
+
+    def variants(self) -> t.Iterator[VariantKey]:
+        prev = None
+        for i in range(self.count):
+            rec = self._record(i)
+            raw = self._str(rec[0], rec[1])
+            if raw != prev:
+                prev = raw
+                yield decode_variant(raw)
+
+    def lookup(self, key: VariantKey) -> t.Optional[dict]:
+        # Primeiro registro da variante (lower bound)
+        target = encode_variant(key)
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            rec = self._record(mid)
+            if self._str(rec[0], rec[1]) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.count:
+            rec = self._record(lo)
+            if self._str(rec[0], rec[1]) == target:
+                return self.fields(rec)
+        return None
+
+    def lookup_item_key(self, item_key: str) -> t.Optional[dict]:
+        target = item_key.encode("utf-8")
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            rec = self._record(INDEX.unpack_from(self.mm, self._index + mid * INDEX.size)[0])
+            k = self._str(rec[2], rec[3])
+            if k < target:
+                lo = mid + 1
+            elif k > target:
+                hi = mid
+            else:
+                return self.fields(rec)
+        return None
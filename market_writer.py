@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Writer compartilhado de upserts no market_data (PostgREST).
+
+- Uma requests.Session com pool keep-alive por processo, reaproveitada por
+  todas as fontes e runs.
+- Até SUPABASE_WRITE_CONCURRENCY lotes em voo; submit() bloqueia o parser
+  quando todos os slots estão ocupados (backpressure). O pool da Session cresce
+  com a soma dos lotes em voo de todos os writers abertos.
+- Lotes que repetem um item_key ainda em voo esperam o lote anterior: o último
+  valor emitido pelo parser é o que fica no banco.
+- Lotes que falham são reenviados com backoff + jitter. O upsert com
+  on_conflict=item_key é idempotente, então reenviar um lote é seguro.
+"""
+
+import os
+import time
+import random
+import threading
+import typing as t
+from concurrent.futures import ThreadPoolExecutor, Future
+
+import requests
+from requests.adapters import HTTPAdapter
+
+_session: t.Optional[requests.Session] = None
+_pool_maxsize = 0
+_pool_demand = 0
+_client = None
+_lock = threading.Lock()
+
+
+def _supabase_env() -> t.Tuple[str, str]:
+    url = os.environ.get("SUPABASE_URL")
+    key = os.environ.get("SUPABASE_SERVICE_ROLE") or os.environ.get("SUPABASE_ANON_KEY")
+    if not url or not key:
+        raise RuntimeError("SUPABASE_URL/SUPABASE_SERVICE_ROLE não configurados no ambiente")
+    return url.rstrip("/"), key
+
+
+def get_shared_client():
+    """Cliente supabase-py único por processo (rpc/delete do scheduler)."""
+    global _client
+    with _lock:
+        if _client is None:
+            from supabase import create_client
+            url, key = _supabase_env()
+            _client = create_client(url, key)
+        return _client
+
+
+def get_session(pool_size: int = 8) -> requests.Session:
+    """Session HTTP persistente com pool de conexões, compartilhada entre writers.
+
+    Se um chamador pede mais conexões que o pool atual, o adapter é trocado por
+    um maior (requisições em andamento terminam no antigo).
+    """
+    global _session, _pool_maxsize
+    with _lock:
+        if _session is None:
+            _session = requests.Session()
+        size = max(pool_size, 2)
+        if size > _pool_maxsize:
+            adapter = HTTPAdapter(pool_connections=2, pool_maxsize=size, max_retries=0)
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+            _pool_maxsize = size
+        return _session
+
+
+def _reserve_connections(n: int) -> requests.Session:
+    """Soma n à demanda de conexões dos writers abertos e dimensiona o pool para ela."""
+    global _pool_demand
+    with _lock:
+        _pool_demand += n
+        demand = _pool_demand
+    return get_session(demand)
+
+
+def _release_connections(n: int) -> None:
+    global _pool_demand
+    with _lock:
+        _pool_demand = max(0, _pool_demand - n)
+
+
+def chunked(iterable, size: int):
+    buf = []
+    for x in iterable:
+        buf.append(x)
+        if len(buf) >= size:
+            yield buf
+            buf = []
+    if buf:
+        yield buf
+
+
+class MarketWriter:
+    """Upserts em lotes pipelined. Use como context manager ou chame flush()/close()."""
+
+    def __init__(self, table: str = None, batch_size: int = None, concurrency: int = None,
+                 retries: int = None, on_conflict: str = "item_key", timeout: float = 60.0):
+        self.table = table or os.environ.get("SUPABASE_MARKET_TABLE", "market_data")
+        self.batch_size = batch_size or int(os.environ.get("SUPABASE_UPSERT_BATCH", "500"))
+        self.concurrency = concurrency or int(os.environ.get("SUPABASE_WRITE_CONCURRENCY", "4"))
+        self.retries = retries if retries is not None else int(os.environ.get("SUPABASE_WRITE_RETRIES", "3"))
+        self.timeout = timeout
+        self.on_conflict = on_conflict
+
+        base_url, key = _supabase_env()
+        self.url = f"{base_url}/rest/v1/{self.table}?on_conflict={on_conflict}"
+        self.headers = {
+            "apikey": key,
+            "Authorization": f"Bearer {key}",
+            "Content-Type": "application/json",
+            "Prefer": "resolution=merge-duplicates,return=minimal",
+        }
+        self.session = _reserve_connections(self.concurrency)
+        self._released = False
+        self._slots = threading.BoundedSemaphore(self.concurrency)
+        self._pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="market-writer")
+        self._futures: t.List[Future] = []
+        # item_key -> lote em voo que o contém (ordem entre lotes com a mesma chave)
+        self._inflight: t.Dict[str, Future] = {}
+        self.failed_batches: t.List[t.List[dict]] = []
+        self.rows_written = 0
+        self.batches_sent = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def write_rows(self, rows: t.Iterable[dict]) -> None:
+        for batch in chunked(rows, self.batch_size):
+            self.submit(batch)
+
+    def submit(self, batch: t.List[dict]) -> None:
+        keys = [k for k in (row.get(self.on_conflict) for row in batch) if k is not None]
+        # Chave repetida de um lote anterior ainda em voo: espera ele terminar para
+        # que o upsert mais recente não seja sobrescrito pelo antigo
+        for dep in {self._inflight[k] for k in keys if k in self._inflight}:
+            dep.result()
+        # Backpressure: com N lotes em voo, o parser espera aqui
+        self._slots.acquire()
+        try:
+            fut = self._pool.submit(self._send, list(batch))
+        except Exception:
+            self._slots.release()
+            raise
+        fut.add_done_callback(lambda _f: self._slots.release())
+        self._futures.append(fut)
+        for k in keys:
+            self._inflight[k] = fut
+        if len(self._futures) > self.concurrency * 4:
+            self._futures = [f for f in self._futures if not f.done()]
+            self._inflight = {k: f for k, f in self._inflight.items() if not f.done()}
+
+    def _send(self, batch: t.List[dict]) -> None:
+        attempt = 0
+        while True:
+            try:
+                r = self.session.post(self.url, json=batch, headers=self.headers, timeout=self.timeout)
+            except requests.exceptions.RequestException as e:
+                error = e
+            else:
+                if r.status_code < 400:
+                    with _lock:
+                        self.rows_written += len(batch)
+                        self.batches_sent += 1
+                    return
+                if r.status_code < 500 and r.status_code != 429:
+                    # 4xx (schema, on_conflict, payload): repetir não muda a resposta
+                    print(f"[writer] Lote de {len(batch)} linhas rejeitado ({r.status_code}: {r.text[:200]}); sem nova tentativa")
+                    with _lock:
+                        self.failed_batches.append(batch)
+                    return
+                error = requests.exceptions.HTTPError(f"{r.status_code}: {r.text[:200]}")
+            attempt += 1
+            if attempt > self.retries:
+                print(f"[writer] Lote de {len(batch)} linhas falhou após {attempt} tentativas: {error}")
+                with _lock:
+                    self.failed_batches.append(batch)
+                return
+            delay = min(30.0, 0.5 * (2 ** (attempt - 1))) * (0.5 + random.random())
+            print(f"[writer] Erro no lote ({error}); nova tentativa {attempt}/{self.retries} em {delay:.1f}s")
+            time.sleep(delay)
+
+    def flush(self) -> t.List[t.List[dict]]:
+        """Espera todos os lotes em voo. Retorna os lotes que falharam definitivamente."""
+        futures, self._futures = self._futures, []
+        for f in futures:
+            f.result()
+        self._inflight = {}
+        return list(self.failed_batches)
+
+    def close(self) -> t.List[t.List[dict]]:
+        try:
+            return self.flush()
+        finally:
+            self._pool.shutdown(wait=True)
+            if not self._released:
+                self._released = True
+                _release_connections(self.concurrency)
+
+
+def open_sink(source: str, table: str = None, batch_size: int = None):
+    """Escolhe o destino dos upserts por SUPABASE_UPSERT_SINK: rest (padrão) ou copy."""
+    kind = os.environ.get("SUPABASE_UPSERT_SINK", "rest").lower()
+    if kind == "copy":
+        import copy_sink
+        return copy_sink.CopySink(source, table)
+    return MarketWriter(table, batch_size)
@@ -18,21 +18,6 @@ def optimize_memory_settings():
     # Configurar garbage collection mais agressivo
     import gc
     gc.set_threshold(700, 10, 10)  # Valores menores = GC mais frequente
-    
-    # Configurar requests para usar menos memória
-    try:
-        import requests
-        # Configurar sessão com pool menor
-        session = requests.Session()
-        adapter = requests.adapters.HTTPAdapter(
-            pool_connections=2,
-            pool_maxsize=5,
-            max_retries=1
-        )
-        session.mount('http://', adapter)
-        session.mount('https://', adapter)
-    except ImportError:
-        pass
 
 def force_cleanup():
     """Força limpeza agressiva de memória"""
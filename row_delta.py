@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Detecção de mudanças para upserts delta no market_data.
+
+Guarda, por fonte, um fingerprint compacto (item_key -> hash das colunas de
+preço/qty) da última ingestão bem-sucedida e deixa passar só as linhas novas
+ou alteradas. Desative com SUPABASE_DELTA_UPSERT=false.
+"""
+
+import os
+import json
+import hashlib
+import typing as t
+
+import source_fetch
+
+# source -> {"changed": n, "skipped": n}
+_run_stats: t.Dict[str, t.Dict[str, int]] = {}
+
+
+def delta_enabled() -> bool:
+    return os.environ.get("SUPABASE_DELTA_UPSERT", "true").lower() in ("1", "true", "yes")
+
+
+def _path(source: str) -> str:
+    return os.path.join(source_fetch.CACHE_DIR, f"{source}.fingerprints.json")
+
+
+def row_fingerprint(row: dict, columns: t.Sequence[str]) -> str:
+    raw = repr(tuple(row.get(c) for c in columns)).encode("utf-8")
+    return hashlib.blake2b(raw, digest_size=8).hexdigest()
+
+
+class RowFingerprints:
+    def __init__(self, source: str, columns: t.Sequence[str]):
+        self.source = source
+        self.columns = list(columns)
+        self.enabled = delta_enabled()
+        self.prev: t.Dict[str, str] = self._load() if self.enabled else {}
+        self.seen: t.Dict[str, str] = {}
+        self.changed = 0
+        self.skipped = 0
+
+    def _load(self) -> t.Dict[str, str]:
+        try:
+            with open(_path(self.source), "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        # Colunas diferentes = fingerprints incomparáveis, reenvia tudo
+        if data.get("columns") != self.columns:
+            return {}
+        return data.get("fingerprints") or {}
+
+    def filter(self, rows: t.Iterable[dict]) -> t.List[dict]:
+        """Retorna apenas as linhas novas ou com preço/qty alterado."""
+        out = []
+        for row in rows:
+            key = row["item_key"]
+            fp = row_fingerprint(row, self.columns)
+            self.seen[key] = fp
+            if self.enabled and self.prev.get(key) == fp:
+                self.skipped += 1
+                continue
+            self.changed += 1
+            out.append(row)
+        _run_stats[self.source] = {"changed": self.changed, "skipped": self.skipped}
+        return out
+
+    def forget(self, rows: t.Iterable[dict]) -> None:
+        """Descarta fingerprints de linhas cujo upsert falhou (reenvia no próximo run)."""
+        for row in rows:
+            self.seen.pop(row["item_key"], None)
+            self.prev.pop(row["item_key"], None)
+
+    def commit(self) -> None:
+        """Persiste os fingerprints após o upsert ter sido aceito pelo Supabase."""
+        if not self.enabled:
+            return
+        merged = {**self.prev, **self.seen}
+        try:
+            os.makedirs(source_fetch.CACHE_DIR, exist_ok=True)
+            path = _path(self.source)
+            tmp = path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"columns": self.columns, "fingerprints": merged}, f, separators=(",", ":"))
+            os.replace(tmp, path)
+        except Exception as e:
+            print(f"[{self.source}] Falha ao gravar fingerprints: {e}")
+
+
+def reset(sources: t.Iterable[str]) -> None:
+    """Esquece os fingerprints (ex.: após limpar a tabela com --clean)."""
+    for source in sources:
+        try:
+            os.remove(_path(source))
+        except OSError:
+            pass
+
+
+def run_summary() -> str:
+    if not _run_stats:
+        return "delta: n/a"
+    parts = [f"{s}={v['changed']} changed/{v['skipped']} skipped" for s, v in sorted(_run_stats.items())]
+    return "delta: " + ", ".join(parts)
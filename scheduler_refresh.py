@@ -4,6 +4,7 @@
 import os
 import time
 import argparse
+import threading
 from datetime import datetime
 
 from dotenv import load_dotenv
@@ -16,35 +17,126 @@ SUPABASE_URL = os.environ.get("SUPABASE_URL")
 SUPABASE_KEY = os.environ.get("SUPABASE_SERVICE_ROLE") or os.environ.get("SUPABASE_ANON_KEY")
 MARKET_TABLE = os.environ.get("SUPABASE_MARKET_TABLE", "market_data")
 INTERVAL_SECONDS = int(os.environ.get("REFRESH_INTERVAL_SECONDS", str(3 * 60 * 60)))  # 3h default
+CONCURRENT_SOURCES = os.environ.get("REFRESH_CONCURRENT", "false").lower() in ("1", "true", "yes")
+SOURCE_BUDGET_SECONDS = int(os.environ.get("SOURCE_BUDGET_SECONDS", str(20 * 60)))  # por fonte, modo paralelo
 
 os.environ.setdefault("HTTPX_DISABLE_HTTP2", "1")
 
 def get_sb():
-    from supabase import create_client
-    if not SUPABASE_URL or not SUPABASE_KEY:
-        raise RuntimeError("SUPABASE_URL/SUPABASE_SERVICE_ROLE não configurados no .env")
-    return create_client(SUPABASE_URL, SUPABASE_KEY)
+    # Mesmo cliente usado pelos fetchers (um por processo)
+    import market_writer
+    return market_writer.get_shared_client()
 
 
 def clean_market_table(sb):
     print("[clean] Apagando dados antigos de", MARKET_TABLE)
     # Remoção ampla – evita WHERE vazio proibido
     sb.table(MARKET_TABLE).delete().neq("item_key", "__never__").execute()
+    # Tabela vazia: fingerprints do upsert delta e validadores do GET condicional não valem mais
+    # (um 304 deixaria a tabela vazia e a geração seria publicada assim mesmo)
+    import row_delta
+    import source_fetch
+    sources = ["whitemarket", "csfloat", "buff163"]
+    row_delta.reset(sources)
+    source_fetch.reset_validators(sources)
 
 
-def refresh_sources():
+def _source_budget(name: str) -> int:
+    # Orçamento por fonte: SOURCE_BUDGET_<FONTE> sobrepõe SOURCE_BUDGET_SECONDS
+    return int(os.environ.get(f"SOURCE_BUDGET_{name.upper()}", str(SOURCE_BUDGET_SECONDS)))
+
+
+# Thread de ingestão por fonte (modo paralelo). Uma fonte que estourou o orçamento
+# continua gravando em background: não é relançada enquanto viva.
+_source_threads: dict = {}
+# Resultado das fontes que estouraram o orçamento (preenchido quando a thread termina)
+_late_results: dict = {}
+
+
+def sources_running() -> list:
+    return [name for name, th in _source_threads.items() if th.is_alive()]
+
+
+def _collect_late_results() -> int:
+    """Linhas das fontes que estouraram o orçamento e já terminaram."""
+    rows = 0
+    for name in [n for n in _late_results if n not in sources_running()]:
+        # Terminou depois do orçamento: linhas gravadas entram neste ciclo
+        r = _late_results.pop(name).get(name, {"status": "error", "rows": 0})
+        print(f"[run] {name} (fora do orçamento): {r['status']} rows={r['rows']}")
+        rows += r["rows"]
+    return rows
+
+
+def wait_for_sources() -> int:
+    """Espera as fontes ainda em execução (threads daemon morreriam com o processo
+    no --once) e retorna as linhas que gravaram."""
+    for name in sources_running():
+        print(f"[run] Aguardando {name} terminar...")
+        _source_threads[name].join()
+    return _collect_late_results()
+
+
+def _run_source(name: str, fn, results: dict) -> None:
+    t0 = time.monotonic()
+    try:
+        results[name] = {"status": "ok", "rows": int(fn() or 0)}
+    except Exception as e:
+        print(f"[run] {name} falhou: {e}")
+        results[name] = {"status": "error", "rows": 0, "error": str(e)}
+    results[name]["seconds"] = time.monotonic() - t0
+
+
+def refresh_sources(concurrent: bool = None):
     # Import on demand para evitar custos quando scheduler inicia
     import whitemarket_fetcher as wm
     import csfloat_fetcher as cf
     import buff163_fetcher as bf
 
-    total = 0
-    print("[run] Whitemarket...")
-    total += wm.run_whitemarket_ingest()
-    print("[run] CSFloat...")
-    total += cf.run_csfloat_ingest()
-    print("[run] Buff163...")
-    total += bf.run_buff163_ingest()
+    if concurrent is None:
+        concurrent = CONCURRENT_SOURCES
+    jobs = [
+        ("whitemarket", wm.run_whitemarket_ingest),
+        ("csfloat", cf.run_csfloat_ingest),
+        ("buff163", bf.run_buff163_ingest),
+    ]
+
+    results: dict = {}
+    timed_out: dict = {}
+    late_rows = _collect_late_results()
+    if not concurrent:
+        for name, fn in jobs:
+            print(f"[run] {name}...")
+            _run_source(name, fn, results)
+    else:
+        # Uma thread daemon por fonte: falha isolada e orçamento de tempo próprio.
+        # Fonte que estoura o orçamento é reportada como timeout e segue até terminar;
+        # uma segunda execução da mesma fonte disputaria o stream pendente do source_fetch.
+        print(f"[run] Fontes em paralelo: {', '.join(n for n, _ in jobs)}")
+        started = time.monotonic()
+        threads = []
+        for name, fn in jobs:
+            if name in sources_running():
+                print(f"[run] {name} ainda em execução desde o ciclo anterior; não relançada")
+                results[name] = {"status": "busy", "rows": 0, "seconds": 0.0}
+                continue
+            th = threading.Thread(target=_run_source, args=(name, fn, results), name=f"ingest-{name}", daemon=True)
+            th.start()
+            _source_threads[name] = th
+            threads.append((name, th))
+        for name, th in threads:
+            th.join(max(0.0, started + _source_budget(name) - time.monotonic()))
+            if th.is_alive():
+                print(f"[run] {name} excedeu orçamento de {_source_budget(name)}s")
+                # A thread ainda grava o resultado final em `results`: contabilizado no próximo ciclo
+                _late_results[name] = results
+                timed_out[name] = {"status": "timeout", "rows": 0, "seconds": time.monotonic() - started}
+
+    total = late_rows
+    for name, _ in jobs:
+        r = timed_out.get(name) or results.get(name, {"status": "error", "rows": 0, "seconds": 0.0})
+        total += r["rows"]
+        print(f"[run] {name}: {r['status']} rows={r['rows']} {r['seconds']:.1f}s")
     print(f"[run] Total upserts: {total}")
     return total
 
@@ -58,11 +150,66 @@ def refresh_liquidity(sb):
     print("[liquidity] OK")
 
 
+def refresh_spreads(sb):
+    # Spreads entre fontes (007_market_spreads.sql); depende do liquidity_score recém-atualizado
+    try:
+        res = sb.rpc("refresh_market_spreads_mv").execute()
+        if getattr(res, "error", None):
+            raise RuntimeError(res.error)
+        print("[spreads] OK")
+    except Exception as e:
+        print(f"[spreads] Falha ao atualizar market_spreads_mv: {e}")
+
+
+def publish_generation(sb):
+    # Sinaliza ao backend web que os dados mudaram (invalida caches de lookup)
+    try:
+        res = sb.rpc("bump_market_generation").execute()
+        generation = getattr(res, "data", None)
+        print(f"[generation] market_generation={generation}")
+        return int(generation) if generation is not None else None
+    except Exception as e:
+        print(f"[generation] Falha ao publicar geração: {e}")
+        return None
+
+
+def export_snapshot(sb, generation):
+    # Snapshot binário para os workers web mapearem (mesmo host/volume)
+    path = os.environ.get("MARKET_SNAPSHOT_FILE")
+    if not path:
+        return
+    import market_snapshot
+    import market_snapshot_file
+    view = os.environ.get("SUPABASE_MARKET_LOOKUP_VIEW", "market_lookup")
+    page = market_snapshot.SNAPSHOT_PAGE_SIZE
+    try:
+        rows, offset = [], 0
+        while True:
+            res = sb.table(view).select(
+                "item_key,name_base,stattrak,souvenir,condition,price_whitemarket,price_csfloat,"
+                "price_buff163,highest_offer_buff163,liquidity_score"
+            ).order("item_key").range(offset, offset + page - 1).execute()
+            data = res.data or []
+            if not data:
+                break
+            rows.extend(data)
+            # max-rows do PostgREST pode ser menor que a página: só página vazia encerra
+            offset += len(data)
+        n = market_snapshot_file.write_snapshot(path, rows, generation)
+        print(f"[snapshot] {n} variantes gravadas em {path} (geração {generation})")
+    except Exception as e:
+        print(f"[snapshot] Falha ao exportar snapshot: {e}")
+
+
 def main():
     parser = argparse.ArgumentParser(description="Scheduler de coleta e liquidez (3h loop)")
     parser.add_argument("--once", action="store_true", help="Executa apenas uma vez e sai")
     parser.add_argument("--clean", action="store_true", help="Limpa a tabela unificada antes de recarregar")
+    parser.add_argument("--concurrent", action="store_true", help="Ingere as fontes em paralelo (orçamento de tempo por fonte)")
+    parser.add_argument("--replay", action="store_true", help="Re-ingere a cópia local dos dumps (sem download)")
     args = parser.parse_args()
+    if args.replay:
+        os.environ["SOURCE_REPLAY"] = "1"
 
     while True:
         start = datetime.utcnow().isoformat()
@@ -70,9 +217,23 @@ def main():
         sb = get_sb()
         if args.clean:
             clean_market_table(sb)
-        total = refresh_sources()
+        total = refresh_sources(concurrent=args.concurrent or CONCURRENT_SOURCES)
+        if args.once:
+            # Sem próximo ciclo: a geração só sai com todas as fontes gravadas
+            total += wait_for_sources()
         refresh_liquidity(sb)
-        print(f"===== DONE (rows touched: {total}) =====\n")
+        refresh_spreads(sb)
+        running = sources_running()
+        if running:
+            # Geração só com todas as fontes paradas: senão caches e snapshot marcam dados ainda mudando
+            print(f"[generation] {', '.join(running)} ainda gravando; geração não publicada")
+        elif total or args.clean:
+            export_snapshot(sb, publish_generation(sb))
+        else:
+            # Nada mudou (falhas, 304, deltas vazios): nova geração só invalidaria caches e ETags dos clientes
+            print("[generation] Nenhuma linha alterada; geração mantida")
+        import row_delta
+        print(f"===== DONE (rows touched: {total}; {row_delta.run_summary()}) =====\n")
 
         if args.once:
             break
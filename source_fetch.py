@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Camada compartilhada de download das fontes (WhiteMarket, CSFloat, Buff163).
+
+- GET condicional com ETag/Last-Modified salvos da última ingestão bem-sucedida;
+  um 304 levanta SourceNotModified e a fonte é pulada (sem parse nem upsert).
+- Cópia gzip do dump gravada em disco enquanto o stream é consumido, usada
+  para re-ingestão com SOURCE_REPLAY=1 (sem tráfego de rede).
+"""
+
+import os
+import io
+import gzip
+import json
+import time
+import typing as t
+from datetime import datetime, timezone
+
+import requests
+
+CACHE_DIR = os.environ.get("SOURCE_CACHE_DIR", os.path.join(os.path.dirname(__file__), ".source_cache"))
+# Taxa típica de compressão de JSON de preços (estimativa de tamanho descomprimido)
+GZIP_RATIO_ESTIMATE = 8
+
+
+def _env_flag(name: str, default: str) -> bool:
+    return os.environ.get(name, default).lower() in ("1", "true", "yes")
+
+
+class SourceNotModified(Exception):
+    """Upstream respondeu 304: o dump não mudou desde a última ingestão."""
+
+
+class PrependStream:
+    def __init__(self, head: bytes, base):
+        self.buf = io.BytesIO(head)
+        self.base = base
+
+    def read(self, n: int = -1):
+        b = self.buf.read(n)
+        if n == -1:
+            return b + self.base.read()
+        if len(b) == n:
+            return b
+        rest = self.base.read(n - len(b))
+        return b + rest
+
+
+class TeeStream:
+    """Repassa os bytes lidos e grava uma cópia gzip do dump em `path`."""
+
+    def __init__(self, base, path: str):
+        self.base = base
+        self.path = path
+        self.out = gzip.open(path, "wb", compresslevel=6)
+        self.complete = False
+
+    def read(self, n: int = -1):
+        b = self.base.read(n)
+        if b:
+            self.out.write(b)
+        elif n != 0:
+            self.finish()
+        return b
+
+    def drain(self, chunk: int = 1024 * 1024):
+        # Parsers podem parar antes do EOF; completa a cópia em disco
+        while not self.complete:
+            self.read(chunk)
+
+    def finish(self):
+        if not self.complete:
+            self.out.close()
+            self.complete = True
+
+    def abort(self):
+        try:
+            self.out.close()
+        finally:
+            self.complete = True
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+
+# source -> (TeeStream, meta) aguardando commit após upsert bem-sucedido
+_pending: t.Dict[str, t.Tuple[TeeStream, dict]] = {}
+
+
+def _paths(source: str) -> t.Tuple[str, str]:
+    return (
+        os.path.join(CACHE_DIR, f"{source}.json.gz"),
+        os.path.join(CACHE_DIR, f"{source}.meta.json"),
+    )
+
+
+def load_meta(source: str) -> dict:
+    _, meta_path = _paths(source)
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def reset_validators(sources: t.Iterable[str]) -> None:
+    """Esquece ETag/Last-Modified: o próximo fetch é incondicional (ex.: após limpar a tabela)."""
+    for source in sources:
+        _, meta_path = _paths(source)
+        try:
+            os.remove(meta_path)
+        except FileNotFoundError:
+            pass
+
+
+def replay_enabled() -> bool:
+    return _env_flag("SOURCE_REPLAY", "false")
+
+
+def open_cached_stream(source: str):
+    """Abre a cópia local do último dump (descomprimida on-the-fly)."""
+    data_path, _ = _paths(source)
+    if not os.path.exists(data_path):
+        raise FileNotFoundError(f"[{source}] sem cópia em cache para replay: {data_path}")
+    print(f"[{source}] Replay do cache local {data_path}")
+    stream = gzip.open(data_path, "rb")
+    stream.size_hint = _gzip_size(data_path)
+    return stream
+
+
+def _gzip_size(path: str) -> t.Optional[int]:
+    # ISIZE do trailer gzip: tamanho descomprimido (mod 2^32)
+    try:
+        with open(path, "rb") as f:
+            f.seek(-4, os.SEEK_END)
+            return int.from_bytes(f.read(4), "little")
+    except OSError:
+        return None
+
+
+def _size_hint(resp, gzipped_body: bool) -> t.Optional[int]:
+    """Estimativa do tamanho descomprimido do dump (para json_backend escolher o parser)."""
+    try:
+        length = int(resp.headers.get("Content-Length"))
+    except (TypeError, ValueError):
+        return None
+    if gzipped_body or resp.headers.get("Content-Encoding"):
+        return length * GZIP_RATIO_ESTIMATE
+    return length
+
+
+def _conditional_headers(source: str, url: str) -> t.Dict[str, str]:
+    if not _env_flag("SOURCE_CONDITIONAL_GET", "true"):
+        return {}
+    meta = load_meta(source)
+    data_path, _ = _paths(source)
+    if meta.get("url") != url or not os.path.exists(data_path):
+        return {}
+    headers = {}
+    if meta.get("etag"):
+        headers["If-None-Match"] = meta["etag"]
+    if meta.get("last_modified"):
+        headers["If-Modified-Since"] = meta["last_modified"]
+    return headers
+
+
+def open_source_stream(url: str, source: str, headers: t.Optional[t.Dict[str, str]] = None, retry_count: int = 1, timeout: int = 180):
+    """Abre o stream da fonte (GET condicional + tee para o cache em disco).
+
+    Levanta SourceNotModified em 304. Com SOURCE_REPLAY=1 lê a cópia local.
+    """
+    if replay_enabled():
+        return open_cached_stream(source)
+
+    req_headers = {"Accept": "application/json", **(headers or {})}
+    req_headers.update(_conditional_headers(source, url))
+
+    for attempt in range(retry_count):
+        try:
+            if retry_count > 1:
+                print(f"[{source}] Tentativa {attempt + 1}/{retry_count} para {url}")
+            resp = requests.get(url, headers=req_headers, stream=True, timeout=timeout)
+            if resp.status_code == 304:
+                resp.close()
+                print(f"[{source}] 304 Not Modified - dump inalterado, pulando")
+                raise SourceNotModified(source)
+            resp.raise_for_status()
+            resp.raw.decode_content = True
+
+            head = resp.raw.read(4)
+            stream = PrependStream(head, resp.raw)
+            gzipped = head.startswith(b"\x1f\x8b")
+            if gzipped:
+                print(f"[{source}] Arquivo GZIP detectado")
+                stream = gzip.GzipFile(fileobj=stream, mode="rb")
+            stream.size_hint = _size_hint(resp, gzipped)
+
+            if not _env_flag("SOURCE_CACHE", "true"):
+                return stream
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            data_path, _ = _paths(source)
+            tee = TeeStream(stream, data_path + ".part")
+            tee.size_hint = stream.size_hint
+            prev = _pending.pop(source, None)
+            if prev:
+                prev[0].abort()
+            _pending[source] = (tee, {
+                "url": url,
+                "etag": resp.headers.get("ETag"),
+                "last_modified": resp.headers.get("Last-Modified"),
+                "fetched_at": datetime.now(timezone.utc).isoformat(),
+            })
+            return tee
+
+        except SourceNotModified:
+            raise
+        except requests.exceptions.Timeout:
+            print(f"[{source}] Timeout na tentativa {attempt + 1}")
+            if attempt == retry_count - 1:
+                raise
+            time.sleep(10)
+        except Exception as e:
+            print(f"[{source}] Erro na tentativa {attempt + 1}: {e}")
+            if attempt == retry_count - 1:
+                raise
+            time.sleep(5)
+
+    raise RuntimeError(f"Falha após {retry_count} tentativas")
+
+
+def commit_source(source: str) -> None:
+    """Promove a cópia baixada e seus validadores após ingestão bem-sucedida.
+
+    Só depois do commit o próximo run envia If-None-Match/If-Modified-Since,
+    assim uma ingestão que falhou no meio não é pulada por um 304.
+    """
+    entry = _pending.pop(source, None)
+    if not entry:
+        return
+    tee, meta = entry
+    try:
+        tee.drain()
+        data_path, meta_path = _paths(source)
+        os.replace(tee.path, data_path)
+        tmp = meta_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp, meta_path)
+    except Exception as e:
+        print(f"[{source}] Falha ao gravar cache local: {e}")
+        tee.abort()
+
+
+def discard_source(source: str) -> None:
+    """Descarta a cópia parcial de uma ingestão que falhou."""
+    entry = _pending.pop(source, None)
+    if entry:
+        entry[0].abort()
@@ -0,0 +1,24 @@
+-- Geração dos dados de mercado: incrementada pelo scheduler após cada refresh
+-- bem-sucedido; o backend web a consulta para invalidar caches de lookup
+
+create table if not exists public.market_generation (
+  id int primary key default 1 check (id = 1),
+  generation bigint not null default 0,
+  refreshed_at timestamptz not null default now()
+);
+
+insert into public.market_generation (id) values (1) on conflict (id) do nothing;
+
+create or replace function public.bump_market_generation()
+returns bigint
+language sql
+security definer
+as $$
+  update public.market_generation
+     set generation = generation + 1, refreshed_at = now()
+   where id = 1
+  returning generation;
+$$;
+
+revoke all on function public.bump_market_generation() from public;
+grant execute on function public.bump_market_generation() to service_role;
@@ -0,0 +1,21 @@
+-- View de lookup: preços + liquidity_score em uma linha (um round-trip por /market/lookup)
+
+create index if not exists idx_market_data_lookup
+  on public.market_data (name_base, stattrak, souvenir, condition);
+
+create or replace view public.market_lookup as
+select
+  md.item_key,
+  md.name_base,
+  md.stattrak,
+  md.souvenir,
+  md.condition,
+  md.price_whitemarket,
+  md.price_csfloat,
+  md.price_buff163,
+  md.highest_offer_buff163,
+  coalesce(l.liquidity_score, 0) as liquidity_score
+from public.market_data md
+left join public.liquidity l on l.item_key = md.item_key;
+
+grant select on public.market_lookup to service_role;
@@ -0,0 +1,86 @@
+-- Spreads entre fontes pré-calculados por item (GET /market/opportunities)
+-- Comprar: menor ask entre whitemarket/csfloat/buff163.
+-- Vender: maior entre os asks das outras fontes e a maior oferta de compra do buff163.
+-- Atualizada pelo scheduler logo após refresh_liquidity_mv (depende do liquidity_score).
+
+create materialized view if not exists public.market_spreads_mv as
+with asks as (
+  select
+    item_key,
+    name_base,
+    stattrak,
+    souvenir,
+    condition,
+    price_whitemarket,
+    price_csfloat,
+    price_buff163,
+    highest_offer_buff163,
+    liquidity_score,
+    least(price_whitemarket, price_csfloat, price_buff163) as buy_price
+  from public.market_lookup
+),
+buy as (
+  select
+    a.*,
+    case a.buy_price
+      when a.price_whitemarket then 'whitemarket'
+      when a.price_csfloat then 'csfloat'
+      else 'buff163'
+    end as buy_source
+  from asks a
+  where a.buy_price > 0
+)
+select
+  b.item_key,
+  b.name_base,
+  b.stattrak,
+  b.souvenir,
+  b.condition,
+  b.buy_source,
+  b.buy_price,
+  s.sell_source,
+  s.sell_price,
+  (s.sell_price - b.buy_price) as spread,
+  (s.sell_price / b.buy_price) - 1 as spread_ratio,
+  b.liquidity_score,
+  /* Ratio ponderado pela liquidez (0-100): spread alto em item parado rende pouco */
+  ((s.sell_price / b.buy_price) - 1) * b.liquidity_score / 100.0 as weighted_score
+from buy b
+cross join lateral (
+  select v.source as sell_source, v.price as sell_price
+  from (values
+    ('whitemarket', b.price_whitemarket),
+    ('csfloat', b.price_csfloat),
+    ('buff163', b.price_buff163),
+    ('buff163_bid', b.highest_offer_buff163)
+  ) as v(source, price)
+  where v.price is not null
+    and v.source <> b.buy_source
+    /* Comprar e vender no próprio buff163 não é arbitragem */
+    and not (b.buy_source = 'buff163' and v.source = 'buff163_bid')
+  order by v.price desc
+  limit 1
+) s;
+
+-- Unique index: necessário para refresh concurrently
+create unique index if not exists ux_market_spreads_mv_item_key
+  on public.market_spreads_mv (item_key);
+create index if not exists idx_market_spreads_mv_weighted
+  on public.market_spreads_mv (weighted_score desc nulls last);
+create index if not exists idx_market_spreads_mv_ratio
+  on public.market_spreads_mv (spread_ratio desc nulls last);
+create index if not exists idx_market_spreads_mv_spread
+  on public.market_spreads_mv (spread desc nulls last);
+
+grant select on public.market_spreads_mv to service_role;
+
+create or replace function public.refresh_market_spreads_mv()
+returns void
+language sql
+security definer
+as $$
+  refresh materialized view concurrently public.market_spreads_mv;
+$$;
+
+revoke all on function public.refresh_market_spreads_mv() from public;
+grant execute on function public.refresh_market_spreads_mv() to service_role;
@@ -0,0 +1,620 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cliente HTTP compartilhado do backend web para chamadas ao Supabase
+(PostgREST e edge functions).
+
+- Uma requests.Session por processo (keep-alive, pool por host limitado).
+- Timeouts separados de conexão e leitura.
+- Retry com backoff exponencial + jitter apenas em GETs (idempotentes),
+  em erros de conexão/timeout e respostas 429/5xx.
+- Latência por upstream (p50/p99 numa janela das últimas chamadas).
+- SingleFlight: leituras idênticas concorrentes compartilham uma requisição.
+- Circuit breaker por upstream (janela deslizante de erros e chamadas lentas):
+  aberto, falha na hora com CircuitOpenError em vez de esperar o timeout.
+- Hedging opcional em GETs: passado o percentil de latência do upstream, dispara
+  uma segunda requisição e usa a que responder primeiro.
+"""
+
+import os
+import time
+import random
+import weakref
+import threading
+import typing as t
+from collections import deque
+from concurrent import futures
+
+import requests
+from requests.adapters import HTTPAdapter
+
+CONNECT_TIMEOUT = float(os.environ.get("UPSTREAM_CONNECT_TIMEOUT", "3.05"))
+GET_RETRIES = int(os.environ.get("UPSTREAM_GET_RETRIES", "2"))
+RETRY_BASE_SECONDS = float(os.environ.get("UPSTREAM_RETRY_BASE_SECONDS", "0.1"))
+LATENCY_WINDOW = int(os.environ.get("UPSTREAM_LATENCY_WINDOW", "2048"))
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+BREAKER_ENABLED = os.environ.get("UPSTREAM_BREAKER", "true").lower() in ("1", "true", "yes")
+BREAKER_WINDOW_SECONDS = int(os.environ.get("UPSTREAM_BREAKER_WINDOW_SECONDS", "30"))
+BREAKER_MIN_CALLS = int(os.environ.get("UPSTREAM_BREAKER_MIN_CALLS", "20"))
+BREAKER_ERROR_RATE = float(os.environ.get("UPSTREAM_BREAKER_ERROR_RATE", "0.5"))
+BREAKER_SLOW_SECONDS = float(os.environ.get("UPSTREAM_BREAKER_SLOW_SECONDS", "5"))
+BREAKER_SLOW_RATE = float(os.environ.get("UPSTREAM_BREAKER_SLOW_RATE", "0.8"))
+BREAKER_OPEN_SECONDS = float(os.environ.get("UPSTREAM_BREAKER_OPEN_SECONDS", "15"))
+
+HEDGE_ENABLED = os.environ.get("UPSTREAM_HEDGE", "false").lower() in ("1", "true", "yes")
+HEDGE_PERCENTILE = float(os.environ.get("UPSTREAM_HEDGE_PERCENTILE", "95"))
+HEDGE_MIN_SECONDS = float(os.environ.get("UPSTREAM_HEDGE_MIN_MS", "20")) / 1000.0
+HEDGE_MIN_SAMPLES = int(os.environ.get("UPSTREAM_HEDGE_MIN_SAMPLES", "100"))
+# Fração máxima de chamadas com hedge (evita dobrar a carga num upstream já lento)
+HEDGE_BUDGET = float(os.environ.get("UPSTREAM_HEDGE_BUDGET", "0.1"))
+HEDGE_WORKERS = int(os.environ.get("UPSTREAM_HEDGE_WORKERS", "32"))
+
+_lock = threading.Lock()
+_session: t.Optional[requests.Session] = None
+_session_pid: t.Optional[int] = None
+_stats: t.Dict[str, "UpstreamStats"] = {}
+_breakers: t.Dict[str, "CircuitBreaker"] = {}
+_hedge_pool: t.Optional[futures.ThreadPoolExecutor] = None
+_hedge_pool_pid: t.Optional[int] = None
+
+
+class CircuitOpenError(RuntimeError):
+    """Upstream com circuito aberto: a chamada nem foi feita."""
+
+    def __init__(self, upstream: str):
+        super().__init__(f"circuito aberto para {upstream}")
+        self.upstream = upstream
+
+
+def get_session() -> requests.Session:
+    """Session compartilhada (thread-safe para requisições concorrentes via pool do urllib3).
+
+    Recriada após fork (gunicorn --preload): conexões do master não são reaproveitadas nos workers.
+    """
+    global _session, _session_pid
+    with _lock:
+        if _session is None or _session_pid != os.getpid():
+            # Tamanho do pool: UPSTREAM_POOL_CONNECTIONS/UPSTREAM_POOL_MAXSIZE (backend.env.example)
+            s = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=int(os.environ.get("UPSTREAM_POOL_CONNECTIONS", "4")),
+                pool_maxsize=int(os.environ.get("UPSTREAM_POOL_MAXSIZE", "32")),
+                max_retries=0,
+                pool_block=False,
+            )
+            s.mount("http://", adapter)
+            s.mount("https://", adapter)
+            _session = s
+            _session_pid = os.getpid()
+        return _session
+
+
+class UpstreamStats:
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self.lock = threading.Lock()
+        self.samples: t.Deque[float] = deque(maxlen=window)
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self._hedge_delay: t.Optional[float] = None
+        self._hedge_delay_at = 0.0
+
+    def record(self, seconds: float, ok: bool) -> None:
+        with self.lock:
+            self.samples.append(seconds)
+            self.calls += 1
+            if not ok:
+                self.errors += 1
+
+    def hedge_delay(self) -> t.Optional[float]:
+        """Atraso até o hedge (percentil HEDGE_PERCENTILE, recalculado a cada segundo) ou None se fora do orçamento."""
+        now = time.monotonic()
+        with self.lock:
+            if self.hedges >= HEDGE_BUDGET * self.calls:
+                return None
+            if now - self._hedge_delay_at >= 1.0:
+                self._hedge_delay_at = now
+                if len(self.samples) < HEDGE_MIN_SAMPLES:
+                    self._hedge_delay = None
+                else:
+                    samples = sorted(self.samples)
+                    q = samples[min(len(samples) - 1, int(HEDGE_PERCENTILE / 100.0 * (len(samples) - 1)))]
+                    self._hedge_delay = max(HEDGE_MIN_SECONDS, q)
+            return self._hedge_delay
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            samples = sorted(self.samples)
+            calls, errors, retries = self.calls, self.errors, self.retries
+            hedges, hedge_wins = self.hedges, self.hedge_wins
+
+        def pct(p: float) -> t.Optional[float]:
+            if not samples:
+                return None
+            return round(samples[min(len(samples) - 1, int(p * (len(samples) - 1)))] * 1000, 2)
+
+        return {
+            "calls": calls,
+            "errors": errors,
+            "retries": retries,
+            "hedges": hedges,
+            "hedge_wins": hedge_wins,
+            "p50_ms": pct(0.50),
+            "p99_ms": pct(0.99),
+            "window": len(samples),
+        }
+
+
+def stats_for(upstream: str) -> UpstreamStats:
+    with _lock:
+        st = _stats.get(upstream)
+        if st is None:
+            st = _stats[upstream] = UpstreamStats()
+        return st
+
+
+def metrics() -> t.Dict[str, dict]:
+    with _lock:
+        names = list(_stats)
+    return {name: stats_for(name).snapshot() for name in names}
+
+
+class CircuitBreaker:
+    """Circuit breaker com janela deslizante em buckets de 1s.
+
+    closed: abre quando, com ao menos BREAKER_MIN_CALLS na janela, a taxa de erros
+    passa de BREAKER_ERROR_RATE ou a de chamadas lentas de BREAKER_SLOW_RATE.
+    open: rejeita tudo por BREAKER_OPEN_SECONDS. half_open: deixa passar uma
+    sonda por vez; sucesso fecha, falha reabre.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name: str):
+        self.name = name
+        self.lock = threading.Lock()
+        self.state = self.CLOSED
+        self._buckets: t.Deque[list] = deque()  # [segundo, chamadas, erros, lentas]
+        self._opened_at = 0.0
+        self._probing = False
+        self.opens = 0
+        self.rejected = 0
+        self.last_opened: t.Optional[float] = None
+
+    def _open(self) -> None:
+        self.state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._probing = False
+        self._buckets.clear()
+        self.opens += 1
+        self.last_opened = time.time()
+
+    def allow(self) -> bool:
+        if not BREAKER_ENABLED:
+            return True
+        with self.lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                if time.monotonic() - self._opened_at < BREAKER_OPEN_SECONDS:
+                    self.rejected += 1
+                    return False
+                self.state = self.HALF_OPEN
+                self._probing = False
+            if self._probing:
+                self.rejected += 1
+                return False
+            self._probing = True
+            return True
+
+    def abandon(self) -> None:
+        """Chamada interrompida sem resultado (ex.: task cancelada): libera a sonda sem contar erro."""
+        with self.lock:
+            self._probing = False
+
+    def record(self, seconds: float, ok: bool) -> None:
+        if not BREAKER_ENABLED:
+            return
+        slow = seconds >= BREAKER_SLOW_SECONDS
+        now = int(time.monotonic())
+        with self.lock:
+            if self.state == self.HALF_OPEN:
+                if ok and not slow:
+                    self.state = self.CLOSED
+                    self._probing = False
+                else:
+                    self._open()
+                return
+            if self.state == self.OPEN:
+                # Chamadas iniciadas antes de abrir
+                return
+            if self._buckets and self._buckets[-1][0] == now:
+                bucket = self._buckets[-1]
+            else:
+                bucket = [now, 0, 0, 0]
+                self._buckets.append(bucket)
+            bucket[1] += 1
+            bucket[2] += 0 if ok else 1
+            bucket[3] += 1 if slow else 0
+            while self._buckets and self._buckets[0][0] <= now - BREAKER_WINDOW_SECONDS:
+                self._buckets.popleft()
+            calls = sum(b[1] for b in self._buckets)
+            if calls >= BREAKER_MIN_CALLS:
+                errors = sum(b[2] for b in self._buckets)
+                slow_calls = sum(b[3] for b in self._buckets)
+                if errors >= BREAKER_ERROR_RATE * calls or slow_calls >= BREAKER_SLOW_RATE * calls:
+                    self._open()
+
+    def status(self) -> dict:
+        with self.lock:
+            now = int(time.monotonic())
+            window = [b for b in self._buckets if b[0] > now - BREAKER_WINDOW_SECONDS]
+            calls = sum(b[1] for b in window)
+            retry_in = BREAKER_OPEN_SECONDS - (time.monotonic() - self._opened_at) if self.state == self.OPEN else None
+            return {
+                "enabled": BREAKER_ENABLED,
+                "state": self.state,
+                "window_calls": calls,
+                "window_error_rate": round(sum(b[2] for b in window) / calls, 4) if calls else None,
+                "window_slow_rate": round(sum(b[3] for b in window) / calls, 4) if calls else None,
+                "opens": self.opens,
+                "rejected": self.rejected,
+                "last_opened": self.last_opened,
+                "retry_in_seconds": round(max(0.0, retry_in), 1) if retry_in is not None else None,
+            }
+
+
+def breaker_for(upstream: str) -> CircuitBreaker:
+    with _lock:
+        br = _breakers.get(upstream)
+        if br is None:
+            br = _breakers[upstream] = CircuitBreaker(upstream)
+        return br
+
+
+def breaker_states() -> t.Dict[str, dict]:
+    with _lock:
+        names = list(_breakers)
+    return {name: breaker_for(name).status() for name in names}
+
+
+class _Flight:
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error: t.Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Chamadas concorrentes com a mesma chave compartilham uma única execução de fn."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._flights: t.Dict[t.Hashable, _Flight] = {}
+        self.leaders = 0
+        self.coalesced = 0
+        _singleflights[name] = self
+
+    def do(self, key: t.Hashable, fn: t.Callable[[], t.Any]):
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        try:
+            flight.result = fn()
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.event.set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"leaders": self.leaders, "coalesced": self.coalesced, "in_flight": len(self._flights)}
+
+
+class AsyncSingleFlight:
+    """Versão asyncio de SingleFlight (um event loop por processo)."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._flights: t.Dict[t.Hashable, t.Any] = {}
+        self.leaders = 0
+        self.coalesced = 0
+        _singleflights[name] = self
+
+    async def do(self, key: t.Hashable, coro_fn):
+        import asyncio
+
+        task = self._flights.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            # Task própria: cancelar quem chegou primeiro não cancela o voo dos demais
+            task = asyncio.get_running_loop().create_task(coro_fn())
+            self._flights[key] = task
+            task.add_done_callback(lambda f: self._finish(key, f))
+            self.leaders += 1
+        return await asyncio.shield(task)
+
+    def _finish(self, key: t.Hashable, task) -> None:
+        if self._flights.get(key) is task:
+            del self._flights[key]
+        # Todos os chamadores podem ter sido cancelados: evita o aviso de exceção não lida
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> dict:
+        return {"leaders": self.leaders, "coalesced": self.coalesced, "in_flight": len(self._flights)}
+
+
+_singleflights: t.Dict[str, t.Any] = {}
+
+
+def singleflight_metrics() -> t.Dict[str, dict]:
+    return {name: sf.stats() for name, sf in list(_singleflights.items())}
+
+
+def _backoff(attempt: int) -> float:
+    # Full jitter: espalha retries simultâneos de várias threads
+    return random.uniform(0, RETRY_BASE_SECONDS * (2 ** attempt))
+
+
+def _hedge_executor() -> futures.ThreadPoolExecutor:
+    global _hedge_pool, _hedge_pool_pid
+    with _lock:
+        # Threads não sobrevivem ao fork: um pool por processo
+        if _hedge_pool is None or _hedge_pool_pid != os.getpid():
+            _hedge_pool = futures.ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix="upstream-hedge")
+            _hedge_pool_pid = os.getpid()
+        return _hedge_pool
+
+
+def _close_response(fut: futures.Future) -> None:
+    if not fut.cancelled() and fut.exception() is None:
+        fut.result().close()
+
+
+def _hedged_send(st: UpstreamStats, send: t.Callable[[], requests.Response]) -> requests.Response:
+    """Envia; se não houver resposta até o atraso de hedge, dispara uma segunda e usa a primeira boa."""
+    delay = st.hedge_delay()
+    if delay is None:
+        return send()
+    pool = _hedge_executor()
+    primary = pool.submit(send)
+    try:
+        return primary.result(timeout=delay)
+    except futures.TimeoutError:
+        pass
+    with st.lock:
+        st.hedges += 1
+    hedge = pool.submit(send)
+    pending = {primary, hedge}
+    while pending:
+        done, pending = futures.wait(pending, return_when=futures.FIRST_COMPLETED)
+        for fut in done:
+            if fut.exception() is None and fut.result().status_code not in RETRY_STATUS:
+                for other in pending:
+                    other.add_done_callback(_close_response)
+                if fut is hedge:
+                    with st.lock:
+                        st.hedge_wins += 1
+                return fut.result()
+    # As duas falharam: devolve o resultado (ou a exceção) da original
+    hedge.add_done_callback(_close_response)
+    return primary.result()
+
+
+def request(upstream: str, method: str, url: str, timeout: float, retries: t.Optional[int] = None,
+            **kwargs) -> requests.Response:
+    """Requisição pela Session compartilhada, medida em `upstream`.
+
+    GETs são repetidos até `retries` vezes (padrão UPSTREAM_GET_RETRIES); demais
+    métodos não. Levanta a exceção do requests da última tentativa, ou
+    CircuitOpenError se o circuito do upstream estiver aberto.
+    """
+    method = method.upper()
+    if retries is None:
+        retries = GET_RETRIES if method == "GET" else 0
+    st = stats_for(upstream)
+    breaker = breaker_for(upstream)
+    session = get_session()
+
+    def send() -> requests.Response:
+        return session.request(method, url, timeout=(CONNECT_TIMEOUT, timeout), **kwargs)
+
+    attempt = 0
+    while True:
+        if not breaker.allow():
+            raise CircuitOpenError(upstream)
+        t0 = time.perf_counter()
+        try:
+            resp = _hedged_send(st, send) if HEDGE_ENABLED and method == "GET" else send()
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            elapsed = time.perf_counter() - t0
+            st.record(elapsed, ok=False)
+            breaker.record(elapsed, ok=False)
+            if attempt >= retries:
+                raise
+        except Exception:
+            # ChunkedEncodingError, decode etc.: falha sem retry, mas a sonda do half_open precisa terminar
+            elapsed = time.perf_counter() - t0
+            st.record(elapsed, ok=False)
+            breaker.record(elapsed, ok=False)
+            raise
+        except BaseException:
+            breaker.abandon()
+            raise
+        else:
+            elapsed = time.perf_counter() - t0
+            st.record(elapsed, ok=resp.status_code < 500)
+            breaker.record(elapsed, ok=resp.status_code not in RETRY_STATUS)
+            if resp.status_code not in RETRY_STATUS or attempt >= retries:
+                return resp
+            resp.close()
+        with st.lock:
+            st.retries += 1
+        time.sleep(_backoff(attempt))
+        attempt += 1
+
+
+def get(upstream: str, url: str, timeout: float = 10, **kwargs) -> requests.Response:
+    return request(upstream, "GET", url, timeout, **kwargs)
+
+
+def post(upstream: str, url: str, timeout: float = 30, **kwargs) -> requests.Response:
+    return request(upstream, "POST", url, timeout, **kwargs)
+
+
+# ---------- Cliente assíncrono (modo ASGI) ----------
+
+ASYNC_MAX_CONNECTIONS = int(os.environ.get("UPSTREAM_ASYNC_MAX_CONNECTIONS", "1000"))
+ASYNC_MAX_KEEPALIVE = int(os.environ.get("UPSTREAM_ASYNC_MAX_KEEPALIVE", "100"))
+
+
+class AsyncUpstream:
+    """httpx.AsyncClient compartilhado por event loop, com as mesmas regras de retry e métricas.
+
+    Conexões do httpx ficam presas ao loop que as abriu: um cliente por loop em execução
+    (normalmente um só por worker uvicorn).
+    """
+
+    def __init__(self):
+        self._clients: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+    def client(self):
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            import httpx
+            client = self._clients[loop] = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=ASYNC_MAX_CONNECTIONS,
+                                    max_keepalive_connections=ASYNC_MAX_KEEPALIVE),
+                timeout=httpx.Timeout(30.0, connect=CONNECT_TIMEOUT),
+            )
+        return client
+
+    async def aclose(self) -> None:
+        """Fecha o cliente do loop corrente."""
+        import asyncio
+
+        client = self._clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+    async def request(self, upstream: str, method: str, url: str, timeout: float,
+                      retries: t.Optional[int] = None, **kwargs):
+        import asyncio
+        import httpx
+
+        method = method.upper()
+        if retries is None:
+            retries = GET_RETRIES if method == "GET" else 0
+        st = stats_for(upstream)
+        breaker = breaker_for(upstream)
+        client = self.client()
+
+        def send():
+            return client.request(method, url, timeout=httpx.Timeout(timeout, connect=CONNECT_TIMEOUT), **kwargs)
+
+        attempt = 0
+        while True:
+            if not breaker.allow():
+                raise CircuitOpenError(upstream)
+            t0 = time.perf_counter()
+            try:
+                resp = await (self._hedged_send(st, send) if HEDGE_ENABLED and method == "GET" else send())
+            except (httpx.TransportError, httpx.TimeoutException):
+                elapsed = time.perf_counter() - t0
+                st.record(elapsed, ok=False)
+                breaker.record(elapsed, ok=False)
+                if attempt >= retries:
+                    raise
+            except Exception:
+                elapsed = time.perf_counter() - t0
+                st.record(elapsed, ok=False)
+                breaker.record(elapsed, ok=False)
+                raise
+            except BaseException:
+                # CancelledError (requisição ASGI cancelada): não conta erro, só libera a sonda
+                breaker.abandon()
+                raise
+            else:
+                elapsed = time.perf_counter() - t0
+                st.record(elapsed, ok=resp.status_code < 500)
+                breaker.record(elapsed, ok=resp.status_code not in RETRY_STATUS)
+                if resp.status_code not in RETRY_STATUS or attempt >= retries:
+                    return resp
+                # Devolve a conexão ao pool antes do backoff (como resp.close() no modo síncrono)
+                await resp.aclose()
+            with st.lock:
+                st.retries += 1
+            await asyncio.sleep(_backoff(attempt))
+            attempt += 1
+
+    @staticmethod
+    async def _hedged_send(st: UpstreamStats, send):
+        import asyncio
+
+        delay = st.hedge_delay()
+        primary = asyncio.ensure_future(send())
+        if delay is None:
+            return await primary
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done:
+            return primary.result()
+        with st.lock:
+            st.hedges += 1
+        hedge = asyncio.ensure_future(send())
+        pending = {primary, hedge}
+        winner = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for fut in done:
+                    if fut.exception() is None and fut.result().status_code not in RETRY_STATUS:
+                        if fut is hedge:
+                            with st.lock:
+                                st.hedge_wins += 1
+                        winner = fut
+                        return fut.result()
+            hedge.exception()  # já lida: a original decide o resultado
+            winner = primary
+            return primary.result()
+        finally:
+            for fut in pending:
+                fut.cancel()
+            # Resposta descartada (a outra venceu) devolve a conexão ao pool
+            for fut in (primary, hedge):
+                if fut is not winner and fut.done() and not fut.cancelled() and fut.exception() is None:
+                    await fut.result().aclose()
+
+    async def get(self, upstream: str, url: str, timeout: float = 10, **kwargs):
+        return await self.request(upstream, "GET", url, timeout, **kwargs)
+
+    async def post(self, upstream: str, url: str, timeout: float = 30, **kwargs):
+        return await self.request(upstream, "POST", url, timeout, **kwargs)
+
+
+async_upstream = AsyncUpstream()
@@ -2,14 +2,18 @@
 # -*- coding: utf-8 -*-
 
 import os
-import gzip
-import io
+import re
 import typing as t
 from datetime import datetime, timezone
 
-import requests
 from dotenv import load_dotenv
-import ijson
+
+import json_backend
+import market_writer
+from market_names import parse_name
+import row_delta
+import source_fetch
+from source_fetch import PrependStream
 
 WHITEMARKET_URL = "https://s3.white.market/export/v1/products/730.json"
 # Desabilita HTTP/2 no httpx/postgrest para evitar RemoteProtocolError em lotes grandes
@@ -22,42 +26,8 @@ SUPABASE_KEY = os.environ.get("SUPABASE_SERVICE_ROLE") or os.environ.get("SUPABA
 
 MARKET_TABLE = os.environ.get("SUPABASE_MARKET_TABLE", "market_data")
 UPSERT_BATCH = int(os.environ.get("SUPABASE_UPSERT_BATCH", "500"))
-
-CONDITION_NAMES = [
-    "Factory New",
-    "Minimal Wear",
-    "Field-Tested",
-    "Well-Worn",
-    "Battle-Scarred",
-]
-
-
-def parse_market_hash_name(name: str) -> t.Tuple[str, bool, bool, t.Optional[str]]:
-    if not name:
-        return "", False, False, None
-    s = name
-    stattrak = "StatTrak" in s or "StatTrak™" in s
-    souvenir = "Souvenir" in s
-    condition = None
-    for cond in CONDITION_NAMES:
-        if s.endswith(f"({cond})"):
-            condition = cond
-            s = s[: -(len(cond) + 2)].strip()
-            break
-    base = s.replace("StatTrak™ ", "").replace("StatTrak ", "").replace("Souvenir ", "").strip()
-    return base, stattrak, souvenir, condition
-
-
-def build_item_key(name_base: str, stattrak: bool, souvenir: bool, condition: t.Optional[str], phase: t.Optional[str]) -> str:
-    parts = [
-        name_base or "",
-        ("StatTrak" if stattrak else ""),
-        ("Souvenir" if souvenir else ""),
-        condition or "",
-        phase or "",
-    ]
-    # keep a technical key without special symbols; join with pipe and collapse empties
-    return "|".join([p for p in parts if p != ""]).strip()
+# Colunas comparadas pelo upsert delta (fetched_at fica de fora de propósito)
+DELTA_COLUMNS = ("name_base", "stattrak", "souvenir", "condition", "price_whitemarket", "qty_whitemarket")
 
 
 def build_display_name(name_base: str, stattrak: bool, souvenir: bool, condition: t.Optional[str], phase: t.Optional[str]) -> str:
@@ -78,98 +48,23 @@ def build_display_name(name_base: str, stattrak: bool, souvenir: bool, condition
     return name
 
 
-class PrependStream:
-    def __init__(self, head: bytes, base):
-        self.buf = io.BytesIO(head)
-        self.base = base
-
-    def read(self, n: int = -1):
-        b = self.buf.read(n)
-        if n == -1 or len(b) == n:
-            return b
-        rest = self.base.read(n - len(b))
-        return b + rest
-
-
 def open_source_stream(url: str, retry_count: int = 3):
-    """Open source stream with retry logic for resilience"""
-    import time
-    
-    for attempt in range(retry_count):
-        try:
-            print(f"[whitemarket] Tentativa {attempt + 1}/{retry_count} para {url}")
-            
-            headers = {"Accept": "application/json"}
-            api_token = os.environ.get("WHITEMARKET_API_TOKEN")
-            if api_token:
-                headers["Authorization"] = f"Bearer {api_token}"
-            
-            # Primeiro fazer HEAD request para verificar se a API está respondendo
-            head_resp = requests.head(url, headers=headers, timeout=30)
-            print(f"[whitemarket] HEAD response: {head_resp.status_code}")
-            
-            if head_resp.status_code == 404:
-                print(f"[whitemarket] API endpoint não encontrado: 404")
-                raise requests.exceptions.HTTPError("API endpoint não encontrado")
-            
-            # Fazer o request real
-            resp = requests.get(url, headers=headers, stream=True, timeout=120)  # Timeout maior
-            resp.raise_for_status()
-            resp.raw.decode_content = True
-            
-            # Ler os primeiros bytes para verificar formato
-            head = resp.raw.read(4)
-            base = PrependStream(head, resp.raw)
-            
-            if head.startswith(b"\x1f\x8b"):
-                print(f"[whitemarket] Arquivo GZIP detectado")
-                return gzip.GzipFile(fileobj=base, mode="rb")
-            
-            print(f"[whitemarket] Stream aberto com sucesso")
-            return base
-            
-        except requests.exceptions.Timeout:
-            print(f"[whitemarket] Timeout na tentativa {attempt + 1}")
-            if attempt == retry_count - 1:
-                raise
-            time.sleep(10)  # Aguardar 10s antes de tentar novamente
-            
-        except requests.exceptions.HTTPError as e:
-            print(f"[whitemarket] Erro HTTP na tentativa {attempt + 1}: {e}")
-            if attempt == retry_count - 1:
-                raise
-            time.sleep(5)
-            
-        except Exception as e:
-            print(f"[whitemarket] Erro inesperado na tentativa {attempt + 1}: {e}")
-            if attempt == retry_count - 1:
-                raise
-            time.sleep(5)
-    
-    raise RuntimeError(f"Falha após {retry_count} tentativas")
+    """Open source stream with retry logic (GET condicional + cache local via source_fetch)"""
+    headers = {}
+    api_token = os.environ.get("WHITEMARKET_API_TOKEN")
+    if api_token:
+        headers["Authorization"] = f"Bearer {api_token}"
+    return source_fetch.open_source_stream(url, "whitemarket", headers=headers, retry_count=retry_count, timeout=120)
 
 
 def get_supabase_client():
-    from supabase import create_client
-    if not SUPABASE_URL or not SUPABASE_KEY:
-        raise RuntimeError("SUPABASE_URL/SUPABASE_SERVICE_ROLE não configurados no ambiente")
-    return create_client(SUPABASE_URL, SUPABASE_KEY)
-
+    # Cliente único por processo, compartilhado entre as fontes
+    return market_writer.get_shared_client()
 
-def chunked(iterable, size: int):
-    buf = []
-    for x in iterable:
-        buf.append(x)
-        if len(buf) >= size:
-            yield buf
-            buf = []
-    if buf:
-        yield buf
 
-
-def upsert_market_rows(sb, rows: list[dict]):
-    for batch in chunked(rows, UPSERT_BATCH):
-        sb.table(MARKET_TABLE).upsert(batch, on_conflict="item_key").execute()
+def upsert_market_rows(writer, rows: list[dict]):
+    """Envia as linhas pelo sink configurado (MarketWriter REST ou CopySink)."""
+    writer.write_rows(rows)
 
 
 def insert_price_snapshot(*args, **kwargs):
@@ -177,125 +72,60 @@ def insert_price_snapshot(*args, **kwargs):
     return None
 
 
+# Raízes conhecidas do export (objeto com lista de produtos)
+ROOT_CONTAINER_KEYS = ("products", "data", "items", "result")
+SNIFF_BYTES = 64 * 1024
+
+_CONTAINER_RE = re.compile(rb'"(' + b"|".join(k.encode() for k in ROOT_CONTAINER_KEYS) + rb')"\s*:\s*\[')
+_NDJSON_RE = re.compile(rb"\}\s*\n\s*\{")
+
+
+def sniff_json_layout(head: bytes) -> t.Tuple[str, bool]:
+    """Detecta o layout da raiz a partir dos primeiros bytes.
+
+    Retorna (prefix ijson, multiple_values): array na raiz -> "item";
+    objeto com products/data/items/result -> "<chave>.item"; caso contrário
+    NDJSON (ou objeto único) -> "" com multiple_values.
+    """
+    s = head.lstrip(b" \t\r\n")
+    if s.startswith(b"["):
+        return "item", False
+    if s.startswith(b"{"):
+        if _NDJSON_RE.search(s):
+            return "", True
+        m = _CONTAINER_RE.search(s)
+        if m:
+            return f"{m.group(1).decode()}.item", False
+    return "", True
+
+
 def iter_json_items(stream) -> t.Iterable[dict]:
-    """Yield items from common root layouts: array root (item), products.item, data.item.
-    Falls back to NDJSON (one JSON object per line)."""
-    tried = False
-    # 1) Root array
-    try:
-        for obj in ijson.items(stream, "item"):
-            tried = True
-            if isinstance(obj, dict):
-                yield obj
-        if tried:
-            return
-    except Exception:
-        pass
-
-    # If we got here, reopen and try alternative roots
-    
-def fetch_whitemarket(url: str = WHITEMARKET_URL) -> t.Iterable[dict]:
-    """Fetch WhiteMarket data with enhanced error handling"""
-    import json
-    
-    # Método 1: Carregamento direto (mais confiável para JSON grandes)
-    try:
-        print(f"[whitemarket] Tentando carregamento direto de {url}")
-        
-        headers = {"Accept": "application/json"}
-        api_token = os.environ.get("WHITEMARKET_API_TOKEN")
-        if api_token:
-            headers["Authorization"] = f"Bearer {api_token}"
-        
-        resp = requests.get(url, headers=headers, timeout=180)
-        resp.raise_for_status()
-        
-        print(f"[whitemarket] Response recebido: {len(resp.content)} bytes")
-        
-        # Descomprimir se necessário
-        if resp.content.startswith(b"\x1f\x8b"):
-            content = gzip.decompress(resp.content).decode('utf-8')
-            print(f"[whitemarket] GZIP descomprimido: {len(content)} chars")
-        else:
-            content = resp.text
-            print(f"[whitemarket] Texto direto: {len(content)} chars")
-        
-        if not content.strip():
-            print(f"[whitemarket] ERRO: Conteúdo vazio")
-            raise ValueError("Conteúdo vazio")
-        
-        # Verificar integridade do JSON
-        content = content.strip()
-        if not (content.endswith('}') or content.endswith(']')):
-            print(f"[whitemarket] AVISO: JSON incompleto, últimos chars: {content[-50:]}")
-        
-        data = json.loads(content)
-        print(f"[whitemarket] JSON válido: {type(data).__name__}")
-        
-        # Processar estruturas conhecidas
-        if isinstance(data, list):
-            print(f"[whitemarket] Array direto: {len(data)} itens")
-            for item in data:
-                if isinstance(item, dict):
-                    yield item
-        elif isinstance(data, dict):
-            for key in ['products', 'data', 'items', 'result']:
-                if key in data and isinstance(data[key], list):
-                    print(f"[whitemarket] Array em '{key}': {len(data[key])} itens")
-                    for item in data[key]:
-                        if isinstance(item, dict):
-                            yield item
-                    return
-            
-            if 'market_hash_name' in data:
-                yield data
-        
-        return
-        
-    except (json.JSONDecodeError, ValueError) as e:
-        print(f"[whitemarket] Erro JSON: {e}. Tentando streaming...")
-    except Exception as e:
-        print(f"[whitemarket] Erro direto: {e}. Tentando streaming...")
-    
-    # Método 2: Streaming (fallback)
-    root_paths = [
-        "item",
-        "products.item", 
-        "data.item"
-    ]
-
-    for root in root_paths:
-        try:
-            print(f"[whitemarket] Streaming com root: {root}")
-            stream = open_source_stream(url)
-            got_any = False
-            
-            for obj in ijson.items(stream, root):
-                got_any = True
-                if isinstance(obj, dict):
-                    yield obj
-                    
-            if got_any:
-                print(f"[whitemarket] Sucesso com root: {root}")
-                return
-                
-        except ijson.common.IncompleteJSONError as e:
-            print(f"[whitemarket] JSON incompleto com {root}: {e}")
-            continue
-        except Exception as e:
-            print(f"[whitemarket] Erro streaming {root}: {e}")
-            continue
+    """Itera os produtos em uma única passada sobre o stream.
+
+    Lê só os primeiros SNIFF_BYTES para escolher o layout e alimenta um único
+    iterador (json_backend); o corpo nunca é baixado de novo e só é lido
+    inteiro se for menor que JSON_FAST_PARSE_MAX_BYTES.
+    """
+    head = stream.read(SNIFF_BYTES)
+    if head.startswith(b"\xef\xbb\xbf"):
+        head = head[3:]
+    prefix, multiple = sniff_json_layout(head)
+    print(f"[whitemarket] Layout detectado: prefix='{prefix or '<root>'}' ndjson={multiple}")
+    base = PrependStream(head, stream)
+    size_hint = getattr(stream, "size_hint", None)
+    for obj in json_backend.iter_items(base, prefix, multiple_values=multiple, use_float=True, size_hint=size_hint):
+        if isinstance(obj, dict):
+            yield obj
 
-    # Fallback: NDJSON (one JSON object per line)
+
+def fetch_whitemarket(url: str = WHITEMARKET_URL) -> t.Iterable[dict]:
+    """Streaming de uma passada do export da WhiteMarket (array, products/data/items/result ou NDJSON)"""
     stream = open_source_stream(url)
-    text_stream = io.TextIOWrapper(stream, encoding='utf-8', errors='ignore')
-    for line in text_stream:
-        try:
-            obj = json.loads(line)
-            if isinstance(obj, dict):
-                yield obj
-        except Exception:
-            continue
+    count = 0
+    for obj in iter_json_items(stream):
+        count += 1
+        yield obj
+    print(f"[whitemarket] Stream finalizado: {count} itens")
 
 
 def aggregate_whitemarket(products: t.Iterable[dict]) -> t.Dict[str, dict]:
@@ -340,8 +170,7 @@ def aggregate_whitemarket(products: t.Iterable[dict]) -> t.Dict[str, dict]:
                     break
 
         # normalização do item
-        name_base, stattrak, souvenir, condition = parse_market_hash_name(str(name))
-        item_key = build_item_key(name_base, stattrak, souvenir, condition, None)
+        name_base, stattrak, souvenir, condition, _, item_key = parse_name(str(name))
 
         rec = acc.get(item_key)
         if not rec:
@@ -364,124 +193,142 @@ def aggregate_whitemarket(products: t.Iterable[dict]) -> t.Dict[str, dict]:
     return acc
 
 
+def _rows_from_aggregated(aggregated: t.Dict[str, dict]) -> t.List[dict]:
+    rows = []
+    for _, rec in aggregated.items():
+        rows.append({
+            "item_key": rec["item_key"],
+            "name_base": rec["name_base"],
+            "stattrak": bool(rec["stattrak"]),
+            "souvenir": bool(rec["souvenir"]),
+            "condition": rec["condition"],
+            "price_whitemarket": rec["price_whitemarket"],
+            "qty_whitemarket": int(rec["qty_whitemarket"]),
+            "fetched_at": rec["fetched_at"].isoformat(),
+        })
+    return rows
+
+
+def aggregate_whitemarket_batches(products: t.Iterable[dict], batch_size: int) -> t.Iterator[t.List[dict]]:
+    """Agrega em memória limitada: emite um lote de linhas a cada batch_size itens únicos.
+
+    É o loop de agregação de run_whitemarket_ingest, separado para poder ser
+    medido offline (benchmarks/bench_aggregate.py).
+    """
+    aggregated: t.Dict[str, dict] = {}
+    raw_count = 0
+    for product in products:
+        if not product:
+            continue
+
+        try:
+            # Processar item individual
+            market_hash_name = product.get("market_hash_name", "")
+            price = product.get("price")
+            qty = product.get("qty", 1)
+
+            if not market_hash_name or not isinstance(price, (int, float)):
+                continue
+
+            name_base, stattrak, souvenir, condition, _, item_key = parse_name(market_hash_name)
+            if not name_base:
+                continue
+
+            # Agregar na memória temporária (limitada)
+            if item_key in aggregated:
+                aggregated[item_key]["price_whitemarket"] = min(
+                    aggregated[item_key]["price_whitemarket"], price
+                )
+                aggregated[item_key]["qty_whitemarket"] += qty
+            else:
+                aggregated[item_key] = {
+                    "item_key": item_key,
+                    "name_base": name_base,
+                    "stattrak": stattrak,
+                    "souvenir": souvenir,
+                    "condition": condition,
+                    "price_whitemarket": price,
+                    "qty_whitemarket": qty,
+                    "fetched_at": datetime.now(timezone.utc),
+                }
+
+            raw_count += 1
+        except Exception as e:
+            print(f"[whitemarket] Erro ao processar item: {e}")
+            continue
+
+        # CRÍTICO: Limitar tamanho do dict agregado
+        if len(aggregated) >= batch_size:
+            rows = _rows_from_aggregated(aggregated)
+            aggregated.clear()
+            yield rows
+
+    # Processar itens restantes
+    if aggregated:
+        yield _rows_from_aggregated(aggregated)
+
+
 def run_whitemarket_ingest(url: str = WHITEMARKET_URL) -> int:
     """Executa ingestão otimizada para economia de memória"""
     import gc
     
-    sb = get_supabase_client()
     batch_size = int(os.environ.get('SUPABASE_UPSERT_BATCH', '200'))
     total_processed = 0
+    batches = 0
+    delta = row_delta.RowFingerprints("whitemarket", DELTA_COLUMNS)
+    # Writer compartilhado: lotes pipelined enquanto o parser continua lendo
+    writer = market_writer.open_sink("whitemarket", MARKET_TABLE, batch_size)
     
     print(f"[whitemarket] Iniciando com batch_size={batch_size}")
     
     try:
         # Processar com streaming real para 27k+ itens
         products = fetch_whitemarket(url)
-        aggregated = {}
-        raw_count = 0
-        
-        for product in products:
-            if not product:
-                continue
-                
-            try:
-                # Processar item individual
-                market_hash_name = product.get("market_hash_name", "")
-                price = product.get("price")
-                qty = product.get("qty", 1)
-                
-                if not market_hash_name or not isinstance(price, (int, float)):
-                    continue
-                    
-                name_base, stattrak, souvenir, condition = parse_market_hash_name(market_hash_name)
-                if not name_base:
-                    continue
-                    
-                item_key = build_item_key(name_base, stattrak, souvenir, condition, None)
-                
-                # Agregar na memória temporária (limitada)
-                if item_key in aggregated:
-                    aggregated[item_key]["price_whitemarket"] = min(
-                        aggregated[item_key]["price_whitemarket"], price
-                    )
-                    aggregated[item_key]["qty_whitemarket"] += qty
-                else:
-                    aggregated[item_key] = {
-                        "item_key": item_key,
-                        "name_base": name_base,
-                        "stattrak": stattrak,
-                        "souvenir": souvenir,
-                        "condition": condition,
-                        "price_whitemarket": price,
-                        "qty_whitemarket": qty,
-                        "fetched_at": datetime.now(timezone.utc),
-                    }
-                
-                raw_count += 1
-                
-                # CRÍTICO: Limitar tamanho do dict agregado
-                if len(aggregated) >= batch_size:
-                    rows = []
-                    for _, rec in aggregated.items():
-                        rows.append({
-                            "item_key": rec["item_key"],
-                            "name_base": rec["name_base"],
-                            "stattrak": bool(rec["stattrak"]),
-                            "souvenir": bool(rec["souvenir"]),
-                            "condition": rec["condition"],
-                            "price_whitemarket": rec["price_whitemarket"],
-                            "qty_whitemarket": int(rec["qty_whitemarket"]),
-                            "fetched_at": rec["fetched_at"].isoformat(),
-                        })
-                    
-                    if rows:
-                        upsert_market_rows(sb, rows)
-                        total_processed += len(rows)
-                        print(f"[whitemarket] Batch {total_processed//batch_size}: {len(rows)} itens únicos de {raw_count} processados")
-                    
-                    # Limpar memória agressivamente
-                    aggregated.clear()
-                    rows.clear()
-                    gc.collect()
-                    
-                    # Log de memória a cada batch
-                    if total_processed % (batch_size * 3) == 0:  # A cada 3 batches
-                        try:
-                            import memory_optimizer
-                            memory_optimizer.log_memory_usage(f"WhiteMarket batch {total_processed//batch_size}")
-                            memory_optimizer.memory_limit_check(350)  # Limite mais baixo durante processamento
-                        except:
-                            pass
-                    
-            except Exception as e:
-                print(f"[whitemarket] Erro ao processar item: {e}")
-                continue
         
-        # Processar itens restantes
-        if aggregated:
-            rows = []
-            for _, rec in aggregated.items():
-                rows.append({
-                    "item_key": rec["item_key"],
-                    "name_base": rec["name_base"],
-                    "stattrak": bool(rec["stattrak"]),
-                    "souvenir": bool(rec["souvenir"]),
-                    "condition": rec["condition"],
-                    "price_whitemarket": rec["price_whitemarket"],
-                    "qty_whitemarket": int(rec["qty_whitemarket"]),
-                    "fetched_at": rec["fetched_at"].isoformat(),
-                })
-            
+        for rows in aggregate_whitemarket_batches(products, batch_size):
+            rows = delta.filter(rows)
+            batches += 1
             if rows:
-                upsert_market_rows(sb, rows)
+                upsert_market_rows(writer, rows)
                 total_processed += len(rows)
+            print(f"[whitemarket] Batch {batches}: {len(rows)} alterados")
+            
+            # Limpar memória agressivamente
+            rows.clear()
+            gc.collect()
+            
+            # Log de memória a cada batch
+            if batches % 3 == 0:  # A cada 3 batches
+                try:
+                    import memory_optimizer
+                    memory_optimizer.log_memory_usage(f"WhiteMarket batch {batches}")
+                    memory_optimizer.memory_limit_check(350)  # Limite mais baixo durante processamento
+                except:
+                    pass
         
-        print(f"[whitemarket] Finalizado: {total_processed} itens total")
+        # Lotes que falharam após os retries voltam no próximo run
+        failed = writer.close()
+        for batch in failed:
+            delta.forget(batch)
+            total_processed -= len(batch)
+        delta.commit()
+        if failed:
+            source_fetch.discard_source("whitemarket")
+            print(f"[whitemarket] {len(failed)} lotes falharam no upsert")
+        else:
+            source_fetch.commit_source("whitemarket")
+        print(f"[whitemarket] Finalizado: {total_processed} itens alterados ({delta.skipped} inalterados)")
         return total_processed
         
+    except source_fetch.SourceNotModified:
+        return 0
     except Exception as e:
+        source_fetch.discard_source("whitemarket")
         print(f"[whitemarket] Erro crítico: {e}")
-        return total_processed
+        # Como buff163/csfloat: o scheduler registra a fonte como falha em vez de contar linhas
+        raise
+    finally:
+        writer.close()
 
 
 if __name__ == "__main__":